@@ -23,6 +23,16 @@ parser.add_argument("--test_batch", type=int, default=16, help="Batch size")
 parser.add_argument('--datasets', default=["AiR-D", "OSIE", "COCO-TP", "COCO-TA"], nargs='+', help='used dataset')
 parser.add_argument("--eval_repeat_num", type=int, default=1, help="Repeat number for evaluation")
 parser.add_argument('--tiny', action="store_true", help='use the tiny dataset in debug')
+parser.add_argument('--feature_store', action="store_true", help='load image features from the packed memory-mapped store')
+parser.add_argument('--fixation_table', action="store_true", help='load the scanpaths from the columnar table written by ingest_fixations.py')
+parser.add_argument('--compiled_targets', action="store_true", help='load the training targets precomputed by compile_targets.py')
+parser.add_argument('--sparse_target', action="store_true", help='ship the target scanpath as action indices instead of dense one-hot maps')
+parser.add_argument("--num_workers", type=int, default=4, help="Number of DataLoader worker processes")
+parser.add_argument("--pin_memory", action="store_true", help="Collate the batches into pinned memory")
+parser.add_argument("--persistent_workers", action="store_true", help="Keep the DataLoader workers alive between epochs")
+parser.add_argument("--prefetch_factor", type=int, default=2, help="Number of batches prefetched by each worker")
+parser.add_argument("--sharing_strategy", type=str, default="file_descriptor", choices=["file_descriptor", "file_system"],
+                    help="How DataLoader workers share tensors with the main process")
 parser.add_argument("--seed", type=int, default=0, help="Random seed")
 parser.add_argument("--fp16", action="store_true", help="If passed, will use FP16 training.")
 parser.add_argument(
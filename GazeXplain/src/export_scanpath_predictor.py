@@ -0,0 +1,91 @@
+import torch
+
+import numpy as np
+
+import os
+import argparse
+import json
+import copy
+
+from accelerate import Accelerator
+
+from lib.dataset.dataset import UnifiedScanpath
+from lib.models.models import Transformer
+from lib.models.gazeformer_explanation_alignment import gazeformer
+from lib.models.scanpath_predictor import export_scanpath_predictor
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+parser = argparse.ArgumentParser(description="Scanpath predictor export")
+parser.add_argument('--model_dir', default='./runs/ALL_runX_baseline',
+                    help='run folder with the hparams.json and the checkpoints/ckpt_best of the model')
+parser.add_argument('--export_dir', default=None, help='output folder, <model_dir>/export_<format> by default')
+parser.add_argument('--format', default="torchscript", type=str, choices=["torchscript", "onnx"],
+                    help='TorchScript trace or ONNX graph (requires onnx, and onnxruntime to run it)')
+parser.add_argument('--splits', default=["test"], nargs='*',
+                    help='splits whose task descriptions are tokenized into the export, none to skip the dataset')
+parser.add_argument('--dataset_dir', default="/home/", help='feature folder')
+parser.add_argument('--datasets', default=["AiR-D", "OSIE", "COCO-TP", "COCO-TA"], nargs='+', help='used dataset')
+parser.add_argument('--tiny', action="store_true", help='use the tiny dataset in debug')
+parser.add_argument('--fixation_table', action="store_true", help='load the scanpaths from the columnar table written by ingest_fixations.py')
+parser.add_argument("--attention_backend", default="multihead", type=str, choices=["multihead", "sdpa"],
+                    help="Attention of the scanpath transformer, nn.MultiheadAttention or the fused "
+                         "F.scaled_dot_product_attention with the same parameters")
+parser.add_argument("--seed", type=int, default=0, help="Random seed")
+args = parser.parse_args()
+
+np.random.seed(args.seed)
+torch.manual_seed(args.seed)
+
+
+def main():
+    # the exported graph runs on the CPU
+    accelerator = Accelerator(cpu=True)
+
+    # update the argument
+    opt = copy.deepcopy(args)
+    hparams_file = os.path.join(args.model_dir, "hparams.json")
+    # read hparams
+    with open(hparams_file, "r") as f:
+        hparams = json.load(f)
+    for k, v in hparams.items():
+        if not hasattr(opt, k):
+            accelerator.print('Warning: key %s not in args' % k)
+        setattr(opt, k, v)
+
+    opt.datasets = args.datasets
+    opt.tiny = args.tiny
+    opt.dataset_dir = args.dataset_dir
+    opt.fixation_table = args.fixation_table
+    opt.attention_backend = args.attention_backend
+    # none of the inference caches belongs into the graph
+    opt.encoder_cache_mb = 0
+    opt.task_embedding_cache = False
+
+    task_texts = set()
+    tokenizer = None
+    for split in args.splits:
+        dataset = UnifiedScanpath(split=split, opt=opt)
+        task_texts.update(dataset.task_token_cache.text2row)
+        tokenizer = dataset.roberta_tokenizer
+    if tokenizer is None:
+        from transformers import RobertaTokenizerFast
+        tokenizer = RobertaTokenizerFast.from_pretrained("roberta-base")
+
+    transformer = Transformer(args=opt)
+    model = gazeformer(transformer=transformer, args=opt)
+    model = accelerator.prepare(model)
+
+    model_path = os.path.join(args.model_dir, "checkpoints/ckpt_best")
+    accelerator.print(f"Load from best checkpoint: {model_path}")
+    accelerator.load_state(model_path, strict=False)
+    model = accelerator.unwrap_model(model).eval()
+
+    export_dir = args.export_dir or os.path.join(args.model_dir, "export_{}".format(args.format))
+    graph_path = export_scanpath_predictor(model, opt, tokenizer, export_dir, export_format=args.format,
+                                           task_texts=task_texts)
+    accelerator.print("Exported the scanpath predictor to {} ({} task descriptions)".format(graph_path,
+                                                                                          len(task_texts)))
+
+
+if __name__ == "__main__":
+    main()
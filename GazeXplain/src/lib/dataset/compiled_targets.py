@@ -0,0 +1,124 @@
+import numpy as np
+import scipy.ndimage as filters
+
+
+def sample_key(fixation):
+    return "{}-{}-{}-{}".format(fixation["dataset"], fixation["task"], fixation["name"], fixation["subject"])
+
+
+def build_blur_table(im_h, im_w, blur_sigma):
+    """
+    Row ``k`` is the normalized Gaussian-blurred one-hot map of the ``k``-th cell of the action map,
+    i.e. exactly what the per-fixation blur produces for a fixation on that cell.
+    """
+    table = np.zeros((im_h * im_w, im_h * im_w), dtype=np.float32)
+    for index in range(im_h * im_w):
+        one_hot = np.zeros((im_h, im_w), dtype=np.float32)
+        one_hot[index // im_w, index % im_w] = 1
+        blurred = filters.gaussian_filter(one_hot, blur_sigma)
+        blurred /= blurred.sum()
+        table[index] = blurred.reshape(-1)
+    return table
+
+
+def compute_targets(fixation, opt):
+    """
+    Compact training targets of a single scanpath.
+
+    ``action_index`` is 0 for the termination action and ``1 + y * im_w + x`` for a fixation on cell (y, x).
+    """
+    max_length = opt.max_length
+    downscale_x = fixation["width"] / opt.im_w
+    downscale_y = fixation["height"] / opt.im_h
+
+    length = min(len(fixation["X"]), max_length)
+    pos_x = np.array(fixation["X"][:length]).astype(np.float32)
+    pos_y = np.array(fixation["Y"][:length]).astype(np.float32)
+    duration_raw = np.array(fixation["T"][:length]).astype(np.float32)
+
+    # discretize in double precision like the former per-fixation scalar arithmetic
+    pos_x_discrete = np.clip((pos_x.astype(np.float64) / downscale_x).astype(np.int32), 0, opt.im_w - 1)
+    pos_y_discrete = np.clip((pos_y.astype(np.float64) / downscale_y).astype(np.int32), 0, opt.im_h - 1)
+
+    action_index = np.zeros(max_length, dtype=np.int64)
+    action_index[:length] = 1 + pos_y_discrete * opt.im_w + pos_x_discrete
+
+    duration = np.zeros(max_length, dtype=np.float32)
+    duration[:length] = duration_raw / 1000.0
+    duration_mask = np.zeros(max_length, dtype=np.float32)
+    duration_mask[:length] = 1
+    action_mask = duration_mask.copy()
+    if length <= max_length - 1:
+        action_mask[length] = 1
+
+    explanation_mask = np.zeros(max_length, np.float32)
+    if "explanation" in fixation:
+        explanation_mask[:min(len(fixation["explanation"]), max_length)] = 1
+    explanation_similarity_mask = explanation_mask[:, None] * explanation_mask[None, :]
+
+    return {
+        "action_index": action_index,
+        "duration": duration,
+        "action_mask": action_mask,
+        "duration_mask": duration_mask,
+        "explanation_mask": explanation_mask,
+        "explanation_similarity_mask": explanation_similarity_mask,
+    }
+
+
+def dense_target_scanpath(action_index, num_actions, blur_table=None):
+    # the first element denotes the termination action
+    target_scanpath = np.zeros((action_index.shape[0], num_actions), dtype=np.float32)
+    if blur_table is None:
+        target_scanpath[np.arange(action_index.shape[0]), action_index] = 1
+    else:
+        fixated = action_index > 0
+        target_scanpath[~fixated, 0] = 1
+        target_scanpath[fixated, 1:] = blur_table[action_index[fixated] - 1]
+    return target_scanpath
+
+
+def compile_targets(fixations, opt, save_path):
+    """
+    Precompute the targets of every scanpath of a split and store them in one ``.npz`` file.
+    """
+    targets = [compute_targets(fixation, opt) for fixation in fixations]
+    compiled = {k: np.stack([_[k] for _ in targets]) for k in targets[0].keys()}
+    compiled["action_index"] = compiled["action_index"].astype(np.int32)
+    compiled["keys"] = np.array([sample_key(_) for _ in fixations])
+    compiled["meta"] = np.array([opt.max_length, opt.im_h, opt.im_w], dtype=np.int64)
+    if opt.blur_sigma:
+        compiled["blur_sigma"] = np.array(opt.blur_sigma, dtype=np.float64)
+        compiled["blur_table"] = build_blur_table(opt.im_h, opt.im_w, opt.blur_sigma)
+    np.savez(save_path, **compiled)
+
+
+class CompiledTargets(object):
+    """
+    Targets of a split precomputed by :func:`compile_targets`; samples are plain array slices.
+    """
+
+    def __init__(self, path, fixations, opt):
+        compiled = np.load(path)
+        if compiled["meta"].tolist() != [opt.max_length, opt.im_h, opt.im_w]:
+            raise ValueError("{} was compiled for (max_length, im_h, im_w) = {}, please recompile the dataset"
+                             .format(path, tuple(compiled["meta"].tolist())))
+        if compiled["keys"].tolist() != [sample_key(_) for _ in fixations]:
+            raise ValueError("{} does not match the loaded fixations, please recompile the dataset".format(path))
+
+        self.arrays = {k: compiled[k] for k in ["action_index", "duration", "action_mask", "duration_mask",
+                                                "explanation_mask", "explanation_similarity_mask"]}
+        self.arrays["action_index"] = self.arrays["action_index"].astype(np.int64)
+
+        self.blur_table = None
+        if opt.blur_sigma:
+            if "blur_table" in compiled and float(compiled["blur_sigma"]) == float(opt.blur_sigma):
+                self.blur_table = compiled["blur_table"]
+            else:
+                self.blur_table = build_blur_table(opt.im_h, opt.im_w, opt.blur_sigma)
+
+    def __len__(self):
+        return self.arrays["action_index"].shape[0]
+
+    def __getitem__(self, idx):
+        return {k: v[idx] for k, v in self.arrays.items()}
@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+
+import torch
+import torch.multiprocessing
+from torch.utils.data import DataLoader, Sampler
+from transformers import BatchEncoding
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def set_sharing_strategy(strategy):
+    """
+    Select how DataLoader workers hand tensors to the main process.
+
+    ``file_descriptor`` (the PyTorch default) passes the shared memory as file descriptors, which are
+    released together with the tensors, while ``file_system`` leaves named files in ``/dev/shm`` that
+    are leaked whenever a worker dies. ``file_descriptor`` keeps one descriptor open per shared tensor,
+    so the soft limit of open files is raised to the hard limit.
+    """
+    torch.multiprocessing.set_sharing_strategy(strategy)
+    if strategy == "file_descriptor" and resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class ImageGroupedSampler(Sampler):
+    """
+    Visits the scanpaths of a :class:`UnifiedScanpath` split image by image, so that the scanpaths of the
+    different subjects and tasks of an image end up in the same batches and share one encoding of the image.
+
+    Images come in the order of their first scanpath and the scanpaths of an image keep the dataset order.
+    """
+
+    def __init__(self, dataset):
+        groups = OrderedDict()
+        for idx, fixation in enumerate(dataset.fixations):
+            groups.setdefault(dataset.image_feature_path(fixation), []).append(idx)
+        self.indices = [idx for indices in groups.values() for idx in indices]
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def build_dataloader(dataset, opt, batch_size, shuffle, drop_last=False, sampler=None):
+    """
+    DataLoader of a :class:`UnifiedScanpath` split configured by the input pipeline options.
+    """
+    kwargs = {}
+    if opt.num_workers > 0:
+        set_sharing_strategy(opt.sharing_strategy)
+        kwargs["persistent_workers"] = opt.persistent_workers
+        kwargs["prefetch_factor"] = opt.prefetch_factor
+    return DataLoader(
+        dataset=dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        sampler=sampler,
+        num_workers=opt.num_workers,
+        pin_memory=opt.pin_memory and torch.cuda.is_available(),
+        collate_fn=dataset.collate_func,
+        drop_last=drop_last,
+        **kwargs
+    )
+
+
+def move_to_device(batch, device, non_blocking=False):
+    # tensors of pinned batches are copied asynchronously, lists (strings, fixation info) stay on the host
+    moved = {}
+    for k, v in batch.items():
+        if torch.is_tensor(v):
+            moved[k] = v.to(device, non_blocking=non_blocking)
+        elif isinstance(v, BatchEncoding):
+            moved[k] = BatchEncoding({kk: vv.to(device, non_blocking=non_blocking) for kk, vv in v.items()})
+        else:
+            moved[k] = v
+    return moved
+
+
+class StepTimer(object):
+    """
+    Splits the wall time of a training loop into the time spent waiting for the next batch and the
+    time spent on the step itself.
+
+    Call :meth:`data_ready` right after a batch is fetched and :meth:`step_done` at the end of the step.
+    CUDA kernels run asynchronously, so a step that is still running on the device when the next batch
+    is requested is accounted as data wait of the following step.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.last = time.perf_counter()
+        self.data_time = 0.
+        self.compute_time = 0.
+        self.steps = 0
+
+    def data_ready(self):
+        now = time.perf_counter()
+        self.data_time += now - self.last
+        self.last = now
+
+    def step_done(self):
+        now = time.perf_counter()
+        self.compute_time += now - self.last
+        self.last = now
+        self.steps += 1
+
+    def summary(self):
+        steps = max(self.steps, 1)
+        total = self.data_time + self.compute_time
+        return {
+            "data_time": self.data_time / steps,
+            "compute_time": self.compute_time / steps,
+            "data_wait_ratio": self.data_time / total if total > 0 else 0.,
+        }
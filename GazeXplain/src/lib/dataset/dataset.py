@@ -17,8 +17,10 @@ from accelerate.utils import tqdm
 from transformers import RobertaTokenizer, RobertaModel, AutoTokenizer, BertTokenizer, RobertaTokenizerFast, \
     BertTokenizerFast
 
-import torch.multiprocessing
-torch.multiprocessing.set_sharing_strategy('file_system')
+from lib.dataset.feature_store import PackedFeatureStore
+from lib.dataset.compiled_targets import CompiledTargets, compute_targets, dense_target_scanpath, build_blur_table
+from lib.dataset.token_cache import TokenCache
+from lib.dataset.fixation_table import FixationTable
 
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -46,6 +48,46 @@ class UnifiedScanpath(Dataset):
             "COCO-TP": 0
         }
 
+        if self.opt.fixation_table:
+            fixations, explanation_gts = self.load_fixation_table()
+        else:
+            fixations, explanation_gts = self.load_fixations()
+
+        # keep the scanpaths in arrays rather than Python objects, so that forked DataLoader workers
+        # share them instead of copying them page by page through reference counting
+        if not isinstance(fixations, FixationTable):
+            fixations = FixationTable.from_records(fixations)
+        self.max_gt_label_length = int(fixations.lengths("X").max())
+
+        self.fixations = fixations
+        self.explanation_gts = explanation_gts
+
+        self.roberta_tokenizer = RobertaTokenizerFast.from_pretrained("roberta-base")
+        self.blip_tokenizer = BertTokenizerFast.from_pretrained("Salesforce/blip-image-captioning-base")
+
+        # the task descriptions and explanations are fixed, tokenize them once instead of in every collate_func
+        self.task_token_cache = TokenCache(self.roberta_tokenizer, [_["task_description"] for _ in fixations])
+        # the empty string fills the explanation slots after the end of the scanpath
+        self.explanation_token_cache = TokenCache(
+            self.blip_tokenizer, [""] + [e for _ in fixations for e in _.get("explanation", [])[:self.opt.max_length]],
+            truncation=True, max_length=self.opt.max_explanation_length)
+
+        # packed image feature stores, keyed by the folder of the original .pth files
+        self.feature_stores = {}
+
+        # precomputed targets, see preprocess/COCOSearch18/compile_targets.py
+        self.compiled_targets = None
+        self.blur_table = None
+        if self.opt.compiled_targets:
+            self.compiled_targets = CompiledTargets(self.compiled_targets_path(), self.fixations, self.opt)
+            self.blur_table = self.compiled_targets.blur_table
+        elif self.opt.blur_sigma:
+            self.blur_table = build_blur_table(self.opt.im_h, self.opt.im_w, self.opt.blur_sigma)
+
+    def compiled_targets_path(self):
+        return join(self.opt.dataset_dir, "COCO", "TP", "processed", "compiled_targets_{}.npz".format(self.split))
+
+    def load_fixations(self):
         explanation_gts = {}
 
         # ########## for air dataset ##########
@@ -323,17 +365,21 @@ class UnifiedScanpath(Dataset):
             
         fixations = cocosearch18_TP_fixations
 
-        gt_fixation_length = []
-        for fixation in fixations:
-            gt_fixation_length.append(len(fixation["X"]))
-        self.max_gt_label_length = max(gt_fixation_length)
+        return fixations, explanation_gts
 
-        self.fixations = fixations
-        self.explanation_gts = explanation_gts
-
-        self.roberta_tokenizer = RobertaTokenizerFast.from_pretrained("roberta-base")
-        self.blip_tokenizer = BertTokenizerFast.from_pretrained("Salesforce/blip-image-captioning-base")
+    def fixation_table_path(self):
+        return join(self.opt.dataset_dir, "COCO", "TP", "processed", "fixation_table_{}".format(self.split))
 
+    def load_fixation_table(self):
+        table = FixationTable.load(self.fixation_table_path())
+        for key in ["max_explanation_length", "min_explanation_length"]:
+            if table.meta[key] != getattr(self.opt, key):
+                raise ValueError("{} was ingested with {} = {}, please ingest the fixations again"
+                                 .format(table.table_dir, key, table.meta[key]))
+        if self.opt.tiny:
+            # the tiny dataset keeps the first 100 scanpaths of the fixation file
+            return [_.to_dict() for _ in table if _["idx"] < 100], table.explanation_gts()
+        return table, table.explanation_gts()
 
     def __len__(self):
         return len(self.fixations)
@@ -349,8 +395,16 @@ class UnifiedScanpath(Dataset):
         plt.plot(x, y, 'xb-')
         plt.show()
 
-    def __getitem__(self, idx):
-        fixation = self.fixations[idx]
+    def load_image_feature(self, img_path):
+        if not self.opt.feature_store:
+            return torch.load(img_path)
+        feature_dir, img_file = os.path.split(img_path)
+        store_dir = feature_dir + "_packed"
+        if store_dir not in self.feature_stores:
+            self.feature_stores[store_dir] = PackedFeatureStore(store_dir)
+        return self.feature_stores[store_dir][img_file]
+
+    def image_feature_path(self, fixation):
         dataset = fixation["dataset"]
 
         if dataset == "AiR-D":
@@ -367,86 +421,49 @@ class UnifiedScanpath(Dataset):
             img_path = join(self.opt.dataset_dir, "COCO", "image_features", img_name.replace('jpg', 'pth'))
         else:
             raise "Invalid Dataset"
+        return img_path
 
-        image_ftrs = torch.load(img_path)
+    def __getitem__(self, idx):
+        fixation = self.fixations[idx]
+        dataset = fixation["dataset"]
+
+        img_path = self.image_feature_path(fixation)
+        image_ftrs = self.load_image_feature(img_path)
         task = fixation["task_description"]
 
 
-        origin_size_y, origin_size_x = fixation["height"], fixation["width"]
-        self.downscale_x = origin_size_x / self.action_map[1]
-        self.downscale_y = origin_size_y / self.action_map[0]
-
-        scanpath = np.zeros((self.opt.max_length, self.action_map[0], self.action_map[1]), dtype=np.float32)
-        # the first element denotes the termination action
-        target_scanpath = np.zeros((self.opt.max_length, self.action_map[0] * self.action_map[1] + 1), dtype=np.float32)
-        duration = np.zeros(self.opt.max_length, dtype=np.float32)
-        action_mask = np.zeros(self.opt.max_length, dtype=np.float32)
-        duration_mask = np.zeros(self.opt.max_length, dtype=np.float32)
-
-        pos_x = np.array(fixation["X"]).astype(np.float32)
-        pos_y = np.array(fixation["Y"]).astype(np.float32)
-        duration_raw = np.array(fixation["T"]).astype(np.float32)
-
-        pos_x_discrete = np.zeros(self.opt.max_length, dtype=np.int32) - 1
-        pos_y_discrete = np.zeros(self.opt.max_length, dtype=np.int32) - 1
-        for index in range(len(pos_x)):
-            # only preserve the max_length ground-truth
-            if index == self.opt.max_length:
-                break
-            pos_x_discrete[index] = (pos_x[index] / self.downscale_x).astype(np.int32)
-            pos_y_discrete[index] = (pos_y[index] / self.downscale_y).astype(np.int32)
-            if pos_x_discrete[index] < 0:
-                pos_x_discrete[index] = 0
-            if pos_y_discrete[index] < 0:
-                pos_y_discrete[index] = 0
-            if pos_x_discrete[index] >= self.opt.im_w:
-                pos_x_discrete[index] = self.opt.im_w - 1
-            if pos_y_discrete[index] >= self.opt.im_h:
-                pos_y_discrete[index] = self.opt.im_h - 1
-            duration[index] = duration_raw[index] / 1000.0
-            action_mask[index] = 1
-            duration_mask[index] = 1
-        if action_mask.sum() <= self.opt.max_length - 1:
-            action_mask[int(action_mask.sum())] = 1
-
-        for index in range(self.opt.max_length):
-            if pos_x_discrete[index] == -1 or pos_y_discrete[index] == -1:
-                target_scanpath[index, 0] = 1
-            else:
-                scanpath[index, pos_y_discrete[index], pos_x_discrete[index]] = 1
-                if self.opt.blur_sigma:
-                    scanpath[index] = filters.gaussian_filter(scanpath[index], self.opt.blur_sigma)
-                    scanpath[index] /= scanpath[index].sum()
-                target_scanpath[index, 1:] = scanpath[index].reshape(-1)
+        if self.compiled_targets is not None:
+            targets = self.compiled_targets[idx]
+        else:
+            targets = compute_targets(fixation, self.opt)
+        if self.opt.sparse_target:
+            # the collate function only ships the action indices
+            target_scanpath = None
+        else:
+            target_scanpath = dense_target_scanpath(targets["action_index"], self.action_map[0] * self.action_map[1] + 1,
+                                                    self.blur_table)
 
         # image_size = [fixation["height"], fixation["width"]]
         image_size = [self.opt.height, self.opt.width]
 
-        explanation_mask = np.zeros(self.opt.max_length, np.float32)
         if "explanation" in fixation:
-            explanation = fixation["explanation"][:]
-            if len(explanation) >= self.opt.max_length:
-                explanation_mask += 1
-                explanation = explanation[:self.opt.max_length]
-            else:
-                explanation_mask[: len(explanation)] = 1
-                explanation = explanation + ["" for _ in range(self.opt.max_length - len(explanation))]
+            explanation = fixation["explanation"][:self.opt.max_length]
+            explanation = explanation + ["" for _ in range(self.opt.max_length - len(explanation))]
         else:
             explanation = ["" for _ in range(self.opt.max_length)]
-        explanation_similarity_mask = np.ones((self.opt.max_length, self.opt.max_length), np.float32)
-        explanation_similarity_mask[explanation_mask == 0] = 0
-        explanation_similarity_mask[:, explanation_mask == 0] = 0
 
         return {
             "image_feature": image_ftrs,
+            "image_key": img_path,
             "task": task,
-            "duration": duration,
-            "action_mask": action_mask,
-            "duration_mask": duration_mask,
+            "duration": targets["duration"],
+            "action_mask": targets["action_mask"],
+            "duration_mask": targets["duration_mask"],
             "target_scanpath": target_scanpath,
+            "target_action": targets["action_index"],
             "explanation": explanation,
-            "explanation_mask": explanation_mask,
-            "explanation_similarity_mask": explanation_similarity_mask,
+            "explanation_mask": targets["explanation_mask"],
+            "explanation_similarity_mask": targets["explanation_similarity_mask"],
             "fixation_info": fixation,
             "image_size": image_size,
             "idx": idx,
@@ -462,6 +479,7 @@ class UnifiedScanpath(Dataset):
         action_mask_batch = []
         duration_mask_batch = []
         target_scanpath_batch = []
+        target_action_batch = []
         explanation_batch = []
         explanation_mask_batch = []
         explanation_similarity_mask_batch = []
@@ -481,6 +499,7 @@ class UnifiedScanpath(Dataset):
             action_mask_batch.append(tmp_action_mask)
             duration_mask_batch.append(tmp_duration_mask)
             target_scanpath_batch.append(tmp_target_scanpath)
+            target_action_batch.append(sample["target_action"])
             explanation_batch.extend(tmp_explanation)
             explanation_mask_batch.append(tmp_explanation_mask)
             explanation_similarity_mask_batch.append(tmp_explanation_similarity_mask)
@@ -502,13 +521,18 @@ class UnifiedScanpath(Dataset):
 
         data = dict()
         data["image_feature"] = torch.stack(image_feature_batch)
+        # identifies the image of every scanpath for the encoder memory cache
+        data["image_key"] = [_["image_key"] for _ in batch]
         data["task"] = task_batch
-        data["task_input"] = self.roberta_tokenizer(task_batch, return_tensors="pt", padding=True)
+        data["task_input"] = self.task_token_cache(task_batch)
         data["duration"] = np.stack(duration_batch)
         data["action_mask"] = np.stack(action_mask_batch)
         data["duration_mask"] = np.stack(duration_mask_batch)
-        data["target_scanpath"] = np.stack(target_scanpath_batch)
-        data["explanation"] = self.blip_tokenizer(explanation_batch, return_tensors="pt", padding=True, truncation=True, max_length=self.opt.max_explanation_length)
+        if self.opt.sparse_target:
+            data["target_action"] = np.stack(target_action_batch)
+        else:
+            data["target_scanpath"] = np.stack(target_scanpath_batch)
+        data["explanation"] = self.explanation_token_cache(explanation_batch)
         data["explanation_mask"] = np.stack(explanation_mask_batch)
         data["explanation_similarity_mask"] = np.stack(explanation_similarity_mask_batch)
         data["explanation_string"] = explanation_batch
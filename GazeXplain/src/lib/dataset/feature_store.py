@@ -0,0 +1,83 @@
+import json
+import os
+from os.path import join
+
+import numpy as np
+import torch
+
+FEATURE_FILE = "features.npy"
+INDEX_FILE = "index.json"
+
+
+class PackedFeatureStore(object):
+    """
+    Read-only view over image features packed into a single memory-mapped array.
+
+    The store directory holds ``features.npy`` with shape ``[num_images, *feature_shape]`` and
+    ``index.json`` mapping each image (file name without extension) to its row. The file is
+    only mapped on first access so that every DataLoader worker owns its own mapping.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(join(store_dir, INDEX_FILE), "r") as f:
+            index = json.load(f)
+        self.name2row = index["names"]
+        self.feature_shape = tuple(index["shape"])
+        self.features = None
+
+    def __len__(self):
+        return len(self.name2row)
+
+    def __contains__(self, img_name):
+        return os.path.splitext(img_name)[0] in self.name2row
+
+    def __getitem__(self, img_name):
+        if self.features is None:
+            # copy-on-write mapping, the pages are shared with the page cache and never written
+            self.features = np.load(join(self.store_dir, FEATURE_FILE), mmap_mode="c")
+        row = self.name2row[os.path.splitext(img_name)[0]]
+        return torch.from_numpy(self.features[row])
+
+    def __getstate__(self):
+        # never ship the mapping to the workers, they map the file themselves
+        state = self.__dict__.copy()
+        state["features"] = None
+        return state
+
+
+def pack_image_features(feature_dir, store_dir, names=None):
+    """
+    Pack the per-image ``.pth`` features of ``feature_dir`` into a :class:`PackedFeatureStore`.
+    """
+    if names is None:
+        names = sorted([os.path.splitext(_)[0] for _ in os.listdir(feature_dir) if _.endswith(".pth")])
+    else:
+        names = sorted(set([os.path.splitext(_)[0] for _ in names]))
+    if len(names) == 0:
+        raise ValueError("No image feature found in {}".format(feature_dir))
+
+    first = torch.load(join(feature_dir, names[0] + ".pth"))
+    feature_shape = tuple(first.shape)
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    features = np.lib.format.open_memmap(join(store_dir, FEATURE_FILE), mode="w+", dtype=np.float32,
+                                         shape=(len(names),) + feature_shape)
+    for row, name in enumerate(names):
+        feature = first if row == 0 else torch.load(join(feature_dir, name + ".pth"))
+        if tuple(feature.shape) != feature_shape:
+            raise ValueError("Feature {} has shape {}, expected {}".format(name, tuple(feature.shape), feature_shape))
+        features[row] = feature.float().numpy()
+    features.flush()
+    del features
+
+    index = {
+        "shape": list(feature_shape),
+        "dtype": "float32",
+        "names": {name: row for row, name in enumerate(names)},
+    }
+    with open(join(store_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f)
+
+    return len(names)
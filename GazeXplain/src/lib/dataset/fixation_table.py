@@ -0,0 +1,243 @@
+import json
+import operator
+import os
+from collections.abc import Mapping
+from os.path import join
+
+import numpy as np
+
+SCHEMA_FILE = "schema.json"
+EXPLANATION_GTS_FILE = "explanation_gts.json"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _column_kind(values):
+    present = [_ for _ in values if _ is not None]
+    if all([isinstance(_, bool) for _ in present]):
+        return "number", "bool"
+    if all([isinstance(_, int) and not isinstance(_, bool) for _ in present]):
+        return "number", "int64"
+    if all([_is_number(_) for _ in present]):
+        return "number", "float64"
+    if all([isinstance(_, str) for _ in present]):
+        return "string", None
+    if all([isinstance(_, list) and all([isinstance(e, str) for e in _]) for _ in present]):
+        return "text", None
+    if all([isinstance(_, list) and all([isinstance(e, int) and not isinstance(e, bool) for e in _]) for _ in present]):
+        return "ragged", "int64"
+    if all([isinstance(_, list) and all([_is_number(e) for e in _]) for _ in present]):
+        return "ragged", "float64"
+    return "json", None
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    return offsets
+
+
+def encode_columns(fixations):
+    """
+    Columnar arrays of a list of scanpath records, see :func:`write_fixation_table` for the layout.
+    """
+    keys = []
+    for fixation in fixations:
+        for key in fixation.keys():
+            if key not in keys:
+                keys.append(key)
+
+    arrays = {}
+    columns = {}
+    for key in keys:
+        values = [_.get(key) for _ in fixations]
+        kind, dtype = _column_kind(values)
+        column = {"kind": kind}
+        missing = np.array([key not in _ for _ in fixations], dtype=bool)
+        if missing.any():
+            arrays[key + ".missing"] = missing
+            column["missing"] = True
+
+        if kind == "number":
+            arrays[key] = np.array([0 if _ is None else _ for _ in values], dtype=dtype)
+            column["dtype"] = dtype
+        elif kind in ["string", "json"]:
+            if kind == "json":
+                values = [json.dumps(_) for _ in values]
+            vocab = sorted(set([_ for _ in values if _ is not None]))
+            word2id = {word: i for i, word in enumerate(vocab)}
+            arrays[key] = np.array([-1 if _ is None else word2id[_] for _ in values], dtype=np.int32)
+            column["vocab"] = vocab
+        elif kind == "ragged":
+            values = [[] if _ is None else _ for _ in values]
+            arrays[key] = np.array([e for _ in values for e in _], dtype=dtype)
+            arrays[key + ".offsets"] = _offsets([len(_) for _ in values])
+            column["dtype"] = dtype
+        elif kind == "text":
+            values = [[] if _ is None else _ for _ in values]
+            encoded = [e.encode("utf-8") for _ in values for e in _]
+            arrays[key] = np.frombuffer(b"".join(encoded), dtype=np.uint8).copy()
+            arrays[key + ".sentence_offsets"] = _offsets([len(_) for _ in encoded])
+            arrays[key + ".offsets"] = _offsets([len(_) for _ in values])
+        columns[key] = column
+
+    return keys, columns, arrays
+
+
+def write_fixation_table(fixations, table_dir, meta=None, explanation_gts=None):
+    """
+    Write the scanpaths of a split as a columnar table of ``.npy`` files.
+
+    Numbers become one array per field, strings are interned into a vocabulary, lists of numbers (X, Y, T)
+    are stored back to back with an offset table and lists of strings (the explanation sentences) as one
+    UTF-8 blob with sentence and record offsets. Fields that fit none of these are stored as interned JSON.
+    """
+    if not os.path.exists(table_dir):
+        os.makedirs(table_dir)
+
+    keys, columns, arrays = encode_columns(fixations)
+    for name, array in arrays.items():
+        np.save(join(table_dir, name + ".npy"), array)
+
+    schema = {
+        "num_fixations": len(fixations),
+        "keys": keys,
+        "columns": columns,
+        "meta": meta if meta is not None else {},
+    }
+    with open(join(table_dir, SCHEMA_FILE), "w") as f:
+        json.dump(schema, f)
+
+    if explanation_gts is not None:
+        with open(join(table_dir, EXPLANATION_GTS_FILE), "w") as f:
+            json.dump(explanation_gts, f)
+
+
+class FixationRecord(Mapping):
+    """
+    Read-only view of one scanpath of a :class:`FixationTable` that behaves like the original dict.
+
+    Values are decoded on access and a record pickles as a plain dict, so records sent back by the
+    DataLoader workers do not drag the table along.
+    """
+
+    __slots__ = ("table", "idx")
+
+    def __init__(self, table, idx):
+        self.table = table
+        self.idx = idx
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.table.value(key, self.idx)
+
+    def __contains__(self, key):
+        return key in self.table.columns and self.table.has_value(key, self.idx)
+
+    def __iter__(self):
+        return (key for key in self.table.keys if self.table.has_value(key, self.idx))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __reduce__(self):
+        return dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        return {key: self.table.value(key, self.idx) for key in self}
+
+
+class FixationTable(object):
+    """
+    Read-only, array-backed table of scanpaths.
+
+    The table either holds the arrays of :func:`encode_columns` in memory or maps the files written by
+    :func:`write_fixation_table`, which are only mapped on first access so that every DataLoader worker
+    owns its own mapping. Either way the scanpaths live in a handful of NumPy arrays, whose pages are
+    shared with forked DataLoader workers instead of being copied by reference counting like Python
+    objects. Indexing returns a :class:`FixationRecord` view.
+    """
+
+    def __init__(self, keys, columns, num_fixations, meta=None, arrays=None, table_dir=None):
+        self.keys = keys
+        self.columns = columns
+        self.num_fixations = num_fixations
+        self.meta = meta if meta is not None else {}
+        self.arrays = arrays if arrays is not None else {}
+        self.table_dir = table_dir
+
+    @classmethod
+    def load(cls, table_dir):
+        with open(join(table_dir, SCHEMA_FILE), "r") as f:
+            schema = json.load(f)
+        return cls(schema["keys"], schema["columns"], schema["num_fixations"], schema["meta"], table_dir=table_dir)
+
+    @classmethod
+    def from_records(cls, fixations, meta=None):
+        keys, columns, arrays = encode_columns(fixations)
+        return cls(keys, columns, len(fixations), meta, arrays=arrays)
+
+    def __len__(self):
+        return self.num_fixations
+
+    def __getitem__(self, idx):
+        idx = operator.index(idx)
+        if idx < 0:
+            idx += self.num_fixations
+        if idx < 0 or idx >= self.num_fixations:
+            raise IndexError("fixation index out of range")
+        return FixationRecord(self, idx)
+
+    def __iter__(self):
+        return (FixationRecord(self, idx) for idx in range(self.num_fixations))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.table_dir is not None:
+            # never ship the mappings to the workers, they map the files themselves
+            state["arrays"] = {}
+        return state
+
+    def array(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(join(self.table_dir, name + ".npy"), mmap_mode="r")
+        return self.arrays[name]
+
+    def lengths(self, key):
+        # lengths of a list column without decoding it
+        return np.diff(self.array(key + ".offsets"))
+
+    def has_value(self, key, idx):
+        return not (self.columns[key].get("missing", False) and self.array(key + ".missing")[idx])
+
+    def value(self, key, idx):
+        column = self.columns[key]
+        kind = column["kind"]
+        if kind == "number":
+            return self.array(key)[idx].item()
+        elif kind == "string":
+            return column["vocab"][self.array(key)[idx]]
+        elif kind == "json":
+            return json.loads(column["vocab"][self.array(key)[idx]])
+        elif kind == "ragged":
+            offsets = self.array(key + ".offsets")
+            return self.array(key)[offsets[idx]: offsets[idx + 1]].tolist()
+        else:
+            offsets = self.array(key + ".offsets")
+            sentence_offsets = self.array(key + ".sentence_offsets")
+            blob = self.array(key)
+            return [bytes(blob[sentence_offsets[i]: sentence_offsets[i + 1]]).decode("utf-8")
+                    for i in range(offsets[idx], offsets[idx + 1])]
+
+    def record(self, idx):
+        return self[idx].to_dict()
+
+    def explanation_gts(self):
+        with open(join(self.table_dir, EXPLANATION_GTS_FILE), "r") as f:
+            return json.load(f)
@@ -0,0 +1,54 @@
+import numpy as np
+import torch
+from transformers import BatchEncoding
+
+
+class TokenCache(object):
+    """
+    Token ids of a fixed set of texts, tokenized once with a single batched call.
+
+    The ids of all texts are stored back to back in one array with an offset table, so that a batch only
+    needs dictionary lookups and a vectorized right padding. The result is the same ``BatchEncoding`` as
+    ``tokenizer(texts, return_tensors="pt", padding=True, **tokenizer_kwargs)``; texts that were not cached
+    are still handed to the tokenizer.
+    """
+
+    def __init__(self, tokenizer, texts, **tokenizer_kwargs):
+        self.tokenizer = tokenizer
+        self.tokenizer_kwargs = tokenizer_kwargs
+        self.keys = list(tokenizer("", **tokenizer_kwargs).keys())
+        self.pad_token_id = tokenizer.pad_token_id
+
+        texts = sorted(set(texts))
+        self.text2row = {text: row for row, text in enumerate(texts)}
+        input_ids = tokenizer(texts, **tokenizer_kwargs)["input_ids"] if len(texts) > 0 else []
+        self.lengths = np.array([len(_) for _ in input_ids], dtype=np.int64)
+        self.offsets = np.zeros(len(input_ids) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(self.lengths)
+        self.token_ids = np.concatenate([np.array(_, dtype=np.int64) for _ in input_ids]) \
+            if len(input_ids) > 0 else np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.text2row)
+
+    def __contains__(self, text):
+        return text in self.text2row
+
+    def __call__(self, texts):
+        if not all([_ in self.text2row for _ in texts]):
+            return self.tokenizer(texts, return_tensors="pt", padding=True, **self.tokenizer_kwargs)
+
+        rows = np.array([self.text2row[_] for _ in texts], dtype=np.int64)
+        lengths = self.lengths[rows]
+        # indices of every token of the batch in the flat token array
+        flat_index = np.repeat(self.offsets[rows] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        valid = np.arange(lengths.max()) < lengths[:, None]
+
+        input_ids = np.full(valid.shape, self.pad_token_id, dtype=np.int64)
+        input_ids[valid] = self.token_ids[flat_index]
+        data = {
+            "input_ids": input_ids,
+            "token_type_ids": np.zeros(valid.shape, dtype=np.int64),
+            "attention_mask": valid.astype(np.int64),
+        }
+        return BatchEncoding({k: torch.from_numpy(data[k]) for k in self.keys})
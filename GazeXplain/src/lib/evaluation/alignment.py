@@ -0,0 +1,58 @@
+"""Needleman-Wunsch alignment shared by the ScanMatch and sequence score metrics"""
+import numpy as np
+
+
+def symbol_similarity(a, b, dtype=np.float64):
+    """
+    ``[len(a), len(b)]`` zero-one similarity of two sequences of hashable symbols, 1 where the symbols are equal.
+    """
+    # equal symbols share a code, so the comparison is a single broadcast over integer codes
+    codes = {}
+    a_codes = np.array([codes.setdefault(_, len(codes)) for _ in a], dtype=np.int64)
+    b_codes = np.array([codes.setdefault(_, len(codes)) for _ in b], dtype=np.int64)
+    return (a_codes[:, None] == b_codes[None, :]).astype(dtype)
+
+
+def alignment_tables(similarities, gap=0.0, gap_offset=0, dtype=np.float64):
+    """
+    Needleman-Wunsch score tables of many pairs of sequences at once.
+
+    ``similarities`` holds the ``[n, m]`` similarity matrix of every pair, the score of aligning the i-th symbol
+    of the first sequence with the j-th symbol of the second one. The first row and column of a table are
+    ``gap * (i + gap_offset)`` and every other cell is the best of a match, a deletion and an insertion.
+
+    The pairs are padded to a common size and the cells are filled one anti-diagonal at a time, as every cell
+    only depends on the two previous anti-diagonals. The recursion does the same additions in ``dtype`` as
+    filling the table cell by cell, so the tables are identical to it. Returns the ``[n + 1, m + 1]`` table of
+    every pair.
+    """
+    dtype = np.dtype(dtype).type
+    sizes = [np.shape(_) for _ in similarities]
+    num_pairs = len(sizes)
+    max_n = max([_[0] for _ in sizes], default=0)
+    max_m = max([_[1] for _ in sizes], default=0)
+
+    padded = np.zeros((num_pairs, max_n, max_m), dtype=dtype)
+    for idx, similarity in enumerate(similarities):
+        padded[idx, :sizes[idx][0], :sizes[idx][1]] = similarity
+
+    tables = np.zeros((num_pairs, max_n + 1, max_m + 1), dtype=dtype)
+    tables[:, :, 0] = gap * (np.arange(max_n + 1) + gap_offset)
+    tables[:, 0, :] = gap * (np.arange(max_m + 1) + gap_offset)
+    gap = dtype(gap)
+    for diagonal in range(2, max_n + max_m + 1):
+        i = np.arange(max(1, diagonal - max_m), min(max_n, diagonal - 1) + 1)
+        j = diagonal - i
+        match = tables[:, i - 1, j - 1] + padded[:, i - 1, j - 1]
+        delete = tables[:, i - 1, j] + gap
+        insert = tables[:, i, j - 1] + gap
+        tables[:, i, j] = np.maximum(np.maximum(match, delete), insert)
+
+    return [tables[idx, :n + 1, :m + 1] for idx, (n, m) in enumerate(sizes)]
+
+
+def alignment_table(similarity, gap=0.0, gap_offset=0, dtype=np.float64):
+    """
+    Needleman-Wunsch score table of a single pair, see :func:`alignment_tables`.
+    """
+    return alignment_tables([similarity], gap=gap, gap_offset=gap_offset, dtype=dtype)[0]
@@ -35,6 +35,8 @@ from __future__ import print_function
 
 import numpy
 
+from lib.evaluation.alignment import alignment_table, alignment_tables
+
 
 class ScanMatch(object):
     """
@@ -80,25 +82,15 @@ class ScanMatch(object):
             else:
                 raise ValueError('Unknown parameter: %s.' % k)
 
-        self.intv = numpy.vectorize(int)
-
         self.CreateSubMatrix()
         self.GridMask()
 
     def CreateSubMatrix(self, Threshold=None):
         if Threshold is not None:
             self.Threshold = Threshold
-        mat = numpy.zeros((self.Xbin*self.Ybin, self.Xbin*self.Ybin))
-        indI = 0
-        indJ = 0
-        for i in range(self.Ybin):
-            for j in range(self.Xbin):
-                for ii in range(self.Ybin):
-                    for jj in range(self.Xbin):
-                        mat[indI, indJ] = numpy.sqrt((j-jj)**2 + (i-ii)**2)
-                        indI += 1
-                indI = 0
-                indJ += 1
+        # distance between the bins of every pair of symbols, symbol i*Xbin+j is the bin of row i and column j
+        i, j = numpy.divmod(numpy.arange(self.Xbin*self.Ybin), self.Xbin)
+        mat = numpy.sqrt((j[None, :]-j[:, None])**2 + (i[None, :]-i[:, None])**2)
         max_sub = numpy.max(mat)
         self.SubMatrix = numpy.abs(mat-max_sub) - (max_sub - self.Threshold)
 
@@ -110,8 +102,7 @@ class ScanMatch(object):
         yi = numpy.int32(numpy.arange(0, self.Ybin, n))
 
         self.mask = numpy.zeros((self.Yres, self.Xres))
-        for y in range(self.Yres):
-            self.mask[y, :] = a[yi[y], xi]
+        self.mask[:] = a[numpy.ix_(yi[:self.Yres], xi)]
 
     def fixationToSequence(self, data):
         d = data.copy()
@@ -119,35 +110,32 @@ class ScanMatch(object):
         d[d < 0] = 0
         d[d[:, 0] >= self.Xres, 0] = self.Xres-1
         d[d[:, 1] >= self.Yres, 1] = self.Yres-1
-        d = self.intv(d)
+        # the values are not negative any more, truncation is int()
+        d = d.astype(numpy.int64)
 
         seq_num = self.mask[d[:, 1], d[:, 0]]
 
         if self.TempBin != 0:
             fix_time = numpy.round(d[:, 2] / float(self.TempBin))
-            tmp = []
-            for f in range(d.shape[0]):
-                tmp.extend([seq_num[f] for x in range(int(fix_time[f]))])
-            seq_num = numpy.array(tmp)
+            seq_num = numpy.repeat(seq_num, fix_time.astype(numpy.int64))
 
         return seq_num
 
     def match(self, A, B):
-        n = len(A)
-        m = len(B)
+        F = alignment_table(self.SubMatrix[numpy.ix_(A, B)], gap=self.GapValue, gap_offset=1)
+        return self.traceback(A, B, F)
 
-        F = numpy.zeros((n+1, m+1))
-        for i in range(n+1):
-            F[i, 0] = self.GapValue*(i+1)
-        for j in range(m+1):
-            F[0, j] = self.GapValue*(j+1)
+    def matchBatch(self, pairs):
+        """
+        :func:`match` of many ``(A, B)`` pairs of sequences, whose score tables are filled together.
+        """
+        tables = alignment_tables([self.SubMatrix[numpy.ix_(A, B)] for A, B in pairs], gap=self.GapValue,
+                                  gap_offset=1)
+        return [self.traceback(A, B, F) for (A, B), F in zip(pairs, tables)]
 
-        for i in range(1, n+1):
-            for j in range(1, m+1):
-                match = F[i-1, j-1] + self.SubMatrix[A[i-1], B[j-1]]
-                delete = F[i-1, j] + self.GapValue
-                insert = F[i, j-1] + self.GapValue
-                F[i, j] = max([match, insert, delete])
+    def traceback(self, A, B, F):
+        n = len(A)
+        m = len(B)
 
         AlignmentA = numpy.zeros(n+m)-1
         AlignmentB = numpy.zeros(n+m)-1
@@ -203,6 +191,22 @@ class ScanMatch(object):
         self.SubMarix = array
 
 
+_scanMatchCache = {}
+
+
+def getScanMatch(**kw):
+    """
+    Shared :class:`ScanMatch` object of the given parameters, built on the first call.
+
+    The substitution matrix and the grid mask only depend on the parameters, so every pair of fixation
+    sequences of the same resolution can use the same object. It must not be modified.
+    """
+    key = tuple(sorted(kw.items()))
+    if key not in _scanMatchCache:
+        _scanMatchCache[key] = ScanMatch(**kw)
+    return _scanMatchCache[key]
+
+
 def generateMaskFromArray(data, threshold, margeColor):
     dataArray = data.copy()
     uniqueData = numpy.unique(dataArray)
@@ -15,10 +15,11 @@ Created on 1 mar 2017
 # IMPORT EXTERNAL LIBRARIES
 
 import numpy as np
-from copy import copy
 import matplotlib.pyplot as plt
 import cv2
 
+from lib.evaluation.alignment import alignment_tables
+
 #########################################################################################
 
 ##############################  saliency metrics  #######################################
@@ -233,69 +234,23 @@ def euclidean_distance(human_scanpath, simulated_scanpath, msg=False):
     "speech and language processing", Jurafsky, Martin. Cap. 3, par. 11. '''
 
 
-def _Levenshtein_Dmatrix_initializer(len1, len2):
-    Dmatrix = []
-
-    for i in range(len1):
-        Dmatrix.append([0] * len2)
-
-    for i in range(len1):
-        Dmatrix[i][0] = i
-
-    for j in range(len2):
-        Dmatrix[0][j] = j
-
-    return Dmatrix
-
-
-def _Levenshtein_cost_step(Dmatrix, string_1, string_2, i, j, substitution_cost=1):
-    char_1 = string_1[i - 1]
-    char_2 = string_2[j - 1]
-
-    # insertion
-    insertion = Dmatrix[i - 1][j] + 1
-    # deletion
-    deletion = Dmatrix[i][j - 1] + 1
-    # substitution
-    substitution = Dmatrix[i - 1][j - 1] + substitution_cost * (char_1 != char_2)
-
-    # pick the cheapest
-    Dmatrix[i][j] = min(insertion, deletion, substitution)
-
-
-def _Levenshtein(string_1, string_2, substitution_cost=1):
-    # get strings lengths and initialize Distances-matrix
-    len1 = len(string_1)
-    len2 = len(string_2)
-    Dmatrix = _Levenshtein_Dmatrix_initializer(len1 + 1, len2 + 1)
+def _Levenshtein_batch(codes_1, codes_2, substitution_cost=1):
+    # the edit distance is the negated Needleman-Wunsch score with a -1 gap and a -substitution_cost mismatch,
+    # so the distance matrices of all pairs are filled together, in integers
+    similarities = [-substitution_cost * (a[:, None] != b[None, :]).astype(np.int64) for a, b in zip(codes_1, codes_2)]
+    tables = alignment_tables(similarities, gap=-1, dtype=np.int64)
+    return [-int(table[-1, -1]) for table in tables]
 
-    # compute cost for each step in dynamic programming
-    for i in range(len1):
-        for j in range(len2):
-            _Levenshtein_cost_step(Dmatrix,
-                                   string_1, string_2,
-                                   i + 1, j + 1,
-                                   substitution_cost=substitution_cost)
 
-    if substitution_cost == 1:
-        max_dist = max(len1, len2)
-    elif substitution_cost == 2:
-        max_dist = len1 + len2
-
-    return Dmatrix[len1][len2]
-
-
-def _scanpath_to_string(scanpath, height, width, n):
+def _scanpath_to_codes(scanpath, height, width, n):
+    # index of the region of the nxn grid every fixation falls in, the letter of the fixation in the string
     height_step, width_step = height // n, width // n
+    fixations = np.asarray(scanpath)[:, :2].astype(np.int32)
+    return fixations[:, 0] // width_step + (fixations[:, 1] // height_step) * n
 
-    string = ''
-
-    for i in range(np.shape(scanpath)[0]):
-        fixation = scanpath[i].astype(np.int32)
-        correspondent_square = (fixation[0] // width_step) + (fixation[1] // height_step) * n
-        string += chr(97 + correspondent_square)
 
-    return string
+def _scanpath_to_string(scanpath, height, width, n):
+    return ''.join([chr(97 + _) for _ in _scanpath_to_codes(scanpath, height, width, n)])
 
 
 def string_edit_distance(stimulus,  # matrix
@@ -306,15 +261,23 @@ def string_edit_distance(stimulus,  # matrix
                          substitution_cost=1,
                          msg=False
                          ):
-    height, width = np.shape(stimulus)[0:2]
+    if msg:
+        height, width = np.shape(stimulus)[0:2]
+        print((_scanpath_to_string(human_scanpath, height, width, n),
+               _scanpath_to_string(simulated_scanpath, height, width, n)))
 
-    string_1 = _scanpath_to_string(human_scanpath, height, width, n)
-    string_2 = _scanpath_to_string(simulated_scanpath, height, width, n)
+    return string_edit_distance_batch([np.shape(stimulus)], [human_scanpath], [simulated_scanpath], n=n)[0]
 
-    if msg:
-        print((string_1, string_2))
 
-    return _Levenshtein(string_1, string_2)
+def string_edit_distance_batch(stimulus_shapes, human_scanpaths, simulated_scanpaths, n=5):
+    # string_edit_distance of many pairs of scanpaths, with the np.shape of the stimulus of every pair
+    codes_1, codes_2 = [], []
+    for shape, human_scanpath, simulated_scanpath in zip(stimulus_shapes, human_scanpaths, simulated_scanpaths):
+        height, width = shape[0:2]
+        codes_1.append(_scanpath_to_codes(human_scanpath, height, width, n))
+        codes_2.append(_scanpath_to_codes(simulated_scanpath, height, width, n))
+
+    return _Levenshtein_batch(codes_1, codes_2)
 
 
 #########################################################################################
@@ -329,6 +292,59 @@ def string_edit_distance(stimulus,  # matrix
     stochastic and dynamic scanpaths of varied lengths '''
 
 
+def _fixation_distances(human_scanpaths, simulated_scanpaths):
+    # [P, NH, NS] distance between every human and every simulated fixation of every pair, padded with zeros
+    max_h = max([len(_) for _ in human_scanpaths], default=0)
+    max_s = max([len(_) for _ in simulated_scanpaths], default=0)
+    distances = np.zeros((len(human_scanpaths), max_h, max_s))
+    for idx, (H, S) in enumerate(zip(human_scanpaths, simulated_scanpaths)):
+        distances[idx, :len(H), :len(S)] = np.sqrt((S[None, :, 0] - H[:, None, 0]) ** 2 +
+                                                   (S[None, :, 1] - H[:, None, 1]) ** 2)
+    return distances
+
+
+def _k_vector_distances(fixation_distances, k):
+    # [P, NH - k + 1, NS - k + 1] euclidean_distance between every human and every simulated k-vector: the
+    # k-vectors are sliding windows along the diagonals of the fixation distances, summed like a k-vector is
+    num_h, num_s = fixation_distances.shape[1:]
+    t = np.arange(k)
+    i = np.arange(num_h - k + 1)[:, None, None] + t
+    j = np.arange(num_s - k + 1)[None, :, None] + t
+    return fixation_distances[:, i, j].sum(axis=-1)
+
+
+def _time_delay_embedding_distances(human_scanpaths, simulated_scanpaths, distance_mode='Mean'):
+    # time_delay_embedding_distance of every pair of scanpaths for every k from 1 to the length of the shorter one
+    len_h = np.array([len(_) for _ in human_scanpaths], dtype=np.int64)
+    len_s = np.array([len(_) for _ in simulated_scanpaths], dtype=np.int64)
+    max_k = np.minimum(len_h, len_s)
+    fixation_distances = _fixation_distances(human_scanpaths, simulated_scanpaths)
+
+    distances = [[] for _ in human_scanpaths]
+    for k in np.arange(1, max_k.max(initial=0) + 1):
+        k_distances = _k_vector_distances(fixation_distances, k)
+        # human k-vectors running into the padding are never the closest ones
+        invalid_h = np.arange(k_distances.shape[1])[None, :] > (len_h - k)[:, None]
+        k_distances[invalid_h] = np.inf
+        # minimum distance of every simulated k-vector, divided by k
+        min_distances = k_distances.min(axis=1) / k
+        valid_s = np.arange(min_distances.shape[1])[None, :] <= (len_s - k)[:, None]
+        if distance_mode == 'Mean':
+            # the cumulative sum adds the k-vectors in order, like summing them one by one does
+            k_distances = np.cumsum(np.where(valid_s, min_distances, 0.), axis=1)[:, -1] / np.maximum(len_s - k + 1, 1)
+        else:
+            k_distances = np.where(valid_s, min_distances, -np.inf).max(axis=1)
+        for idx in np.nonzero(max_k >= k)[0]:
+            distances[idx].append(k_distances[idx])
+    return distances
+
+
+def _scaled_scanpaths(scanpaths, stimulus_shapes):
+    # coordinates rescaled as to an image with maximum dimension 1
+    return [np.asarray(scanpath, dtype=np.float64)[:, :2] / float(max(shape))
+            for scanpath, shape in zip(scanpaths, stimulus_shapes)]
+
+
 def time_delay_embedding_distance(
         human_scanpath,
         simulated_scanpath,
@@ -347,47 +363,26 @@ def time_delay_embedding_distance(
         if msg: print('ERROR: Too large value for the time-embedding vector dimension')
         return False
 
-    # create time-embedding vectors for both scanpaths
-
-    human_scanpath_vectors = []
-    for i in np.arange(0, len(human_scanpath) - k + 1):
-        human_scanpath_vectors.append(human_scanpath[i:i + k])
-
-    simulated_scanpath_vectors = []
-    for i in np.arange(0, len(simulated_scanpath) - k + 1):
-        simulated_scanpath_vectors.append(simulated_scanpath[i:i + k])
-
-    # in the following cicles, for each k-vector from the simulated scanpath
-    # we look for the k-vector from humans, the one of minumum distance
-    # and we save the value of such a distance, divided by k
-
-    distances = []
-
-    for s_k_vec in simulated_scanpath_vectors:
-
-        # find human k-vec of minimum distance
-
-        norms = []
-
-        for h_k_vec in human_scanpath_vectors:
-            d = np.linalg.norm(euclidean_distance(s_k_vec, h_k_vec))
-            norms.append(d)
+    if distance_mode not in ['Mean', 'Hausdorff']:
+        if msg:
+            print('ERROR: distance mode not defined.')
+        return False
 
-        distances.append(min(norms) / k)
+    # for each k-vector from the simulated scanpath we look for the k-vector
+    # from humans, the one of minumum distance, and we save the value of such
+    # a distance, divided by k
+    fixation_distances = _fixation_distances([np.asarray(human_scanpath, dtype=np.float64)],
+                                             [np.asarray(simulated_scanpath, dtype=np.float64)])
+    distances = _k_vector_distances(fixation_distances, k)[0].min(axis=0) / k
 
-    # at this point, the list "distances" contains the value of
-    # minumum distance for each simulated k-vec
-    # according to the distance_mode, here we compute the similarity
-    # between the two scanpaths.
+    # at this point, "distances" contains the value of minumum distance for
+    # each simulated k-vec according to the distance_mode, here we compute the
+    # similarity between the two scanpaths.
 
     if distance_mode == 'Mean':
         return sum(distances) / len(distances)
-    elif distance_mode == 'Hausdorff':
-        return max(distances)
     else:
-        if msg:
-            print('ERROR: distance mode not defined.')
-        return False
+        return max(distances)
 
 
 def scaled_time_delay_embedding_similarity(
@@ -398,40 +393,21 @@ def scaled_time_delay_embedding_similarity(
         # options
         toPlot=False,
         msg=False):
-    # to preserve data, we work on copies of the lists
-    H_scanpath = copy(human_scanpath)
-    S_scanpath = copy(simulated_scanpath)
-
-    # First, coordinates are rescaled as to an image with maximum dimension 1
-    # This is because, clearly, smaller images would produce smaller distances
-    max_dim = float(max(np.shape(image)))
-
-    for P in H_scanpath:
-        P[0] /= max_dim
-        P[1] /= max_dim
-
-    for P in S_scanpath:
-        P[0] /= max_dim
-        P[1] /= max_dim
-
-    # Then, scanpath similarity is computer for all possible k
-    max_k = min(len(H_scanpath), len(S_scanpath))
-    similarities = []
-    for k in np.arange(1, max_k + 1):
-        s = time_delay_embedding_distance(
-            H_scanpath,
-            S_scanpath,
-            k=k,  # time-embedding vector dimension
-            distance_mode='Mean')
-        similarities.append(np.exp(-s))
-        if msg:
-            print(similarities[-1])
+    # coordinates are rescaled as to an image with maximum dimension 1, as
+    # smaller images would produce smaller distances, then scanpath similarity
+    # is computed for all possible k
+    similarities = [np.exp(-s) for s in _time_delay_embedding_distances(
+        _scaled_scanpaths([human_scanpath], [np.shape(image)]),
+        _scaled_scanpaths([simulated_scanpath], [np.shape(image)]))[0]]
+    if msg:
+        for similarity in similarities:
+            print(similarity)
 
     # Now that we have similarity measure for all possible k
     # we compute and return the mean
 
     if toPlot:
-        keys = np.arange(1, max_k + 1)
+        keys = np.arange(1, len(similarities) + 1)
         plt.plot(keys, similarities)
         plt.show()
 
@@ -441,6 +417,15 @@ def scaled_time_delay_embedding_similarity(
         return None
 
 
+def scaled_time_delay_embedding_similarity_batch(human_scanpaths, simulated_scanpaths, stimulus_shapes):
+    # scaled_time_delay_embedding_similarity of many pairs of scanpaths, with the np.shape of the stimulus of every
+    # pair, the k-vectors of all pairs are compared together for every k
+    distances = _time_delay_embedding_distances(_scaled_scanpaths(human_scanpaths, stimulus_shapes),
+                                                _scaled_scanpaths(simulated_scanpaths, stimulus_shapes))
+    similarities = [[np.exp(-s) for s in _] for _ in distances]
+    return [sum(_) / len(_) if len(_) > 0 else None for _ in similarities]
+
+
 def scaled_time_delay_embedding_distance(
         human_scanpath,
         simulated_scanpath,
@@ -449,40 +434,21 @@ def scaled_time_delay_embedding_distance(
         # options
         toPlot=False,
         msg=False):
-    # to preserve data, we work on copies of the lists
-    H_scanpath = copy(human_scanpath)
-    S_scanpath = copy(simulated_scanpath)
-
-    # First, coordinates are rescaled as to an image with maximum dimension 1
-    # This is because, clearly, smaller images would produce smaller distances
-    max_dim = float(max(np.shape(image)))
-
-    for P in H_scanpath:
-        P[0] /= max_dim
-        P[1] /= max_dim
-
-    for P in S_scanpath:
-        P[0] /= max_dim
-        P[1] /= max_dim
-
-    # Then, scanpath similarity is computer for all possible k
-    max_k = min(len(H_scanpath), len(S_scanpath))
-    distances = []
-    for k in np.arange(1, max_k + 1):
-        s = time_delay_embedding_distance(
-            H_scanpath,
-            S_scanpath,
-            k=k,  # time-embedding vector dimension
-            distance_mode='Mean')
-        distances.append(s)
-        if msg:
-            print(distances[-1])
+    # coordinates are rescaled as to an image with maximum dimension 1, as
+    # smaller images would produce smaller distances, then scanpath distance
+    # is computed for all possible k
+    distances = _time_delay_embedding_distances(
+        _scaled_scanpaths([human_scanpath], [np.shape(image)]),
+        _scaled_scanpaths([simulated_scanpath], [np.shape(image)]))[0]
+    if msg:
+        for distance in distances:
+            print(distance)
 
     # Now that we have similarity measure for all possible k
     # we compute and return the mean
 
     if toPlot:
-        keys = np.arange(1, max_k + 1)
+        keys = np.arange(1, len(distances) + 1)
         plt.plot(keys, distances)
         plt.show()
 
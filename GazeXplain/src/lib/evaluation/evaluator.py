@@ -3,6 +3,8 @@ from __future__ import print_function
 
 import copy
 import gzip
+import multiprocessing
+from collections import OrderedDict
 from typing import List
 
 import numpy as np
@@ -15,9 +17,11 @@ from json import encoder
 
 from accelerate.utils import tqdm
 
-from lib.evaluation.metrics import multimatch
-from lib.evaluation.evaltools.scanmatch import ScanMatch
-from lib.evaluation.evaltools.visual_attention_metrics import string_edit_distance, scaled_time_delay_embedding_similarity
+from lib.evaluation.metrics import multimatch, multimatch_batch
+from lib.evaluation.alignment import alignment_table, alignment_tables, symbol_similarity
+from lib.evaluation.evaltools.scanmatch import getScanMatch
+from lib.evaluation.evaltools.visual_attention_metrics import string_edit_distance, scaled_time_delay_embedding_similarity, \
+    string_edit_distance_batch, scaled_time_delay_embedding_similarity_batch
 from lib.evaluation import saliency
 from lib.evaluation.pycocoevalcap.eval_scanpath import ScanpathEval
 
@@ -33,23 +37,59 @@ def zero_one_similarity(a, b):
 
 def nw_matching(pred_string, gt_string, gap=0.0):
     # NW string matching with zero_one_similarity
-    F = np.zeros((len(pred_string) + 1, len(gt_string) + 1), dtype=np.float32)
-    for i in range(1 + len(pred_string)):
-        F[i, 0] = gap * i
-    for j in range(1 + len(gt_string)):
-        F[0, j] = gap * j
-    for i in range(1, 1 + len(pred_string)):
-        for j in range(1, 1 + len(gt_string)):
-            a = pred_string[i - 1]
-            b = gt_string[j - 1]
-            match = F[i - 1, j - 1] + zero_one_similarity(a, b)
-            delete = F[i - 1, j] + gap
-            insert = F[i, j - 1] + gap
-            F[i, j] = np.max([match, delete, insert])
+    F = alignment_table(symbol_similarity(pred_string, gt_string), gap=gap, dtype=np.float32)
     score = F[len(pred_string), len(gt_string)]
     return score / max(len(pred_string), len(gt_string))
 
 
+def nw_matching_batch(pred_strings, gt_strings, gap=0.0):
+    # nw_matching of many pairs of strings, aligned together
+    tables = alignment_tables([symbol_similarity(pred_string, gt_string)
+                               for pred_string, gt_string in zip(pred_strings, gt_strings)], gap=gap, dtype=np.float32)
+    return [F[len(pred_string), len(gt_string)] / max(len(pred_string), len(gt_string))
+            for F, pred_string, gt_string in zip(tables, pred_strings, gt_strings)]
+
+
+def nw_matching_scores(strings, missing):
+    # nw_matching of the (pred_string, gt_string) pairs aligned together, missing where a pair is None
+    pairs = [_ for _ in strings if _ is not None]
+    scores = iter(nw_matching_batch([_[0] for _ in pairs], [_[1] for _ in pairs]))
+    return [next(scores) if _ is not None else missing for _ in strings]
+
+
+def image_size_groups(image_sizes):
+    # indices of the pairs of every image size, the pairs of an image size are compared together
+    groups = {}
+    for idx, image_size in enumerate(image_sizes):
+        groups.setdefault(tuple(image_size), []).append(idx)
+    return groups
+
+
+def scanpath_array(scanpath):
+    # [n, 3] float64 X, Y, T of a scanpath, padded with (1, 1, 1) fixations to the 3 fixations the metrics need
+    vector = np.array([scanpath["X"], scanpath["Y"], scanpath["T"]], dtype=np.float64).T
+    if len(vector) < 3:
+        vector = np.concatenate([vector, np.ones((3 - len(vector), 3))])
+    return vector
+
+
+def scanpath_dict(vector):
+    return {"X": vector[:, 0].tolist(), "Y": vector[:, 1].tolist(), "T": vector[:, 2].tolist()}
+
+
+# the evaluator of a scoring worker, inherited from the main process when the workers are forked
+_scoring_evaluator = None
+
+
+def _init_scoring_worker(evaluator):
+    global _scoring_evaluator
+    _scoring_evaluator = evaluator
+
+
+def _score_samples(samples):
+    return _scoring_evaluator.score_samples(samples)
+
+
 class Evaluator(object):
     def __init__(self, opt):
         self.opt = opt
@@ -63,6 +103,30 @@ class Evaluator(object):
         # self.COCOTA_fix_clusters = np.load(os.path.join(opt.dataset_dir, "COCO/TA", "processed", 'clusters.npy'),
         #                                    allow_pickle=True).item()
 
+        # decoded segmentation maps of the SemSS scores, keyed by file
+        self.segmentation_maps = OrderedDict()
+        self.segmentation_map_cache_size = 256
+
+        # the scoring workers are forked once the clusters are loaded, so they share them read-only
+        self.pool = None
+        self.eval_workers = getattr(opt, "eval_workers", 0)
+        if self.eval_workers > 0:
+            context = multiprocessing.get_context(
+                "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+            self.pool = context.Pool(self.eval_workers, initializer=_init_scoring_worker, initargs=(self,))
+
+    def __getstate__(self):
+        # spawned workers receive the evaluator without the pool
+        state = self.__dict__.copy()
+        state["pool"] = None
+        return state
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
 
     def explanation_evaluation(self, gts, preds):
         self.scanpath_eval = ScanpathEval(gts, preds)
@@ -103,43 +167,53 @@ class Evaluator(object):
 
     def measure(self, gts: List, preds: List, batch: dict):
         # evaluation order is SM, MM, SED, STDE
-        image_size = batch["image_size"]
-        dataset_idx = batch["dataset_idx"]
+        image_size = batch["image_size"].tolist()
+        dataset_idx = batch["dataset_idx"].tolist()
         fixation_info = batch["fixation_info"]
-        scores = []
-        for idx, (gt, pred) in enumerate(zip(gts, preds)):
-            im_h, im_w = image_size[idx, 0].item(), image_size[idx, 1].item()
-
-            # make sure the fixation length is not less than 3
-            _gt = copy.deepcopy(gt)
-            _pred = copy.deepcopy(pred)
-            if len(_gt["X"]) < 3:
-                for _ in range(3 - len(_gt["X"])):
-                    _gt["X"].append(1)
-                    _gt["Y"].append(1)
-                    _gt["T"].append(1)
-            if len(_pred["X"]) < 3:
-                for _ in range(3 - len(_pred["X"])):
-                    _pred["X"].append(1)
-                    _pred["Y"].append(1)
-                    _pred["T"].append(1)
-
-            # get scanmatch
-            scanmatch_score = self.ScanMatch(_pred, _gt, im_w, im_h)
-
-            # get multimatch
-            # [VecSim, DirSim, LenSim, PosSim, DurSim]
-            multimatch_score = multimatch(_pred, _gt, (im_w, im_h))
-
-            # get SED and STDE
-            gt_vector = np.array([_gt["X"], _gt["Y"], _gt["T"]]).T
-            pred_vector = np.array([_pred["X"], _pred["Y"], _pred["T"]]).T
-            stimulus = np.zeros((im_h, im_w, 3), dtype=np.float32)
-            sed_score = string_edit_distance(stimulus, gt_vector, pred_vector)
-            stde_score = scaled_time_delay_embedding_similarity(gt_vector, pred_vector, stimulus)
-
-            # get SS score
-            dataset = self.datasets[dataset_idx[idx]]
+        samples = [{
+            "gt": scanpath_array(gt),
+            "pred": scanpath_array(pred),
+            "image_size": image_size[idx],
+            "dataset": self.datasets[dataset_idx[idx]],
+            "fixation_info": fixation_info[idx],
+        } for idx, (gt, pred) in enumerate(zip(gts, preds))]
+        if self.pool is None or len(samples) < 2:
+            return self.score_samples(samples)
+
+        # one contiguous chunk per worker, the results come back in order
+        chunks = [chunk.tolist() for chunk in np.array_split(np.arange(len(samples)), self.eval_workers)]
+        chunks = [[samples[_] for _ in chunk] for chunk in chunks if len(chunk) > 0]
+        return [score for scores in self.pool.map(_score_samples, chunks) for score in scores]
+
+    def score_samples(self, samples: List):
+        # get SED and STDE of all samples
+        gt_vectors = [sample["gt"] for sample in samples]
+        pred_vectors = [sample["pred"] for sample in samples]
+        stimulus_shapes = [(sample["image_size"][0], sample["image_size"][1], 3) for sample in samples]
+        sed_scores = string_edit_distance_batch(stimulus_shapes, gt_vectors, pred_vectors)
+        stde_scores = scaled_time_delay_embedding_similarity_batch(gt_vectors, pred_vectors, stimulus_shapes)
+
+        _gts = [scanpath_dict(vector) for vector in gt_vectors]
+        _preds = [scanpath_dict(vector) for vector in pred_vectors]
+
+        image_sizes = [(sample["image_size"][1], sample["image_size"][0]) for sample in samples]
+
+        # get scanmatch of all samples
+        scanmatch_scores = self.ScanMatchBatch(_preds, _gts, image_sizes)
+
+        # get multimatch of all samples
+        # [VecSim, DirSim, LenSim, PosSim, DurSim]
+        multimatch_scores = [None] * len(samples)
+        for im_size, indices in image_size_groups(image_sizes).items():
+            group_scores = multimatch_batch([_preds[_] for _ in indices], [_gts[_] for _ in indices], im_size)
+            for idx, multimatch_score in zip(indices, group_scores):
+                multimatch_scores[idx] = multimatch_score
+
+        # strings of the SS and SemSS scores, aligned together below
+        SS_strings, SS_Time_strings, SSS_strings, SSS_Time_strings = [], [], [], []
+        for _gt, _pred, sample in zip(_gts, _preds, samples):
+            dataset = sample["dataset"]
+            fixation_info = sample["fixation_info"]
             if dataset == "AiR-D":
                 clusters = self.AiR_fix_clusters
             elif dataset == "OSIE":
@@ -150,36 +224,45 @@ class Evaluator(object):
                 clusters = self.COCOTA_fix_clusters
             else:
                 raise "Invalid dataset"
-            SS = self.compute_SS(_pred, clusters, truncate=self.opt.max_length,
-                                 fixation_info=fixation_info[idx], dataset=dataset)
-            SS_Time = self.compute_SS_Time(_pred, clusters, truncate=self.opt.max_length,
-                                           fixation_info=fixation_info[idx], dataset=dataset)
-            SS_score = [SS, SS_Time]
+            SS_strings.append(self.SS_strings(_pred, clusters, truncate=self.opt.max_length,
+                                              fixation_info=fixation_info, dataset=dataset))
+            SS_Time_strings.append(self.SS_Time_strings(_pred, clusters, truncate=self.opt.max_length,
+                                                        fixation_info=fixation_info, dataset=dataset))
 
-            # get SemSS score
             if dataset in ["COCO-TP", "COCO-TA"]:
                 segmentation_map_dir = os.path.join(self.opt.dataset_dir, "COCO/TP", "semantic_seq_full/segmentation_maps")
-                SSS = self.compute_SSS(_pred, _gt, fixation_info=fixation_info[idx], truncate=self.opt.max_length,
-                                       segmentation_map_dir=segmentation_map_dir)
-                SSS_Time = self.compute_SSS_Time(_pred, _gt, fixation_info=fixation_info[idx], truncate=self.opt.max_length,
-                                                 segmentation_map_dir=segmentation_map_dir)
-                SSS_score = [SSS, SSS_Time]
+                SSS_strings.append(self.SSS_strings(_pred, _gt, fixation_info=fixation_info, truncate=self.opt.max_length,
+                                                    segmentation_map_dir=segmentation_map_dir))
+                SSS_Time_strings.append(self.SSS_Time_strings(_pred, _gt, fixation_info=fixation_info,
+                                                              truncate=self.opt.max_length,
+                                                              segmentation_map_dir=segmentation_map_dir))
+            else:
+                SSS_strings.append(None)
+                SSS_Time_strings.append(None)
 
+        SS = nw_matching_scores(SS_strings, 0)
+        SS_Time = nw_matching_scores(SS_Time_strings, 0)
+        SSS = nw_matching_scores(SSS_strings, np.nan)
+        SSS_Time = nw_matching_scores(SSS_Time_strings, np.nan)
+
+        scores = []
+        for idx, sample in enumerate(samples):
+            if sample["dataset"] in ["COCO-TP", "COCO-TA"]:
                 scores.append({
-                    "scanmatch_score": scanmatch_score,
-                    "multimatch_score": multimatch_score,
-                    "sed_score": sed_score,
-                    "stde_score": stde_score,
-                    "SS_score": SS_score,
-                    "SSS_score": SSS_score,
+                    "scanmatch_score": scanmatch_scores[idx],
+                    "multimatch_score": multimatch_scores[idx],
+                    "sed_score": sed_scores[idx],
+                    "stde_score": stde_scores[idx],
+                    "SS_score": [SS[idx], SS_Time[idx]],
+                    "SSS_score": [SSS[idx], SSS_Time[idx]],
                 })
             else:
                 scores.append({
-                    "scanmatch_score": scanmatch_score,
-                    "multimatch_score": multimatch_score,
-                    "sed_score": sed_score,
-                    "stde_score": stde_score,
-                    "SS_score": SS_score
+                    "scanmatch_score": scanmatch_scores[idx],
+                    "multimatch_score": multimatch_scores[idx],
+                    "sed_score": sed_scores[idx],
+                    "stde_score": stde_scores[idx],
+                    "SS_score": [SS[idx], SS_Time[idx]]
                 })
         return scores
 
@@ -354,35 +437,19 @@ class Evaluator(object):
 
     def measure_scanmatch(self, gts: List, preds: List, image_size: Tensor):
         # evaluation order is SM, MM, SED, STDE
-        scores = []
-        for idx, (gt, pred) in enumerate(zip(gts, preds)):
-            im_h, im_w = image_size[idx, 0].item(), image_size[idx, 1].item()
+        # make sure the fixation length is not less than 3
+        _gts = [scanpath_dict(scanpath_array(gt)) for gt in gts]
+        _preds = [scanpath_dict(scanpath_array(pred)) for pred in preds]
+        image_size = image_size.tolist()
 
-            # make sure the fixation length is not less than 3
-            _gt = copy.deepcopy(gt)
-            _pred = copy.deepcopy(pred)
-            if len(_gt["X"]) < 3:
-                for idx in range(3 - len(_gt["X"])):
-                    _gt["X"].append(1)
-                    _gt["Y"].append(1)
-                    _gt["T"].append(1)
-            if len(_pred["X"]) < 3:
-                for idx in range(3 - len(_pred["X"])):
-                    _pred["X"].append(1)
-                    _pred["Y"].append(1)
-                    _pred["T"].append(1)
-
-            # get scanmatch
-            scanmatch_score = self.ScanMatch(_pred, _gt, im_w, im_h)
-            scores.append(scanmatch_score)
-
-        return scores
+        # get scanmatch
+        return self.ScanMatchBatch(_preds, _gts, [(image_size[idx][1], image_size[idx][0]) for idx in range(len(_gts))])
 
 
     def ScanMatch(self, pred, gt, im_w, im_h):
-        # create a ScanMatch object
-        ScanMatchwithoutDuration = ScanMatch(Xres=im_w, Yres=im_h, Xbin=16, Ybin=12, Offset=(0, 0),
-                                             Threshold=3.5)
+        # the ScanMatch objects are shared by all pairs of the same image size
+        ScanMatchwithoutDuration = getScanMatch(Xres=im_w, Yres=im_h, Xbin=16, Ybin=12, Offset=(0, 0),
+                                                Threshold=3.5)
 
         gt_vector = np.array([gt["X"], gt["Y"], gt["T"]]).T
         pred_vector = np.array([pred["X"], pred["Y"], pred["T"]]).T
@@ -390,9 +457,8 @@ class Evaluator(object):
         sequence_pred = ScanMatchwithoutDuration.fixationToSequence(pred_vector).astype(np.int32)
         (score_1, align_1, f_1) = ScanMatchwithoutDuration.match(sequence_gt, sequence_pred)
 
-        # create a ScanMatch object
-        ScanMatchwithDuration = ScanMatch(Xres=im_w, Yres=im_h, Xbin=16, Ybin=12, Offset=(0, 0),
-                                          TempBin=50, Threshold=3.5)
+        ScanMatchwithDuration = getScanMatch(Xres=im_w, Yres=im_h, Xbin=16, Ybin=12, Offset=(0, 0),
+                                             TempBin=50, Threshold=3.5)
 
         sequence_gt = ScanMatchwithDuration.fixationToSequence(gt_vector).astype(np.int32)
         sequence_pred = ScanMatchwithDuration.fixationToSequence(pred_vector).astype(np.int32)
@@ -400,6 +466,25 @@ class Evaluator(object):
 
         return score_1, score_2
 
+    def ScanMatchBatch(self, preds, gts, image_sizes):
+        # ScanMatch of many pairs, the pairs of the same (im_w, im_h) image size are aligned together
+        scores = [None] * len(preds)
+        for (im_w, im_h), indices in image_size_groups(image_sizes).items():
+            gt_vectors = [np.array([gts[_]["X"], gts[_]["Y"], gts[_]["T"]]).T for _ in indices]
+            pred_vectors = [np.array([preds[_]["X"], preds[_]["Y"], preds[_]["T"]]).T for _ in indices]
+            # without and with duration
+            group_scores = []
+            for duration in [{}, {"TempBin": 50}]:
+                ScanMatch = getScanMatch(Xres=im_w, Yres=im_h, Xbin=16, Ybin=12, Offset=(0, 0), Threshold=3.5,
+                                         **duration)
+                matches = ScanMatch.matchBatch([(ScanMatch.fixationToSequence(gt_vector).astype(np.int32),
+                                                 ScanMatch.fixationToSequence(pred_vector).astype(np.int32))
+                                                for gt_vector, pred_vector in zip(gt_vectors, pred_vectors)])
+                group_scores.append([score for score, align, f in matches])
+            for idx, score_1, score_2 in zip(indices, *group_scores):
+                scores[idx] = (score_1, score_2)
+        return scores
+
     def scanpath2clusters(self, meanshift, scanpath):
         string = []
         xs = scanpath['X']
@@ -409,7 +494,8 @@ class Evaluator(object):
             string.append(symbol)
         return string
 
-    def compute_SS(self, pred, clusters, truncate, fixation_info, dataset):
+    def SS_strings(self, pred, clusters, truncate, fixation_info, dataset):
+        # cluster strings of the predicted and the human scanpath, None without a human string
         if dataset == "AiR-D":
             key = '{}-{}-{}'.format(fixation_info['split'], fixation_info['question_id'], fixation_info['image_id'][:-4])
         elif dataset == "OSIE":
@@ -431,17 +517,18 @@ class Evaluator(object):
         pred_string = self.scanpath2clusters(cluster, pred)
 
         gt = strings[subject]
-        if len(gt) > 0:
-            pred_string = pred_string[:truncate] if len(pred_string) > truncate else pred_string
-            gt = gt[:truncate] if len(gt) > truncate else gt
-            score = nw_matching(pred_string, gt)
-        else:
-            score = 0
-
-        return score
+        if len(gt) == 0:
+            return None
+        pred_string = pred_string[:truncate] if len(pred_string) > truncate else pred_string
+        gt = gt[:truncate] if len(gt) > truncate else gt
+        return pred_string, gt
 
+    def compute_SS(self, pred, clusters, truncate, fixation_info, dataset):
+        strings = self.SS_strings(pred, clusters, truncate, fixation_info, dataset)
+        return nw_matching(*strings) if strings is not None else 0
 
-    def compute_SS_Time(self, pred, clusters, truncate, fixation_info, dataset, tempbin = 50):
+    def SS_Time_strings(self, pred, clusters, truncate, fixation_info, dataset, tempbin = 50):
+        # cluster strings repeated for every tempbin of the fixation durations, None without a human string
         if dataset == "AiR-D":
             key = '{}-{}-{}'.format(fixation_info['split'], fixation_info['question_id'], fixation_info['image_id'][:-4])
         elif dataset == "OSIE":
@@ -463,25 +550,25 @@ class Evaluator(object):
         pred_string = self.scanpath2clusters(cluster, pred)
 
         gt = strings[subject]
-        if len(gt) > 0:
-            time_string = fixation_info["T"]
-            gt = gt[:truncate] if len(gt) > truncate else gt
-            pred_string = pred_string[:truncate] if len(pred_string) > truncate else pred_string
-            gtime_string = time_string[:truncate] if len(time_string) > truncate else time_string
-            ptime_string = pred['T'][:truncate] if len(pred['T']) > truncate else pred['T']
-
-            pred_time = []
-            gt_time = []
-            for p, t_p in zip(pred_string, ptime_string):
-                pred_time.extend([p for _ in range(int(t_p / tempbin))])
-            for g, t_g in zip(gt, gtime_string):
-                gt_time.extend([g for _ in range(int(t_g / tempbin))])
-
-            score = nw_matching(pred_time, gt_time)
-        else:
-            score = 0
+        if len(gt) == 0:
+            return None
+        time_string = fixation_info["T"]
+        gt = gt[:truncate] if len(gt) > truncate else gt
+        pred_string = pred_string[:truncate] if len(pred_string) > truncate else pred_string
+        gtime_string = time_string[:truncate] if len(time_string) > truncate else time_string
+        ptime_string = pred['T'][:truncate] if len(pred['T']) > truncate else pred['T']
+
+        pred_time = []
+        gt_time = []
+        for p, t_p in zip(pred_string, ptime_string):
+            pred_time.extend([p for _ in range(int(t_p / tempbin))])
+        for g, t_g in zip(gt, gtime_string):
+            gt_time.extend([g for _ in range(int(t_g / tempbin))])
+        return pred_time, gt_time
 
-        return score
+    def compute_SS_Time(self, pred, clusters, truncate, fixation_info, dataset, tempbin = 50):
+        strings = self.SS_Time_strings(pred, clusters, truncate, fixation_info, dataset, tempbin=tempbin)
+        return nw_matching(*strings) if strings is not None else 0
 
     def scanpath2categories(self, seg_map, scanpath):
         string = []
@@ -493,12 +580,26 @@ class Evaluator(object):
             string.append((symbol, t))
         return string
 
-    def compute_SSS(self, pred, gt, fixation_info, truncate, segmentation_map_dir):
-        if not os.path.exists(os.path.join(segmentation_map_dir, fixation_info['name'][:-3] + 'npy.gz')):
-            return np.nan
-        with gzip.GzipFile(os.path.join(segmentation_map_dir, fixation_info['name'][:-3] + 'npy.gz'), "r") as r:
-            segmentation_map = np.load(r, allow_pickle=True)
-            r.close()
+    def load_segmentation_map(self, path):
+        # the SemSS scores of all subjects of an image use the same map, which is decoded once
+        if path in self.segmentation_maps:
+            self.segmentation_maps.move_to_end(path)
+            return self.segmentation_maps[path]
+        segmentation_map = None
+        if os.path.exists(path):
+            with gzip.GzipFile(path, "r") as r:
+                segmentation_map = np.load(r, allow_pickle=True)
+        self.segmentation_maps[path] = segmentation_map
+        if len(self.segmentation_maps) > self.segmentation_map_cache_size:
+            self.segmentation_maps.popitem(last=False)
+        return segmentation_map
+
+    def SSS_strings(self, pred, gt, fixation_info, truncate, segmentation_map_dir):
+        # category strings of the predicted and the human scanpath, None without a map or a human string
+        segmentation_map = self.load_segmentation_map(
+            os.path.join(segmentation_map_dir, fixation_info['name'][:-3] + 'npy.gz'))
+        if segmentation_map is None:
+            return None
 
         gt_fixations = copy.deepcopy(gt)
         pred_fixations = copy.deepcopy(pred)
@@ -517,19 +618,20 @@ class Evaluator(object):
         gt_strings = gt_strings[:truncate] if len(gt_strings) > truncate else gt_strings
         gt_noT = [i[0] for i in gt_strings]
 
-        if len(gt_strings) > 0:
-            score = nw_matching(pred_noT, gt_noT)
-        else:
-            score = np.nan
+        if len(gt_strings) == 0:
+            return None
+        return pred_noT, gt_noT
 
-        return score
+    def compute_SSS(self, pred, gt, fixation_info, truncate, segmentation_map_dir):
+        strings = self.SSS_strings(pred, gt, fixation_info, truncate, segmentation_map_dir)
+        return nw_matching(*strings) if strings is not None else np.nan
 
-    def compute_SSS_Time(self, pred, gt, fixation_info, truncate, segmentation_map_dir, tempbin=50):
-        if not os.path.exists(os.path.join(segmentation_map_dir, fixation_info['name'][:-3] + 'npy.gz')):
-            return np.nan
-        with gzip.GzipFile(os.path.join(segmentation_map_dir, fixation_info['name'][:-3] + 'npy.gz'), "r") as r:
-            segmentation_map = np.load(r, allow_pickle=True)
-            r.close()
+    def SSS_Time_strings(self, pred, gt, fixation_info, truncate, segmentation_map_dir, tempbin=50):
+        # category strings repeated for every tempbin of the fixation durations, None without a map or a human string
+        segmentation_map = self.load_segmentation_map(
+            os.path.join(segmentation_map_dir, fixation_info['name'][:-3] + 'npy.gz'))
+        if segmentation_map is None:
+            return None
 
         gt_fixations = copy.deepcopy(gt)
         pred_fixations = copy.deepcopy(pred)
@@ -552,9 +654,10 @@ class Evaluator(object):
         for g in gt_strings:
             gt_T.extend([g[0] for _ in range(int(g[1] / tempbin))])
 
-        if len(gt_strings) > 0:
-            score = nw_matching(pred_T, gt_T)
-        else:
-            score = np.nan
+        if len(gt_strings) == 0:
+            return None
+        return pred_T, gt_T
 
-        return score
\ No newline at end of file
+    def compute_SSS_Time(self, pred, gt, fixation_info, truncate, segmentation_map_dir, tempbin=50):
+        strings = self.SSS_Time_strings(pred, gt, fixation_info, truncate, segmentation_map_dir, tempbin=tempbin)
+        return nw_matching(*strings) if strings is not None else np.nan
@@ -444,17 +444,12 @@ def cal_vectordifferences(data1,
     x2 = np.asarray(data2['saccade_lenx'])
     y1 = np.asarray(data1['saccade_leny'])
     y2 = np.asarray(data2['saccade_leny'])
-    # initialize empty lists M and row, will become matrix to store sacc-length
-    # pairings
-    M = []
-    row = []
-    # calculate saccade length differences, vectorized
-    for i in range(0, len(x1)):
-        x_diff = abs(x1[i] * np.ones(len(x2)) - x2)
-        y_diff = abs(y1[i] * np.ones(len(y2)) - y2)
-        # calc final length from x and y lengths, append, stack into matrix M
-        row.append(np.asarray(np.sqrt(x_diff ** 2 + y_diff ** 2)))
-        M = np.stack(row)
+    # calculate saccade length differences of all pairs at once, rows are the
+    # saccades of the first scanpath
+    x_diff = abs(x1[:, None] * np.ones(len(x2)) - x2)
+    y_diff = abs(y1[:, None] * np.ones(len(y2)) - y2)
+    # calc final length from x and y lengths
+    M = np.sqrt(x_diff ** 2 + y_diff ** 2)
     return M
 
 
@@ -580,6 +575,105 @@ def dijkstra(weightedGraph,
     return path[::-1], dist[end]
 
 
+def shortest_paths(Ms):
+    """Shortest paths through many matrices of vector differences at once.
+
+    Finds the same path as running dijkstra on the graph of createdirectedgraph,
+    from the top-left to the bottom-right node, with a dynamic program over the
+    grid: the graph only has right, down and down-right edges and the weight of
+    an edge is the entry of M it leads to. Dijkstra settles the nodes in the
+    order of their distance and then of their index, so among the predecessors
+    reaching a node with the same distance it keeps the one with the smaller
+    distance and then the smaller index (down-right before down before right).
+    The cells of all matrices are filled one anti-diagonal at a time.
+
+    :param: Ms: list of array-like, matrices of vector length differences
+
+    :return: paths: list of lists, node indices of the shortest path through
+        every matrix, as returned by dijkstra
+    :return: dists: list of floats, sum of weights along every path
+
+    """
+    sizes = [np.shape(_) for _ in Ms]
+    num_pairs = len(sizes)
+    max_n = max([_[0] for _ in sizes])
+    max_m = max([_[1] for _ in sizes])
+    dtype = np.result_type(*Ms)
+
+    weight = np.zeros((num_pairs, max_n, max_m), dtype=dtype)
+    for idx, M in enumerate(Ms):
+        weight[idx, :sizes[idx][0], :sizes[idx][1]] = M
+    dist = np.full((num_pairs, max_n, max_m), np.inf, dtype=dtype)
+    dist[:, 0, 0] = 0
+    # 0: down-right, 1: down, 2: right move into a cell
+    move = np.zeros((num_pairs, max_n, max_m), dtype=np.int8)
+
+    for diagonal in range(1, max_n + max_m - 1):
+        i = np.arange(max(0, diagonal - max_m + 1), min(max_n - 1, diagonal) + 1)
+        j = diagonal - i
+        w = weight[:, i, j]
+        # distance of the predecessors, inf where there is none
+        pred_dist = [np.where((i > 0) & (j > 0), dist[:, i - 1, j - 1], np.inf),
+                     np.where(i > 0, dist[:, i - 1, j], np.inf),
+                     np.where(j > 0, dist[:, i, j - 1], np.inf)]
+        best_dist = pred_dist[0]
+        best = best_dist + w
+        best_move = np.zeros(best.shape, dtype=np.int8)
+        for k in [1, 2]:
+            candidate = pred_dist[k] + w
+            better = (candidate < best) | ((candidate == best) & (pred_dist[k] < best_dist))
+            best = np.where(better, candidate, best)
+            best_dist = np.where(better, pred_dist[k], best_dist)
+            best_move = np.where(better, k, best_move)
+        dist[:, i, j] = best
+        move[:, i, j] = best_move
+
+    paths = []
+    dists = []
+    for idx, (n, m) in enumerate(sizes):
+        i, j = n - 1, m - 1
+        path = [i * m + j]
+        while i > 0 or j > 0:
+            k = move[idx, i, j]
+            if k != 2:
+                i -= 1
+            if k != 1:
+                j -= 1
+            path.append(i * m + j)
+        paths.append(path[::-1])
+        dists.append(dist[idx, n - 1, m - 1])
+    return paths, dists
+
+
+def shortest_path(M):
+    """Shortest path through a matrix of vector differences, see shortest_paths.
+
+    :param: M: array-like, matrix of vector length differences
+
+    :return: path: array-like, array of indices of the shortest path, i.e. best-fitting saccade pairs
+    :return: dist: float, sum of weights
+
+    """
+    paths, dists = shortest_paths([M])
+    return paths[0], dists[0]
+
+
+def path_indices(path,
+                 M_assignment
+                 ):
+    """Row and column of every node of a path.
+
+    :param: path: array-like, array of node indices
+    :param: M_assignment: array-like, Matrix, arranged with values from 0 to number of entries in M
+
+    :return: i, j: lists of one-element arrays, as returned by np.where(M_assignment == node)
+    """
+    # position of every node in M_assignment, looked up once instead of a search per node
+    position = np.argsort(M_assignment, axis=None)[np.asarray(path, dtype=np.int64)]
+    rows, cols = np.divmod(position, np.shape(M_assignment)[1])
+    return [rows[k:k + 1] for k in range(len(path))], [cols[k:k + 1] for k in range(len(path))]
+
+
 def cal_angulardifference(data1,
                           data2,
                           path,
@@ -606,9 +700,10 @@ def cal_angulardifference(data1,
     # initialize list to hold individual angle differences
     anglediff = []
     # calculate angular differences between the saccades along specified path
+    rows, cols = path_indices(path, M_assignment)
     for k in range(0, len(path)):
         # which saccade indices correspond to path?
-        i, j = np.where(M_assignment == path[k])
+        i, j = rows[k], cols[k]
         # extract the angle
         spT = [theta1[np.ndarray.item(i)], theta2[np.ndarray.item(j)]]
         for t in range(0, len(spT)):
@@ -653,9 +748,10 @@ def cal_durationdifference(data1,
     # initialize list to hold individual duration differences
     durdiff = []
     # calculation fixation duration differences between saccades along path
+    rows, cols = path_indices(path, M_assignment)
     for k in range(0, len(path)):
         # which saccade indices correspond to path?
-        i, j = np.where(M_assignment == path[k])
+        i, j = rows[k], cols[k]
         maxlist = [dur1[np.ndarray.item(i)], dur2[np.ndarray.item(j)]]
         # compute abs. duration diff, normalize by largest duration in pair
         durdiff.append(abs(dur1[np.ndarray.item(i)] -
@@ -693,8 +789,9 @@ def cal_lengthdifference(data1,
     # initialize list to hold individual length differences
     lendiff = []
     # calculate length differences between saccades along path
+    rows, cols = path_indices(path, M_assignment)
     for k in range(0, len(path)):
-        i, j = np.where(M_assignment == path[k])
+        i, j = rows[k], cols[k]
         lendiff.append(abs(len1[i] - len2[j]))
     return lendiff
 
@@ -732,8 +829,9 @@ def cal_positiondifference(data1,
     # initialize list to hold individual position differences
     posdiff = []
     # calculate position differences along path
+    rows, cols = path_indices(path, M_assignment)
     for k in range(0, len(path)):
-        i, j = np.where(M_assignment == path[k])
+        i, j = rows[k], cols[k]
         posdiff.append(math.sqrt((x1[np.ndarray.item(i)] - x2[np.ndarray.item(j)]) ** 2 +
                                  (y1[np.ndarray.item(i)] - y2[np.ndarray.item(j)]) ** 2))
     return posdiff
@@ -771,8 +869,9 @@ def cal_vectordifferencealongpath(data1,
     # initialize list to hold individual vector differences
     vectordiff = []
     # calculate vector differences along path
+    rows, cols = path_indices(path, M_assignment)
     for k in range(0, len(path)):
-        i, j = np.where(M_assignment == path[k])
+        i, j = rows[k], cols[k]
         vectordiff.append(np.sqrt((x1[np.ndarray.item(i)] - x2[np.ndarray.item(j)]) ** 2 +
                                   (y1[np.ndarray.item(i)] - y2[np.ndarray.item(j)]) ** 2))
     return vectordiff
@@ -882,34 +981,59 @@ def docomparison(fixation_vectors1,
     >>> print(results)
     >>> [[0.95075847681364678, 0.95637548674423822, 0.94082367355291008, 0.94491164030498609, 0.78260869565217384]]
     """
-    # initialize result vector
-    scanpathcomparisons = []
-    # check if fixation vectors/scanpaths are long enough
-    if (len(fixation_vectors1) >= 3) & (len(fixation_vectors2) >= 3):
-        # get the data into a geometric representation
-        subj1 = gen_scanpath_structure(fixation_vectors1)
-        subj2 = gen_scanpath_structure(fixation_vectors2)
-        if grouping:
-            # simplify the data
-            subj1 = simplify_scanpath(subj1, TAmp, TDir, TDur)
-            subj2 = simplify_scanpath(subj2, TAmp, TDir, TDur)
-        # create M, a matrix of all vector pairings length differences (weights)
-        M = cal_vectordifferences(subj1, subj2)
-        # initialize a matrix of size M for a matrix of nodes
-        szM = np.shape(M)
-        M_assignment = np.arange(szM[0] * szM[1]).reshape(szM[0], szM[1])
-        # create a weighted graph of all possible connections per Node, and their weight
-        weightedGraph = createdirectedgraph(szM, M, M_assignment)
-        # find the shortest path (= lowest sum of weights) through the graph
-        path, dist = dijkstra(weightedGraph, 0, szM[0] * szM[1] - 1)
-        # compute similarities on alinged scanpaths and normalize them
-        unnormalised = getunnormalised(subj1, subj2, path, M_assignment)
-        normal = normaliseresults(unnormalised, sz)
-        scanpathcomparisons.append(normal)
-    # return nan as result if at least one scanpath it too short
-    else:
-        scanpathcomparisons.append(np.repeat(np.nan, 5))
-    return scanpathcomparisons
+    return docomparison_batch([(fixation_vectors1, fixation_vectors2)], sz=sz, grouping=grouping, TDir=TDir,
+                              TDur=TDur, TAmp=TAmp)[0]
+
+
+def docomparison_batch(fixation_vector_pairs,
+                       sz=[1280, 720],
+                       grouping=False,
+                       TDir=0.0,
+                       TDur=0.0,
+                       TAmp=0.0
+                       ):
+    """Compare many pairs of scanpaths on five similarity dimensions.
+
+    The shortest paths of all pairs are found together by shortest_paths.
+
+    :param: fixation_vector_pairs: list of (fixation_vectors1, fixation_vectors2) pairs of n x 3 fixation
+        vectors, see docomparison
+    :param: sz, grouping, TDir, TDur, TAmp: see docomparison
+
+    :return: list of the results of docomparison for every pair
+    """
+    results = [None] * len(fixation_vector_pairs)
+    subjects = []
+    Ms = []
+    for idx, (fixation_vectors1, fixation_vectors2) in enumerate(fixation_vector_pairs):
+        # check if fixation vectors/scanpaths are long enough
+        if (len(fixation_vectors1) >= 3) & (len(fixation_vectors2) >= 3):
+            # get the data into a geometric representation
+            subj1 = gen_scanpath_structure(fixation_vectors1)
+            subj2 = gen_scanpath_structure(fixation_vectors2)
+            if grouping:
+                # simplify the data
+                subj1 = simplify_scanpath(subj1, TAmp, TDir, TDur)
+                subj2 = simplify_scanpath(subj2, TAmp, TDir, TDur)
+            # create M, a matrix of all vector pairings length differences (weights)
+            subjects.append((idx, subj1, subj2))
+            Ms.append(cal_vectordifferences(subj1, subj2))
+        # return nan as result if at least one scanpath it too short
+        else:
+            results[idx] = [np.repeat(np.nan, 5)]
+
+    if len(Ms) > 0:
+        # find the shortest paths (= lowest sum of weights) through the grids of all pairs
+        paths, _ = shortest_paths(Ms)
+        for (idx, subj1, subj2), M, path in zip(subjects, Ms, paths):
+            # initialize a matrix of size M for a matrix of nodes
+            szM = np.shape(M)
+            M_assignment = np.arange(szM[0] * szM[1]).reshape(szM[0], szM[1])
+            # compute similarities on alinged scanpaths and normalize them
+            unnormalised = getunnormalised(subj1, subj2, path, M_assignment)
+            normal = normaliseresults(unnormalised, sz)
+            results[idx] = [normal]
+    return results
 
 
 # def main(args=sys.argv):
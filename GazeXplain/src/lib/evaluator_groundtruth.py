@@ -20,9 +20,9 @@ import random
 import tempfile
 from json import encoder
 
-from torch.utils.data import DataLoader
 
 from lib.dataset.dataset import UnifiedScanpath
+from lib.dataset.dataloader import build_dataloader
 from lib.evaluation.evaluator import Evaluator
 
 from accelerate.utils import tqdm
@@ -48,7 +48,8 @@ def get_evaluation(accelerator, data_loader, opt):
             "COCO-TP": 2,
             "COCO-TA": 3,
         }
-        json_gt_scanpaths = data_loader.dataset.fixations
+        # plain dicts, the coordinates are normalized in place below
+        json_gt_scanpaths = [dict(_) for _ in data_loader.dataset.fixations]
 
         # normalize data
         # reshape to the same size 384 x 512
@@ -317,14 +318,7 @@ def eval(accelerator, opt, split='dev'):
     """
     eval_dataset = UnifiedScanpath(split=split, opt=opt)
 
-    eval_dataloader = DataLoader(
-        dataset=eval_dataset,
-        batch_size=opt.test_batch,
-        shuffle=False,
-        num_workers=4,
-        collate_fn=eval_dataset.collate_func,
-        drop_last=False
-    )
+    eval_dataloader = build_dataloader(eval_dataset, opt, batch_size=opt.test_batch, shuffle=False, drop_last=False)
 
     # Prepare everything
     # There is no specific order to remember, we just need to unpack the objects in the same order we gave them to the
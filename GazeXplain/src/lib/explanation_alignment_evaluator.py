@@ -18,14 +18,15 @@ import copy
 import tempfile
 from json import encoder
 
-from torch.utils.data import DataLoader
 from transformers import BertTokenizerFast
 
 from lib.dataset.dataset import UnifiedScanpath
+from lib.dataset.dataloader import build_dataloader, ImageGroupedSampler
 from lib.evaluation.evaluator import Evaluator
 
 from lib.models.models import Transformer
 from lib.models.gazeformer_explanation_alignment import gazeformer
+from lib.models.quantization import quantize_dynamic_int8, quantization_report
 
 from accelerate.utils import tqdm
 
@@ -55,7 +56,8 @@ def get_prediction(accelerator, model, data_loader, opt):
             batch = {k: v if not torch.is_tensor(v) else v.to(accelerator.device) for k, v in batch.items()}
 
             with torch.no_grad():
-                prediction, scanpath_prediction, generated_ids, sampling_prediction, action_masks, duration_masks = model(batch, opt.eval_repeat_num)
+                prediction, scanpath_prediction, generated_ids, sampling_prediction, action_masks, duration_masks = \
+                    model(batch, opt.eval_repeat_num, mode="explanation")
 
             # by default we repeat once for inference
             scanpath_prediction = scanpath_prediction[:, 0]
@@ -130,9 +132,19 @@ def get_prediction(accelerator, model, data_loader, opt):
 
             pbar.update()
 
+    # all scanpaths are scored
+    evaluator.close()
 
     # transform the gather scanpath prediction to JSON format file
     if accelerator.is_main_process:
+        if opt.group_by_image:
+            # the grouped loader visits the scanpaths image by image, put the results back in dataset order
+            order = torch.argsort(torch.stack(idx_batch).cpu()).tolist()
+            prediction_scanpaths, gt_scanpaths, image_sizes, evaluation_scores, idx_batch, dataset_idxes, \
+                all_generated_ids = [[values[_] for _ in order] for values in [
+                    prediction_scanpaths, gt_scanpaths, image_sizes, evaluation_scores, idx_batch, dataset_idxes,
+                    all_generated_ids]]
+
         scanpath_dataset = ["AiR-D", "OSIE", "COCO-TP", "COCO-TA", "COCO-FV"]
         json_prediction_scanpaths = evaluator.transform(prediction_scanpaths)
         idx_list = torch.stack(idx_batch).cpu().numpy().tolist()
@@ -398,20 +410,30 @@ def get_prediction(accelerator, model, data_loader, opt):
     else:
         return None, None
 
+def cache_task_embeddings(accelerator, model, eval_dataset, opt):
+    if opt.task_embedding_cache:
+        # the task descriptions of the split are known up front, embed them once with the loaded weights
+        texts = sorted(eval_dataset.task_token_cache.text2row)
+        task_input = {k: v.to(accelerator.device) for k, v in eval_dataset.task_token_cache(texts).items()}
+        accelerator.unwrap_model(model).cache_task_embeddings(texts, task_input)
+
+
 def eval(accelerator, model_path, opt, split='dev', save_path=None):
     """
     Evaluate a trained model on either dev or test.
     """
     eval_dataset = UnifiedScanpath(split=split, opt=opt)
 
-    eval_dataloader = DataLoader(
-        dataset=eval_dataset,
-        batch_size=opt.test_batch,
-        shuffle=False,
-        num_workers=4,
-        collate_fn=eval_dataset.collate_func,
-        drop_last=False
-    )
+    # batches of scanpaths on the same images share the encoder memory
+    sampler = ImageGroupedSampler(eval_dataset) if opt.group_by_image else None
+    eval_dataloader = build_dataloader(eval_dataset, opt, batch_size=opt.test_batch, shuffle=False, drop_last=False,
+                                       sampler=sampler)
+
+    if opt.quantize_int8 and opt.quantization_report and opt.sample_seed is None:
+        # the float and the int8 model have to score the same scanpath samples for the deltas to be meaningful
+        opt.sample_seed = 0
+        accelerator.print("Draw the scanpath samples of the quantization report with --sample_seed {}".format(
+            opt.sample_seed))
 
     # Instantiate the model (we build the model here so that the seed also control new weights initialization)
     transformer = Transformer(args=opt)
@@ -437,7 +459,29 @@ def eval(accelerator, model_path, opt, split='dev', save_path=None):
 
     model.eval()
 
+    float_metrics_dict = None
+    float_time = None
+    if opt.quantize_int8:
+        if opt.quantization_report:
+            # the float model first, on the same seeded scanpath samples
+            cache_task_embeddings(accelerator, model, eval_dataset, opt)
+            start = time.time()
+            _, float_metrics_dict = get_prediction(accelerator, model, eval_dataloader, opt)
+            float_time = time.time() - start
+            accelerator.unwrap_model(model).sampling.generators = {}
+        accelerator.print("Quantize the Linear layers to int8")
+        quantize_dynamic_int8(accelerator.unwrap_model(model))
+
+    cache_task_embeddings(accelerator, model, eval_dataset, opt)
+    start = time.time()
     predict_results, dataset_cur_metrics_dict = get_prediction(accelerator, model, eval_dataloader, opt)
+    eval_time = time.time() - start
+
+    report = None
+    if float_metrics_dict is not None and accelerator.is_main_process:
+        report = quantization_report(float_metrics_dict, dataset_cur_metrics_dict)
+        report["evaluation_time"] = {"fp32": float_time, "int8": eval_time}
+        report["sample_seed"] = opt.sample_seed
 
     if save_path and accelerator.is_main_process:
         if not os.path.exists(save_path):
@@ -446,6 +490,16 @@ def eval(accelerator, model_path, opt, split='dev', save_path=None):
             json.dump(dataset_cur_metrics_dict, f, indent=2)
         with open(os.path.join(save_path, "predictions.json"), "w") as f:
             json.dump(predict_results, f, indent=2)
+        if report is not None:
+            with open(os.path.join(save_path, "quantization_report.json"), "w") as f:
+                json.dump(report, f, indent=2)
+
+    if report is not None:
+        accelerator.print("-" * 40)
+        accelerator.print("{:30}  {:>8} {:>8} {:>8}".format("int8 quantization (all)", "fp32", "int8", "delta"))
+        for key, value in report["all"].items():
+            accelerator.print("{:30}: {:8.3f} {:8.3f} {:8.3f}".format(key, value["fp32"], value["int8"], value["delta"]))
+        accelerator.print("{:30}: {:8.1f} {:8.1f}".format("evaluation time (s)", float_time, eval_time))
 
     if accelerator.is_main_process:
         for dataset, cur_metrics in dataset_cur_metrics_dict.items():
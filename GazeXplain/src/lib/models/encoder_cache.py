@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+def _num_bytes(tensor):
+    return tensor.numel() * tensor.element_size()
+
+
+class EncoderMemoryCache(object):
+    """
+    Least recently used cache of the transformer encoder memory of images, bounded by the bytes it holds.
+
+    The encoder memory only depends on the image features, so the scanpaths of all subjects and tasks of an
+    image can share it. Entries are ``[H * W, C]`` tensors detached from the graph, so the cache is only valid
+    for inference with fixed weights and has to be cleared whenever the weights change.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        memory = self.entries.get(key)
+        if memory is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return memory
+
+    def put(self, key, memory):
+        # a slice of a batch would keep the memory of the whole batch alive
+        memory = memory.detach().contiguous()
+        if _num_bytes(memory) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.num_bytes -= _num_bytes(self.entries.pop(key))
+        self.entries[key] = memory
+        self.num_bytes += _num_bytes(memory)
+        while self.num_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.num_bytes -= _num_bytes(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
@@ -3,22 +3,53 @@ import torch.nn.functional as F
 from torch import nn, Tensor
 from transformers.models.blip.modeling_blip_text import BlipTextLMHeadModel
 
-from lib.models.models import ResNetCOCO
+from lib.models.models import ResNetCOCO, multihead_attention, attention_weights
 from lib.models.positional_encodings import PositionEmbeddingSine2d
 import math
 from typing import Optional, List
 
 from lib.models.sample.sampling import Sampling
+from lib.models.encoder_cache import EncoderMemoryCache
 from transformers import AutoTokenizer, RobertaModel, BertModel, AutoModelForSequenceClassification, BertTokenizerFast, \
     BlipProcessor, BlipForConditionalGeneration
 
 eps = 1e-16
 
+# what gazeformer.inference computes: the sampled scanpaths only, the scanpaths and their generated explanations, or
+# in addition the teacher-forced ground-truth explanations needed by the losses of the policy gradient stage
+INFERENCE_MODES = ("scanpath", "explanation", "full")
+
+
+def gather_fixation_features(feature, action_index, batch_index=None):
+    """
+    Feature of every fixated action without repeating the feature map along the fixations.
+
+    ``feature`` is a sequence-first ``[A, N, C]`` map, ``action_index`` the ``[B, T]`` action of every fixation
+    and ``batch_index`` the ``[B]`` column of ``feature`` each row of ``action_index`` belongs to (``B == N`` and
+    the identity when omitted). Returns the ``[B, T, C]`` gathered features.
+    """
+    if batch_index is None:
+        batch_index = torch.arange(action_index.shape[0], device=action_index.device)
+    return feature[action_index, batch_index.unsqueeze(1)]
+
+
+def select_slots(values, slot_index):
+    # rows of the explanation slots kept by the compact mode
+    return values if slot_index is None else values[slot_index]
+
+
+def scatter_slots(values, slot_index, num_slots):
+    # put the results of the kept explanation slots back in place, the skipped slots are zero
+    if slot_index is None:
+        return values
+    return values.new_zeros((num_slots,) + values.shape[1:]).index_copy(0, slot_index, values)
+
 
 class CrossAttentionPredictor(nn.Module):
-    def __init__(self, nhead=8, dropout=0.4, d_model=512):
+    def __init__(self, nhead=8, dropout=0.4, d_model=512, attention_backend="multihead"):
         super(CrossAttentionPredictor, self).__init__()
         self.nhead = nhead
+        self.attention_backend = attention_backend
         self.dropout = nn.Dropout(dropout)
         self.d_model = d_model
         self.norm = nn.LayerNorm(d_model)
@@ -44,14 +75,20 @@ class CrossAttentionPredictor(nn.Module):
                 querypos_embed: Optional[Tensor] = None,
                 patchpos_embed: Optional[Tensor] = None):
         q = k = v = self.with_pos_embed(tgt, querypos_embed)
-        tgt2 = self.self_attn(q, k, value=v, attn_mask=tgt_mask,
-                              key_padding_mask=tgt_key_padding_mask)[0]
+        tgt2 = multihead_attention(self.self_attn, q, k, v, attn_mask=tgt_mask,
+                                   key_padding_mask=tgt_key_padding_mask, backend=self.attention_backend)
         tgt = tgt + self.dropout(tgt2)
         tgt = self.norm(tgt)
-        att = self.multihead_attn(query=self.with_pos_embed(tgt, querypos_embed),
-                                  key=patchpos_embed(memory),
-                                  value=memory, attn_mask=memory_mask,
-                                  key_padding_mask=memory_key_padding_mask)[1]
+        if self.attention_backend == "sdpa":
+            # only the attention weights are used, the value and output projections are skipped
+            att = attention_weights(self.multihead_attn, self.with_pos_embed(tgt, querypos_embed),
+                                    patchpos_embed(memory), attn_mask=memory_mask,
+                                    key_padding_mask=memory_key_padding_mask)
+        else:
+            att = self.multihead_attn(query=self.with_pos_embed(tgt, querypos_embed),
+                                      key=patchpos_embed(memory),
+                                      value=memory, attn_mask=memory_mask,
+                                      key_padding_mask=memory_key_padding_mask)[1]
         att_logit = torch.log(att + eps)
 
         return att_logit
@@ -88,7 +125,8 @@ class gazeformer(nn.Module):
 
         self.softmax = nn.LogSoftmax(dim=-1)
         # projection for first fixation encoding
-        self.attention_map_predictor = CrossAttentionPredictor(self.args.nhead, dropout, self.args.hidden_dim)
+        self.attention_map_predictor = CrossAttentionPredictor(self.args.nhead, dropout, self.args.hidden_dim,
+                                                               attention_backend=self.args.attention_backend)
 
         # sampling modules
         self.sampling = Sampling(args=args)
@@ -110,6 +148,12 @@ class gazeformer(nn.Module):
         self.visual_projection = nn.Sequential(nn.Linear(self.hidden_dim, self.hidden_dim), nn.ReLU())
         self.language_projection = nn.Sequential(nn.Linear(self.args.lm_hidden_dim, self.hidden_dim), nn.ReLU())
 
+        # encoder memory of the recently seen images, only used for inference without gradients
+        self.encoder_cache = EncoderMemoryCache(self.args.encoder_cache_mb * 2 ** 20) \
+            if self.args.encoder_cache_mb > 0 else None
+        # RoBERTa embedding of every task description seen so far, only used for inference without gradients
+        self.task_embedding_cache = {} if self.args.task_embedding_cache else None
+
         self.init_weights()
 
 
@@ -149,15 +193,103 @@ class gazeformer(nn.Module):
         eps = torch.randn_like(std)
         return mu + eps * std
 
-    def forward(self, batch: List[Tensor or List], sample_num: int=1, scst: bool=False, detail: bool=False):
+    def clear_caches(self):
+        # the cached encoder memory and task embeddings are stale as soon as the weights may have changed
+        if self.encoder_cache is not None:
+            self.encoder_cache.clear()
+        if self.task_embedding_cache is not None:
+            self.task_embedding_cache.clear()
+
+    def train(self, mode: bool=True):
+        self.clear_caches()
+        return super(gazeformer, self).train(mode)
+
+    def cache_task_embeddings(self, texts, task_input):
+        # embed the task descriptions once, e.g. the ones of a whole split right after loading a checkpoint
+        with torch.no_grad():
+            pooler_output = self.roberta(**task_input).pooler_output
+        for text, embedding in zip(texts, pooler_output):
+            self.task_embedding_cache[text] = embedding
+
+    def task_embedding(self, batch):
+        """
+        ``[N, C]`` RoBERTa embedding of the task of every scanpath, looked up in the task embedding cache for
+        inference without gradients.
+        """
+        if self.task_embedding_cache is None or torch.is_grad_enabled():
+            return self.roberta(**batch["task_input"]).pooler_output
+        texts = batch["task"]
+        missing = [text for text in dict.fromkeys(texts) if text not in self.task_embedding_cache]
+        if len(missing) > 0:
+            rows = [texts.index(text) for text in missing]
+            self.cache_task_embeddings(missing, {k: v[rows] for k, v in batch["task_input"].items()})
+        return torch.stack([self.task_embedding_cache[text] for text in texts])
+
+    def image_memory(self, src, image_keys):
+        """
+        ``[H * W, N, C]`` encoder memory of a batch, every distinct image is encoded once and looked up in the
+        encoder cache first.
+        """
+        memory = {}
+        for key in image_keys:
+            if key not in memory:
+                memory[key] = self.encoder_cache.get(key)
+        missing = [key for key, value in memory.items() if value is None]
+        if len(missing) > 0:
+            rows = [image_keys.index(key) for key in missing]
+            encoded = self.transformer.encoder.encode_image(src[rows], patchpos_embed=self.patchpos_embed)
+            for column, key in enumerate(missing):
+                memory[key] = encoded[:, column]
+                self.encoder_cache.put(key, memory[key])
+        return torch.stack([memory[key] for key in image_keys], dim=1)
+
+    def forward(self, batch: List[Tensor or List], sample_num: int=1, scst: bool=False, detail: bool=False,
+                mode: str="full"):
         if self.training:
             prediction = self.training_process(batch)
         else:
-            prediction = self.inference(batch, sample_num, scst, detail)
+            prediction = self.inference(batch, sample_num, scst, detail, mode)
         # prediction = self.training_process(batch)
 
         return prediction
 
+    def target_action_index(self, batch):
+        # [N, T] ground-truth action indices, 0 denotes the termination action
+        if "target_action" in batch:
+            return batch["target_action"]
+        return torch.argmax(batch["target_scanpath"], dim=-1)
+
+    def explanation_slots(self, mask):
+        """
+        Flat indices of the explanation slots that are run through BLIP, ``None`` when all of them are.
+
+        Without ``--compact_explanations`` every one of the ``B * T`` slots is decoded. In the compact mode only the
+        slots with a non-zero ``mask`` (real explanations in training, fixations of the sampled scanpaths in inference)
+        are packed into the language-model batch and the results are scattered back with :func:`scatter_slots`.
+        """
+        if not self.args.compact_explanations:
+            return None
+        slot_index = torch.nonzero(mask.reshape(-1) != 0, as_tuple=True)[0]
+        if slot_index.shape[0] == 0 or slot_index.shape[0] == mask.numel():
+            return None
+        return slot_index
+
+    def explanation_input(self, explanation, slot_index):
+        # token ids of the decoded slots, cut to the longest of them
+        if slot_index is None:
+            return explanation.input_ids, explanation.attention_mask
+        attention_mask = explanation.attention_mask[slot_index]
+        length = int(attention_mask.sum(1).max())
+        return explanation.input_ids[slot_index, :length], attention_mask[:, :length]
+
+    def encoder_hidden_states(self, aggr_fixation_feature, task):
+        # [B, T, C] fixation features and [B, C'] task features -> [B * T, 2, lm_hidden_dim] BLIP cross-attention
+        # inputs, the transformed fixation feature followed by the task feature of its image
+        transform_feature = self.hidden_state_transform(self.fixation_emb + aggr_fixation_feature)
+        task_feature = (self.task_emb + task).unsqueeze(1).expand_as(transform_feature)
+        encoder_hidden_states = torch.stack([transform_feature, task_feature], dim=2)
+        return encoder_hidden_states.view(-1, encoder_hidden_states.shape[-2], encoder_hidden_states.shape[-1])
+
     def training_process(self, batch):
         src = batch["image_feature"]
 
@@ -196,10 +328,8 @@ class gazeformer(nn.Module):
 
         # visual feature gt alignment from resnet pretrain feature
         visual_feature_resnet = torch.cat([src.new_zeros((src.shape[0], 1, src.shape[-1])), src], dim=1).permute(1, 0, 2)
-        target_scanpath_index = \
-            torch.argmax(batch["target_scanpath"], dim=-1, keepdim=True).repeat(1, 1,visual_feature_resnet.shape[-1]).unsqueeze(0)
-        fixated_visual_feature_resnet = torch.gather(
-            visual_feature_resnet.unsqueeze(2).repeat(1, 1, target_scanpath_index.shape[2], 1), dim=0, index=target_scanpath_index).squeeze(0)
+        target_action = self.target_action_index(batch)
+        fixated_visual_feature_resnet = gather_fixation_features(visual_feature_resnet, target_action)
         fixated_visual_feature_resnet = fixated_visual_feature_resnet / (
                     torch.norm(fixated_visual_feature_resnet, p=2, dim=2, keepdim=True) + eps)
         resnet_visual_similarity = torch.matmul(fixated_visual_feature_resnet, fixated_visual_feature_resnet.transpose(1, 2))
@@ -208,8 +338,7 @@ class gazeformer(nn.Module):
         cat_memory = torch.cat([self.termination_feature.repeat(1, memory.shape[1], 1), memory], dim=0)
 
         # for explanation
-        target_scanpath_index = torch.argmax(batch["target_scanpath"], dim=-1, keepdim=True).repeat(1, 1, cat_memory.shape[-1]).unsqueeze(0)
-        aggr_fixation_feature = torch.gather(cat_memory.unsqueeze(2).repeat(1, 1, target_scanpath_index.shape[2], 1), dim=0, index=target_scanpath_index).squeeze(0)
+        aggr_fixation_feature = gather_fixation_features(cat_memory, target_action)
 
         # visual project feature for alignment
         aggr_fixation_projection_feature = self.visual_projection(aggr_fixation_feature)
@@ -219,28 +348,24 @@ class gazeformer(nn.Module):
         # encoder_hidden_states = self.hidden_state_transform(
         #     torch.cat([self.image_emb + memory, self.fixation_emb + aggr_fixation_feature], dim=0).permute(1, 0, 2))
 
-        encoder_hidden_state_list = []
-        for idx in range(aggr_fixation_feature.shape[0]):
-            transform_feature = self.hidden_state_transform(torch.stack([self.fixation_emb + aggr_fixation_feature[idx]])).permute(1, 0, 2)
-            transform_feature = torch.cat([transform_feature, (self.task_emb + task[idx].unsqueeze(0)).unsqueeze(1).repeat(transform_feature.shape[0], 1, 1)], dim=1)
-            encoder_hidden_state_list.append(transform_feature)
-        encoder_hidden_states = torch.stack(encoder_hidden_state_list)
-        encoder_hidden_states = encoder_hidden_states.view(-1, encoder_hidden_states.shape[-2], encoder_hidden_states.shape[-1])
+        encoder_hidden_states = self.encoder_hidden_states(aggr_fixation_feature, task)
 
         # [batch, C, Feature]
-        explanation = batch["explanation"]
+        slot_index = self.explanation_slots(batch["explanation_mask"])
+        input_ids, attention_mask = self.explanation_input(batch["explanation"], slot_index)
         dec_input = {
-            "input_ids": explanation.input_ids,
-            "labels": explanation.input_ids,
-            "attention_mask": explanation.attention_mask,
-            "encoder_hidden_states": encoder_hidden_states,
+            "input_ids": input_ids,
+            "labels": input_ids,
+            "attention_mask": attention_mask,
+            "encoder_hidden_states": select_slots(encoder_hidden_states, slot_index),
             "output_hidden_states": True
             # "reduction": "none"
         }
         dec_outputs = self.blip_model(**dec_input)
 
         # Tuple of torch.FloatTensor (one for the output of the embeddings, if the model has an embedding layer, + one for the output of each layer)
-        cls_language_feature = dec_outputs.hidden_states[-1][:, 0]
+        cls_language_feature = scatter_slots(dec_outputs.hidden_states[-1][:, 0], slot_index,
+                                             encoder_hidden_states.shape[0])
 
         # language project feature for alignment
         cls_language_feature_projection = self.language_projection(cls_language_feature)
@@ -274,12 +399,37 @@ class gazeformer(nn.Module):
 
         return prediction
 
-    def inference(self, batch, sample_num, scst, detail=False):
-        src = batch["image_feature"]
+    def teacher_forced_explanation(self, batch, memory, task):
+        # language-model pass over the ground-truth explanations, fed with the features of the ground-truth fixations
+        # cat the memory feature
+        cat_memory = torch.cat([self.termination_feature.repeat(1, memory.shape[1], 1), memory], dim=0)
 
-        outputs = self.roberta(**batch["task_input"])
-        task = outputs.pooler_output
+        # for explanation
+        aggr_fixation_feature = gather_fixation_features(cat_memory, self.target_action_index(batch))
 
+        # encoder_hidden_states = self.hidden_state_transform(
+        #     torch.cat([self.image_emb + memory, self.fixation_emb + aggr_fixation_feature], dim=0).permute(1, 0, 2))
+
+        encoder_hidden_states = self.encoder_hidden_states(aggr_fixation_feature, task)
+
+        # [batch, C, Feature]
+        slot_index = self.explanation_slots(batch["explanation_mask"])
+        input_ids, attention_mask = self.explanation_input(batch["explanation"], slot_index)
+        dec_input = {
+            "input_ids": input_ids,
+            "labels": input_ids,
+            "attention_mask": attention_mask,
+            "encoder_hidden_states": select_slots(encoder_hidden_states, slot_index),
+            "output_hidden_states": True
+            # "reduction": "none"
+        }
+        return self.blip_model(**dec_input)
+
+    def scanpath_distribution(self, src, task, memory=None):
+        """
+        Action probabilities and duration parameters of the scanpath of every image, the part of the inference
+        before the sampling. ``memory`` is the encoder memory when it was computed beforehand.
+        """
         tgt_input = src.new_zeros(
             (self.max_len, src.size(0), self.hidden_dim))  # Notice that this where we convert target input to zeros
         # a  = src.detach().cpu().numpy()
@@ -287,7 +437,7 @@ class gazeformer(nn.Module):
         memory, memory_task, outs = self.transformer(src=src, tgt=tgt_input, tgt_mask=None, tgt_key_padding_mask=None,
                                              task=task,
                                              querypos_embed=self.querypos_embed.weight.unsqueeze(1),
-                                             patchpos_embed=self.patchpos_embed)
+                                             patchpos_embed=self.patchpos_embed, memory=memory)
 
         outs = self.dropout(outs)
         # get Gaussian parameters for (t)
@@ -311,40 +461,29 @@ class gazeformer(nn.Module):
         if self.training == False:
             aggr_z = F.softmax(aggr_z, -1)
 
-        # cat the memory feature
-        cat_memory = torch.cat([self.termination_feature.repeat(1, memory.shape[1], 1), memory], dim=0)
+        return memory, aggr_action_map, aggr_z, t_log_normal_mu, t_log_normal_sigma2
 
-        # for explanation
-        target_scanpath_index = torch.argmax(batch["target_scanpath"], dim=-1, keepdim=True).repeat(1, 1, cat_memory.shape[-1]).unsqueeze( 0)
-        aggr_fixation_feature = torch.gather(cat_memory.unsqueeze(2).repeat(1, 1, target_scanpath_index.shape[2], 1),
-                                             dim=0, index=target_scanpath_index).squeeze(0)
+    def inference(self, batch, sample_num, scst, detail=False, mode="full"):
+        """
+        Sample ``sample_num`` scanpaths per image and explain them.
 
-        # encoder_hidden_states = self.hidden_state_transform(
-        #     torch.cat([self.image_emb + memory, self.fixation_emb + aggr_fixation_feature], dim=0).permute(1, 0, 2))
-
-        encoder_hidden_state_list = []
-        for idx in range(aggr_fixation_feature.shape[0]):
-            transform_feature = self.hidden_state_transform(
-                torch.stack([self.fixation_emb + aggr_fixation_feature[idx]])).permute(1, 0, 2)
-            transform_feature = torch.cat([transform_feature,
-                                           (self.task_emb + task[idx].unsqueeze(0)).unsqueeze(1).repeat(transform_feature.shape[0], 1, 1)], dim=1)
-            encoder_hidden_state_list.append(transform_feature)
-        encoder_hidden_states = torch.stack(encoder_hidden_state_list)
-        encoder_hidden_states = encoder_hidden_states.view(-1, encoder_hidden_states.shape[-2],
-                                                           encoder_hidden_states.shape[-1])
+        ``mode`` selects what is computed, see ``INFERENCE_MODES``. ``"scanpath"`` returns ``None`` in place of the
+        generated ids and skips the language model, ``"explanation"`` skips the teacher-forced pass over the
+        ground-truth explanations (``prediction["dec_outputs"]``) that only the policy gradient losses use and
+        ``"full"`` computes everything.
+        """
+        if mode not in INFERENCE_MODES:
+            raise ValueError("unknown inference mode {}, expected one of {}".format(mode, INFERENCE_MODES))
+        src = batch["image_feature"]
 
-        # [batch, C, Feature]
-        explanation = batch["explanation"]
-        dec_input = {
-            "input_ids": explanation.input_ids,
-            "labels": explanation.input_ids,
-            "attention_mask": explanation.attention_mask,
-            "encoder_hidden_states": encoder_hidden_states,
-            "output_hidden_states": True
-            # "reduction": "none"
-        }
-        lm_dec_outputs = self.blip_model(**dec_input)
+        task = self.task_embedding(batch)
 
+        # without gradients the image memory can come from the encoder cache
+        memory = None
+        if self.encoder_cache is not None and not torch.is_grad_enabled() and "image_key" in batch:
+            memory = self.image_memory(src, batch["image_key"])
+        memory, aggr_action_map, aggr_z, t_log_normal_mu, t_log_normal_sigma2 = \
+            self.scanpath_distribution(src, task, memory)
 
         # predict the scanpath first
         prediction = {}
@@ -356,174 +495,142 @@ class gazeformer(nn.Module):
         prediction['log_normal_sigma2'] = t_log_normal_sigma2.permute(1, 0, 2).squeeze(-1)
         # [N, T, H, W]
         prediction["action_map"] = aggr_action_map.view(-1, self.max_len, self.spatial_dim[0], self.spatial_dim[1])
-        # CausalLMOutputWithCrossAttention
-        prediction["dec_outputs"] = lm_dec_outputs
-
-        # sampling results
-        scanpath_prediction_list = []
-        scanpath_length_list = []
-        durations_list = []
-        selected_actions_probs_list = []
-        selected_actions_list = []
-        action_masks_list = []
-        duration_masks_list = []
-        generated_ids_list = []
-        dec_output_loss_list = []
-        generated_idx_logit_list = []
-        # alignment lst
-        resnet_visual_similarity_list = []
-        visual_similarity_list = []
-        language_similarity_list = []
-        multimodal_similarity_list = []
-        explanation_similarity_mask_list = []
-        for idx in range(sample_num):
-            sampling_prediction = self.sampling.random_sample(prediction)
-            scanpath_prediction, action_masks, duration_masks = self.sampling.generate_scanpath(
-                src, sampling_prediction)
-            scanpath_prediction_list.append(scanpath_prediction)
-            scanpath_length_list.append(sampling_prediction["scanpath_length"])
-            durations_list.append(sampling_prediction["durations"])
-            selected_actions_probs_list.append(sampling_prediction["selected_actions_probs"])
-            selected_actions_list.append(sampling_prediction["selected_actions"])
-            action_masks_list.append(action_masks)
-            duration_masks_list.append(duration_masks)
-
-            explanation_similarity_mask = duration_masks.new_ones(duration_masks.shape[0], duration_masks.shape[1], duration_masks.shape[1])
-            for index in range(duration_masks.shape[0]):
-                explanation_similarity_mask[index, duration_masks[index]==0] = 0
-                explanation_similarity_mask[index, :, duration_masks[index] == 0] = 0
-            explanation_similarity_mask_list.append(explanation_similarity_mask)
-
-            # visual feature gt alignment from resnet pretrain feature
-            visual_feature_resnet = torch.cat([src.new_zeros((src.shape[0], 1, src.shape[-1])), src], dim=1).permute(1, 0, 2)
-            selected_action_index = (sampling_prediction["selected_actions"] * duration_masks). \
-                unsqueeze(-1).repeat(1, 1, visual_feature_resnet.shape[-1]).unsqueeze(0).long()
-            fixated_visual_feature_resnet = torch.gather(
-                visual_feature_resnet.unsqueeze(2).repeat(1, 1, selected_action_index.shape[2], 1), dim=0,
-                index=selected_action_index).squeeze(0)
-            fixated_visual_feature_resnet = fixated_visual_feature_resnet / (
-                    torch.norm(fixated_visual_feature_resnet, p=2, dim=2, keepdim=True) + eps)
-            resnet_visual_similarity = torch.matmul(fixated_visual_feature_resnet, fixated_visual_feature_resnet.transpose(1, 2))
-            resnet_visual_similarity_list.append(resnet_visual_similarity)
-
-            # captioning generation
-            # cat the memory feature
-            cat_memory = torch.cat([self.termination_feature.repeat(1, memory.shape[1], 1), memory], dim=0)
-
-            # for explanation
-            selected_action_index = (sampling_prediction["selected_actions"] * duration_masks).\
-                unsqueeze(-1).repeat(1, 1, cat_memory.shape[-1]).unsqueeze(0).long()
-            aggr_fixation_feature = torch.gather(
-                cat_memory.unsqueeze(2).repeat(1, 1, selected_action_index.shape[2], 1),
-                dim=0, index=selected_action_index).squeeze(0)
-
-            # visual project feature for alignment
-            aggr_fixation_projection_feature = self.visual_projection(aggr_fixation_feature)
-            aggr_fixation_projection_feature = aggr_fixation_projection_feature / (
-                        torch.norm(aggr_fixation_projection_feature, p=2, dim=2, keepdim=True) + eps)
-            visual_similarity = torch.matmul(aggr_fixation_projection_feature,
-                                             aggr_fixation_projection_feature.transpose(1, 2))
-            visual_similarity_list.append(visual_similarity)
-
-            # for encoder hidden
-            encoder_hidden_state_list = []
-            for idx in range(aggr_fixation_feature.shape[0]):
-                transform_feature = self.hidden_state_transform(
-                    torch.stack([self.fixation_emb + aggr_fixation_feature[idx]])).permute(1, 0, 2)
-                transform_feature = torch.cat([transform_feature,
-                                               (self.task_emb + task[idx].unsqueeze(0)).unsqueeze(1).repeat(
-                                                   transform_feature.shape[0], 1, 1)], dim=1)
-                encoder_hidden_state_list.append(transform_feature)
-            encoder_hidden_states = torch.stack(encoder_hidden_state_list)
-            encoder_hidden_states = encoder_hidden_states.view(-1, encoder_hidden_states.shape[-2],
-                                                               encoder_hidden_states.shape[-1])
-
-            # [batch, C, Feature]
+        if mode == "full":
+            # CausalLMOutputWithCrossAttention
+            prediction["dec_outputs"] = self.teacher_forced_explanation(batch, memory, task)
+
+        # sampling results, all the samples are drawn at once
+        # [N, R, T]
+        sampling_prediction = self.sampling.random_sample(prediction, sample_num)
+        scanpath_prediction, action_masks, duration_masks_all = self.sampling.generate_scanpath(src, sampling_prediction)
+        if mode == "scanpath":
+            return prediction, scanpath_prediction, None, sampling_prediction, action_masks, duration_masks_all
+
+        # all the samples are folded into the batch dimension, row n * R + r holds the r-th sample of image n
+        # and every stage below, especially the explanation generation, runs once over N * R * T fixations
+        batch_size, max_len = src.shape[0], self.args.max_length
+        # [N * R, T]
+        selected_actions = sampling_prediction["selected_actions"].reshape(batch_size * sample_num, -1)
+        duration_masks = duration_masks_all.reshape(batch_size * sample_num, -1)
+        # image of every row, the features of an image are shared by its samples instead of being repeated
+        sample_image_index = torch.arange(batch_size, device=src.device).repeat_interleave(sample_num)
+        sample_task = task[sample_image_index]
+        selected_action_index = (selected_actions * duration_masks).long()
+
+        valid_fixations = (duration_masks != 0).to(duration_masks.dtype)
+        explanation_similarity_mask = valid_fixations.unsqueeze(2) * valid_fixations.unsqueeze(1)
+
+        # visual feature gt alignment from resnet pretrain feature
+        visual_feature_resnet = torch.cat([src.new_zeros((src.shape[0], 1, src.shape[-1])), src], dim=1).permute(1, 0, 2)
+        fixated_visual_feature_resnet = gather_fixation_features(visual_feature_resnet, selected_action_index,
+                                                                 sample_image_index)
+        fixated_visual_feature_resnet = fixated_visual_feature_resnet / (
+                torch.norm(fixated_visual_feature_resnet, p=2, dim=2, keepdim=True) + eps)
+        resnet_visual_similarity = torch.matmul(fixated_visual_feature_resnet, fixated_visual_feature_resnet.transpose(1, 2))
+
+        # captioning generation
+        # cat the memory feature
+        cat_memory = torch.cat([self.termination_feature.repeat(1, memory.shape[1], 1), memory], dim=0)
+
+        # for explanation
+        aggr_fixation_feature = gather_fixation_features(cat_memory, selected_action_index, sample_image_index)
+
+        # visual project feature for alignment
+        aggr_fixation_projection_feature = self.visual_projection(aggr_fixation_feature)
+        aggr_fixation_projection_feature = aggr_fixation_projection_feature / (
+                    torch.norm(aggr_fixation_projection_feature, p=2, dim=2, keepdim=True) + eps)
+        visual_similarity = torch.matmul(aggr_fixation_projection_feature,
+                                         aggr_fixation_projection_feature.transpose(1, 2))
+
+        # for encoder hidden
+        encoder_hidden_states = self.encoder_hidden_states(aggr_fixation_feature, sample_task)
+        # the slots after the end of a sampled scanpath are zeroed anyway, the compact mode does not decode them
+        num_slots = encoder_hidden_states.shape[0]
+        slot_index = self.explanation_slots(duration_masks)
+        encoder_hidden_states = select_slots(encoder_hidden_states, slot_index)
+
+        # [batch, C, Feature]
+        dec_input = {
+            "encoder_hidden_states": encoder_hidden_states,
+        }
+        # generation_kwargs = {
+        #     "max_length": self.opt.max_length,
+        #     "num_beams": self.opt.num_beams,
+        #     "num_return_sequences": self.opt.num_return_sequences,
+        #     "early_stopping": True,
+        #     "pad_token_id": self.tokenizer.eos_token_id
+        # }
+        if scst:
+            generation_kwargs = {
+                "do_sample": True,
+                # "top_k": 50,
+                "top_p": 0.95,
+                "max_length": self.args.max_generation_length,
+                "num_return_sequences": 1,
+            }
+        else:
+            decoder_input_ids = self.blip_tokenizer(["[CLS] there" for _ in range(encoder_hidden_states.shape[0])], return_tensors="pt", add_special_tokens=False)
+            decoder_input_ids.to(src.device)
+            dec_input = {
+                "encoder_hidden_states": encoder_hidden_states,
+                "input_ids": decoder_input_ids.input_ids,
+                "attention_mask": decoder_input_ids.attention_mask,
+            }
+            generation_kwargs = {
+                "max_length": self.args.max_generation_length,
+                "num_beams": self.args.num_explanation_beams,
+                "num_return_sequences": 1,
+                "early_stopping": True,
+            }
+        kwargs = {**dec_input, **generation_kwargs}
+        generated_ids = self.blip_model.generate(**kwargs)
+
+        if scst or detail:
+            # with grad version, we use the generated ids to get the output logit and keep the gradient track
             dec_input = {
+                "input_ids": generated_ids,
+                "labels": generated_ids,
+                "attention_mask": generated_ids != 0,
                 "encoder_hidden_states": encoder_hidden_states,
+                "output_hidden_states": True,
+                "reduction": "none"
             }
-            # generation_kwargs = {
-            #     "max_length": self.opt.max_length,
-            #     "num_beams": self.opt.num_beams,
-            #     "num_return_sequences": self.opt.num_return_sequences,
-            #     "early_stopping": True,
-            #     "pad_token_id": self.tokenizer.eos_token_id
-            # }
-            if scst:
-                generation_kwargs = {
-                    "do_sample": True,
-                    # "top_k": 50,
-                    "top_p": 0.95,
-                    "max_length": self.args.max_generation_length,
-                    "num_return_sequences": 1,
-                }
-            else:
-                decoder_input_ids = self.blip_tokenizer(["[CLS] there" for _ in range(encoder_hidden_states.shape[0])], return_tensors="pt", add_special_tokens=False)
-                decoder_input_ids.to(src.device)
-                dec_input = {
-                    "encoder_hidden_states": encoder_hidden_states,
-                    "input_ids": decoder_input_ids.input_ids,
-                    "attention_mask": decoder_input_ids.attention_mask,
-                }
-                generation_kwargs = {
-                    "max_length": self.args.max_generation_length,
-                    "num_beams": self.args.num_explanation_beams,
-                    "num_return_sequences": 1,
-                    "early_stopping": True,
-                }
-            kwargs = {**dec_input, **generation_kwargs}
-            generated_ids = self.blip_model.generate(**kwargs)
-
-
-            if scst or detail:
-                # with grad version, we use the generated ids to get the output logit and keep the gradient track
-                dec_input = {
-                    "input_ids": generated_ids,
-                    "labels": generated_ids,
-                    "attention_mask": generated_ids != 0,
-                    "encoder_hidden_states": encoder_hidden_states,
-                    "output_hidden_states": True,
-                    "reduction": "none"
-                }
-                dec_outputs = self.blip_model(**dec_input)
-                dec_output_loss_list.append(dec_outputs.loss.view(src.shape[0], -1))
-
-                logsoftmax_logits = F.log_softmax(dec_outputs.logits, -1)
-                generated_idx_logit = torch.gather(logsoftmax_logits, index=generated_ids.unsqueeze(-1), dim=-1).squeeze(-1)
-                generated_idx_logit_list.append(generated_idx_logit.view(src.shape[0], self.args.max_length, -1))
-
-                # Tuple of torch.FloatTensor (one for the output of the embeddings, if the model has an embedding layer, + one for the output of each layer)
-                cls_language_feature = dec_outputs.hidden_states[-1][:, 0]
-
-                # language project feature for alignment
-                cls_language_feature_projection = self.language_projection(cls_language_feature)
-                cls_language_feature_projection = cls_language_feature_projection.view(src.shape[0], -1,
-                                                                                       cls_language_feature_projection.shape[-1])
-                cls_language_feature_projection = cls_language_feature_projection / (
-                        torch.norm(cls_language_feature_projection, p=2, dim=2, keepdim=True) + eps)
-                language_similarity = torch.matmul(cls_language_feature_projection,
-                                                   cls_language_feature_projection.transpose(1, 2))
-
-                multimodal_similarity = torch.matmul(aggr_fixation_projection_feature,
-                                                     cls_language_feature_projection.transpose(1, 2))
-
-                language_similarity_list.append(language_similarity)
-                multimodal_similarity_list.append(multimodal_similarity)
-
-            generated_ids = generated_ids * duration_masks.view(-1, 1).long()
-            generated_ids_list.append(generated_ids.view(src.shape[0], self.args.max_length, -1))
-
-        scanpath_prediction = torch.stack(scanpath_prediction_list, dim=1)
-        sampling_prediction["scanpath_length"] = torch.stack(scanpath_length_list, dim=1)
-        sampling_prediction["durations"] = torch.stack(durations_list, dim=1)
-        sampling_prediction["selected_actions_probs"] = torch.stack(selected_actions_probs_list, dim=1)
-        sampling_prediction["selected_actions"] = torch.stack(selected_actions_list, dim=1)
-        action_masks = torch.stack(action_masks_list, dim=1)
-        duration_masks = torch.stack(duration_masks_list, dim=1)
-        generated_ids = torch.stack(generated_ids_list, dim=2)
-        resnet_visual_similarity = torch.stack(resnet_visual_similarity_list, dim=1)
-        visual_similarity = torch.stack(visual_similarity_list, dim=1)
-        explanation_similarity_mask = torch.stack(explanation_similarity_mask_list, dim=1)
+            dec_outputs = self.blip_model(**dec_input)
+            # [N, T, R]
+            dec_output_loss = scatter_slots(dec_outputs.loss, slot_index, num_slots)
+            dec_output_loss = dec_output_loss.view(batch_size, sample_num, -1).permute(0, 2, 1)
+
+            logsoftmax_logits = F.log_softmax(dec_outputs.logits, -1)
+            generated_idx_logit = torch.gather(logsoftmax_logits, index=generated_ids.unsqueeze(-1), dim=-1).squeeze(-1)
+            generated_idx_logit = scatter_slots(generated_idx_logit, slot_index, num_slots)
+            # [N, T, R, L]
+            generated_idx_logit = generated_idx_logit.view(batch_size, sample_num, max_len, -1).permute(0, 2, 1, 3)
+
+            # Tuple of torch.FloatTensor (one for the output of the embeddings, if the model has an embedding layer, + one for the output of each layer)
+            cls_language_feature = scatter_slots(dec_outputs.hidden_states[-1][:, 0], slot_index, num_slots)
+
+            # language project feature for alignment
+            cls_language_feature_projection = self.language_projection(cls_language_feature)
+            cls_language_feature_projection = cls_language_feature_projection.view(batch_size * sample_num, -1,
+                                                                                   cls_language_feature_projection.shape[-1])
+            cls_language_feature_projection = cls_language_feature_projection / (
+                    torch.norm(cls_language_feature_projection, p=2, dim=2, keepdim=True) + eps)
+            language_similarity = torch.matmul(cls_language_feature_projection,
+                                               cls_language_feature_projection.transpose(1, 2))
+
+            multimodal_similarity = torch.matmul(aggr_fixation_projection_feature,
+                                                 cls_language_feature_projection.transpose(1, 2))
+
+        generated_ids = scatter_slots(generated_ids, slot_index, num_slots)
+        generated_ids = generated_ids * duration_masks.view(-1, 1).long()
+        # [N, T, R, L]
+        generated_ids = generated_ids.view(batch_size, sample_num, max_len, -1).permute(0, 2, 1, 3)
+
+        duration_masks = duration_masks_all
+        # [N, R, T, T]
+        resnet_visual_similarity = resnet_visual_similarity.view(batch_size, sample_num, max_len, max_len)
+        visual_similarity = visual_similarity.view(batch_size, sample_num, max_len, max_len)
+        explanation_similarity_mask = explanation_similarity_mask.view(batch_size, sample_num, max_len, max_len)
 
         # [N, R, H, W]
         prediction["resnet_visual_similarity"] = resnet_visual_similarity
@@ -532,10 +639,8 @@ class gazeformer(nn.Module):
         # [N, R, H, W]
         prediction["explanation_similarity_mask"] = explanation_similarity_mask
         if scst or detail:
-            dec_output_loss = torch.stack(dec_output_loss_list, dim=2)
-            language_similarity = torch.stack(language_similarity_list, dim=1)
-            multimodal_similarity = torch.stack(multimodal_similarity_list, dim=1)
-            generated_idx_logit = torch.stack(generated_idx_logit_list, dim=2)
+            language_similarity = language_similarity.view(batch_size, sample_num, max_len, max_len)
+            multimodal_similarity = multimodal_similarity.view(batch_size, sample_num, max_len, max_len)
             # [N, R, H, W]
             prediction["language_similarity"] = language_similarity
             # [N, R, H, W]
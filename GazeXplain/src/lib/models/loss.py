@@ -35,6 +35,20 @@ def CrossEntropyLoss(input, gt, mask):
     loss = -(gt * torch.log(input + epsilon) * mask.unsqueeze(-1)).sum() / mask.sum()
     return loss
 
+def CrossEntropyIndexLoss(input, gt_index, mask, blur_table=None):
+    # same as CrossEntropyLoss with the target given as action indices,
+    # the blurred targets are looked up from the [H * W, H * W] blur table
+    batch, time_scale, action = input.size()
+    log_prob = torch.log(F.softmax(input, dim=-1) + epsilon)
+    if blur_table is None:
+        log_likelihood = torch.gather(log_prob, dim=-1, index=gt_index.unsqueeze(-1)).squeeze(-1)
+    else:
+        fixated = gt_index > 0
+        blur_weight = blur_table[(gt_index - 1).clamp(min=0)]
+        log_likelihood = torch.where(fixated, (blur_weight * log_prob[:, :, 1:]).sum(-1), log_prob[:, :, 0])
+    loss = -(log_likelihood * mask).sum() / mask.sum()
+    return loss
+
 def CrossEntropyProbLoss(input, gt, mask):
     batch, time_scale, action = input.size()
     loss = -(gt * torch.log(input + epsilon) * mask.unsqueeze(-1)).sum() / mask.sum()
@@ -138,7 +138,8 @@ class Transformer(nn.Module):
         self.d_model = d_model
 
         encoder_layer = TransformerEncoderLayer(d_model, nhead, dim_feedforward,
-                                                encoder_dropout, activation, normalize_before)
+                                                encoder_dropout, activation, normalize_before,
+                                                attention_backend=args.attention_backend)
         encoder_norm = nn.LayerNorm(d_model)
         encoder = TransformerEncoder(encoder_layer, num_encoder_layers, encoder_norm)
         input_proj = nn.Linear(img_hidden_dim, d_model)
@@ -147,7 +148,8 @@ class Transformer(nn.Module):
         self.encoder = TransformerEncoderWrapper(encoder, input_proj, img_transform, text_transform, encoder_dropout)
 
         decoder_layer = TransformerDecoderLayer(d_model, nhead, dim_feedforward,
-                                                decoder_dropout, activation, normalize_before)
+                                                decoder_dropout, activation, normalize_before,
+                                                attention_backend=args.attention_backend)
         decoder_norm = nn.LayerNorm(d_model)
         decoder = TransformerDecoder(decoder_layer, num_decoder_layers, decoder_norm,
                                      return_intermediate=return_intermediate_dec)
@@ -162,8 +164,13 @@ class Transformer(nn.Module):
                 tgt_mask: Optional[Tensor] = None,
                 memory_mask: Optional[Tensor] = None, src_key_padding_mask: Optional[Tensor] = None,
                 tgt_key_padding_mask: Optional[Tensor] = None, memory_key_padding_mask: Optional[Tensor] = None,
-                querypos_embed: Optional[Tensor] = None, patchpos_embed: Optional[Tensor] = None):
-        memory, task_emb = self.encoder(src, mask=src_mask, task=task, src_key_padding_mask=src_key_padding_mask, patchpos_embed=patchpos_embed)
+                querypos_embed: Optional[Tensor] = None, patchpos_embed: Optional[Tensor] = None,
+                memory: Optional[Tensor] = None):
+        if memory is None:
+            memory, task_emb = self.encoder(src, mask=src_mask, task=task, src_key_padding_mask=src_key_padding_mask, patchpos_embed=patchpos_embed)
+        else:
+            # the image memory was encoded beforehand, only the task is projected
+            task_emb = self.encoder.text_transform(task)
 
         memory_task, output = self.decoder(tgt, memory, task_emb=task_emb, tgt_mask=tgt_mask, memory_mask=memory_mask,
                                            tgt_key_padding_mask=tgt_key_padding_mask,
@@ -191,16 +198,24 @@ class TransformerEncoderWrapper(nn.Module):
             if p.dim() > 1:
                 nn.init.xavier_uniform_(p)
 
-    def forward(self, src, task,
-                mask: Optional[Tensor] = None,
-                src_key_padding_mask: Optional[Tensor] = None,
-                patchpos_embed: Optional[Tensor] = None):
+    def encode_image(self, src,
+                     mask: Optional[Tensor] = None,
+                     src_key_padding_mask: Optional[Tensor] = None,
+                     patchpos_embed: Optional[Tensor] = None):
+        # the image memory does not depend on the task
         src_proj = self.input_proj(src).permute(1, 0, 2)  # input projection from 2048 -> d
 
         output = self.encoder(src_proj, mask=mask, src_key_padding_mask=src_key_padding_mask,
                               patchpos_embed=patchpos_embed)  # transformer encoder
 
-        memory = self.img_transform(output)  # project image features to multimodal space
+        return self.img_transform(output)  # project image features to multimodal space
+
+    def forward(self, src, task,
+                mask: Optional[Tensor] = None,
+                src_key_padding_mask: Optional[Tensor] = None,
+                patchpos_embed: Optional[Tensor] = None):
+        memory = self.encode_image(src, mask=mask, src_key_padding_mask=src_key_padding_mask,
+                                   patchpos_embed=patchpos_embed)
         task_emb = self.text_transform(task)  # project task features to multimodal space
 
         return memory, task_emb
@@ -285,16 +300,19 @@ class TransformerDecoder(nn.Module):
 
         intermediate = []
 
+        # the memory does not change across the layers, its positional keys are computed once
+        memory_pos = patchpos_embed(memory)
+
         for idx, layer in enumerate(self.layers):
             output = layer(output, memory, tgt_mask=tgt_mask,
                            memory_mask=memory_mask,
                            tgt_key_padding_mask=tgt_key_padding_mask,
                            memory_key_padding_mask=memory_key_padding_mask,
                            querypos_embed=querypos_embed,
-                           patchpos_embed=patchpos_embed)
+                           patchpos_embed=patchpos_embed,
+                           memory_pos=memory_pos)
             if self.return_intermediate:
                 intermediate.append(self.norm(output))
-            b = output.detach().cpu().numpy()
         if self.norm is not None:
             output = self.norm(output)
             if self.return_intermediate:
@@ -310,9 +328,10 @@ class TransformerDecoder(nn.Module):
 class TransformerEncoderLayer(nn.Module):
 
     def __init__(self, d_model, nhead, dim_feedforward=2048, dropout=0.1,
-                 activation="relu", normalize_before=False):
+                 activation="relu", normalize_before=False, attention_backend="multihead"):
         super().__init__()
         self.self_attn = nn.MultiheadAttention(d_model, nhead, dropout=dropout)
+        self.attention_backend = attention_backend
         # Implementation of Feedforward model
         self.linear1 = nn.Linear(d_model, dim_feedforward)
         self.dropout = nn.Dropout(dropout)
@@ -335,8 +354,8 @@ class TransformerEncoderLayer(nn.Module):
                      src_key_padding_mask: Optional[Tensor] = None,
                      patchpos_embed: Optional[Tensor] = None):
         q = k = self.with_pos_embed(src, patchpos_embed)
-        src2 = self.self_attn(q, k, value=src, attn_mask=src_mask,
-                              key_padding_mask=src_key_padding_mask)[0]
+        src2 = multihead_attention(self.self_attn, q, k, src, attn_mask=src_mask,
+                                   key_padding_mask=src_key_padding_mask, backend=self.attention_backend)
         src = src + self.dropout1(src2)
         src = self.norm1(src)
         src2 = self.linear2(self.dropout(self.activation(self.linear1(src))))
@@ -350,8 +369,8 @@ class TransformerEncoderLayer(nn.Module):
                     pos: Optional[Tensor] = None):
         src2 = self.norm1(src)
         q = k = self.with_pos_embed(src2, pos)
-        src2 = self.self_attn(q, k, value=src2, attn_mask=src_mask,
-                              key_padding_mask=src_key_padding_mask)[0]
+        src2 = multihead_attention(self.self_attn, q, k, src2, attn_mask=src_mask,
+                                   key_padding_mask=src_key_padding_mask, backend=self.attention_backend)
         src = src + self.dropout1(src2)
         src2 = self.norm2(src)
         src2 = self.linear2(self.dropout(self.activation(self.linear1(src2))))
@@ -370,10 +389,11 @@ class TransformerEncoderLayer(nn.Module):
 class TransformerDecoderLayer(nn.Module):
 
     def __init__(self, d_model, nhead, dim_feedforward=2048, dropout=0.1,
-                 activation="relu", normalize_before=False):
+                 activation="relu", normalize_before=False, attention_backend="multihead"):
         super().__init__()
         self.self_attn = nn.MultiheadAttention(d_model, nhead, dropout=dropout)
         self.multihead_attn = nn.MultiheadAttention(d_model, nhead, dropout=dropout)
+        self.attention_backend = attention_backend
         # Implementation of Feedforward model
         self.linear1 = nn.Linear(d_model, dim_feedforward)
         self.dropout = nn.Dropout(dropout)
@@ -398,16 +418,18 @@ class TransformerDecoderLayer(nn.Module):
                      tgt_key_padding_mask: Optional[Tensor] = None,
                      memory_key_padding_mask: Optional[Tensor] = None,
                      querypos_embed: Optional[Tensor] = None,
-                     patchpos_embed: Optional[Tensor] = None):
+                     patchpos_embed: Optional[Tensor] = None,
+                     memory_pos: Optional[Tensor] = None):
+        if memory_pos is None:
+            memory_pos = patchpos_embed(memory)
         q = k = v = self.with_pos_embed(tgt, querypos_embed)
-        tgt2 = self.self_attn(q, k, value=v, attn_mask=tgt_mask,
-                              key_padding_mask=tgt_key_padding_mask)[0]
+        tgt2 = multihead_attention(self.self_attn, q, k, v, attn_mask=tgt_mask,
+                                   key_padding_mask=tgt_key_padding_mask, backend=self.attention_backend)
         tgt = tgt + self.dropout1(tgt2)
         tgt = self.norm1(tgt)
-        tgt2 = self.multihead_attn(query=self.with_pos_embed(tgt, querypos_embed),
-                                   key=patchpos_embed(memory),
-                                   value=memory, attn_mask=memory_mask,
-                                   key_padding_mask=memory_key_padding_mask)[0]
+        tgt2 = multihead_attention(self.multihead_attn, self.with_pos_embed(tgt, querypos_embed), memory_pos, memory,
+                                   attn_mask=memory_mask, key_padding_mask=memory_key_padding_mask,
+                                   backend=self.attention_backend)
         tgt = tgt + self.dropout2(tgt2)
         tgt = self.norm2(tgt)
         tgt2 = self.linear2(self.dropout(self.activation(self.linear1(tgt))))
@@ -421,17 +443,19 @@ class TransformerDecoderLayer(nn.Module):
                     tgt_key_padding_mask: Optional[Tensor] = None,
                     memory_key_padding_mask: Optional[Tensor] = None,
                     querypos_embed: Optional[Tensor] = None,
-                    patchpos_embed: Optional[Tensor] = None):
+                    patchpos_embed: Optional[Tensor] = None,
+                    memory_pos: Optional[Tensor] = None):
+        if memory_pos is None:
+            memory_pos = patchpos_embed(memory)
         tgt2 = self.norm1(tgt)
         q = k = v = self.with_pos_embed(tgt2, querypos_embed)
-        tgt2 = self.self_attn(q, k, value=v, attn_mask=tgt_mask,
-                              key_padding_mask=tgt_key_padding_mask)[0]
+        tgt2 = multihead_attention(self.self_attn, q, k, v, attn_mask=tgt_mask,
+                                   key_padding_mask=tgt_key_padding_mask, backend=self.attention_backend)
         tgt = tgt + self.dropout1(tgt2)
         tgt2 = self.norm2(tgt)
-        tgt2 = self.multihead_attn(query=self.with_pos_embed(tgt2, querypos_embed),
-                                   key=patchpos_embed(memory),
-                                   value=memory, attn_mask=memory_mask,
-                                   key_padding_mask=memory_key_padding_mask)[0]
+        tgt2 = multihead_attention(self.multihead_attn, self.with_pos_embed(tgt2, querypos_embed), memory_pos, memory,
+                                   attn_mask=memory_mask, key_padding_mask=memory_key_padding_mask,
+                                   backend=self.attention_backend)
         tgt = tgt + self.dropout2(tgt2)
         tgt2 = self.norm3(tgt)
         tgt2 = self.linear2(self.dropout(self.activation(self.linear1(tgt2))))
@@ -444,16 +468,19 @@ class TransformerDecoderLayer(nn.Module):
                 tgt_key_padding_mask: Optional[Tensor] = None,
                 memory_key_padding_mask: Optional[Tensor] = None,
                 querypos_embed: Optional[Tensor] = None,
-                patchpos_embed: Optional[Tensor] = None):
+                patchpos_embed: Optional[Tensor] = None,
+                memory_pos: Optional[Tensor] = None):
         if self.normalize_before:
             return self.forward_pre(tgt, memory, tgt_mask, memory_mask,
                                     tgt_key_padding_mask, memory_key_padding_mask,
                                     querypos_embed=querypos_embed,
-                                    patchpos_embed=patchpos_embed)
+                                    patchpos_embed=patchpos_embed,
+                                    memory_pos=memory_pos)
         return self.forward_post(tgt, memory, tgt_mask, memory_mask,
                                  tgt_key_padding_mask, memory_key_padding_mask,
                                  querypos_embed=querypos_embed,
-                                 patchpos_embed=patchpos_embed)
+                                 patchpos_embed=patchpos_embed,
+                                 memory_pos=memory_pos)
 
 
 def _get_clones(module, N):
@@ -471,3 +498,81 @@ def _get_activation_fn(activation):
     raise RuntimeError(F"activation should be relu/gelu, not {activation}.")
 
 
+
+
+def _additive_mask(mask, dtype):
+    # boolean masks mark the positions that must not be attended
+    if mask.dtype == torch.bool:
+        return torch.zeros(mask.shape, dtype=dtype, device=mask.device).masked_fill(mask, float("-inf"))
+    return mask.to(dtype)
+
+
+def _project_heads(attn, query, key, value):
+    # sequence-first [L, N, C] inputs -> batch-first [N, H, L, C / H] projections with the weights of ``attn``
+    w_q, w_k, w_v = attn.in_proj_weight.chunk(3)
+    b_q, b_k, b_v = attn.in_proj_bias.chunk(3) if attn.in_proj_bias is not None else (None, None, None)
+    projected = []
+    for tensor, weight, bias in [(query, w_q, b_q), (key, w_k, b_k), (value, w_v, b_v)]:
+        if tensor is None:
+            projected.append(None)
+            continue
+        tensor = F.linear(tensor, weight, bias)
+        projected.append(tensor.view(tensor.shape[0], tensor.shape[1], attn.num_heads, -1).permute(1, 2, 0, 3))
+    return projected
+
+
+def _attention_mask(attn_mask, key_padding_mask, dtype):
+    # [L, S] attention mask and [N, S] key padding mask -> one additive mask broadcastable to [N, H, L, S]
+    mask = None
+    if attn_mask is not None:
+        mask = _additive_mask(attn_mask, dtype)
+    if key_padding_mask is not None:
+        padding = _additive_mask(key_padding_mask, dtype)[:, None, None, :]
+        mask = padding if mask is None else mask + padding
+    return mask
+
+
+def scaled_dot_product_attention(attn: nn.MultiheadAttention, query, key, value,
+                                 attn_mask: Optional[Tensor] = None,
+                                 key_padding_mask: Optional[Tensor] = None):
+    """
+    Output of ``attn(query, key, value)[0]`` computed with ``F.scaled_dot_product_attention``.
+
+    The parameters of the ``nn.MultiheadAttention`` module are reused, so checkpoints are shared with the default
+    backend, while the attention itself runs in the fused (flash / memory-efficient) kernels when they apply.
+    """
+    q, k, v = _project_heads(attn, query, key, value)
+    mask = _attention_mask(attn_mask, key_padding_mask, q.dtype)
+    output = F.scaled_dot_product_attention(q, k, v, attn_mask=mask,
+                                            dropout_p=attn.dropout if attn.training else 0.)
+    # [N, H, L, C / H] -> [L, N, C]
+    output = output.permute(2, 0, 1, 3).reshape(query.shape[0], query.shape[1], -1)
+    return attn.out_proj(output)
+
+
+def attention_weights(attn: nn.MultiheadAttention, query, key,
+                      attn_mask: Optional[Tensor] = None,
+                      key_padding_mask: Optional[Tensor] = None):
+    """
+    Head-averaged ``[N, L, S]`` attention weights of ``attn(query, key, value)[1]``, without the value and output
+    projections the weights do not depend on. Dropout is applied to the weights before averaging, as
+    ``nn.MultiheadAttention`` does.
+    """
+    q, k, _ = _project_heads(attn, query, key, None)
+    logits = torch.matmul(q, k.transpose(-2, -1)) / (q.shape[-1] ** 0.5)
+    mask = _attention_mask(attn_mask, key_padding_mask, logits.dtype)
+    if mask is not None:
+        logits = logits + mask
+    weights = F.dropout(F.softmax(logits, dim=-1), p=attn.dropout, training=attn.training)
+    return weights.mean(dim=1)
+
+
+def multihead_attention(attn: nn.MultiheadAttention, query, key, value,
+                        attn_mask: Optional[Tensor] = None,
+                        key_padding_mask: Optional[Tensor] = None,
+                        backend: str = "multihead"):
+    # attention output with the selected backend, see the --attention_backend option
+    if backend == "sdpa":
+        return scaled_dot_product_attention(attn, query, key, value, attn_mask=attn_mask,
+                                            key_padding_mask=key_padding_mask)
+    return attn(query, key, value=value, attn_mask=attn_mask, key_padding_mask=key_padding_mask)[0]
@@ -0,0 +1,42 @@
+import torch
+from torch import nn
+from torch.ao.quantization import quantize_dynamic, default_dynamic_qconfig
+
+# submodules of gazeformer whose nn.Linear layers are quantized: the RoBERTa task encoder, the scanpath transformer,
+# the projection into the language model and the BLIP text decoder, which together hold nearly all the weights
+QUANTIZED_MODULES = ("roberta", "transformer", "hidden_state_transform", "blip_model")
+
+
+def quantize_dynamic_int8(model, modules=QUANTIZED_MODULES):
+    """
+    Replace the ``nn.Linear`` layers of the ``modules`` of a trained :class:`gazeformer` by dynamically quantized
+    int8 layers, in place.
+
+    The weights are quantized once, the activations on the fly by every call, so the model keeps its float inputs
+    and outputs. Quantized kernels only exist for the CPU and the model cannot be trained afterwards. The
+    projections inside ``nn.MultiheadAttention`` are left in float, as PyTorch does not quantize them dynamically.
+    """
+    if next(model.parameters()).device.type != "cpu":
+        raise ValueError("dynamic int8 quantization is only supported on the CPU")
+    quantize_dynamic(model, qconfig_spec={name: default_dynamic_qconfig for name in modules}, dtype=torch.qint8,
+                     mapping={nn.Linear: torch.ao.nn.quantized.dynamic.Linear}, inplace=True)
+    # anything cached was computed by the float model
+    model.clear_caches()
+    return model
+
+
+def quantization_report(float_metrics, int8_metrics):
+    """
+    Metrics of the float and the quantized model side by side, per dataset as returned by ``get_prediction``.
+    """
+    report = {}
+    for dataset, metrics in float_metrics.items():
+        report[dataset] = {}
+        for key, value in metrics.items():
+            int8_value = int8_metrics.get(dataset, {}).get(key, float("nan"))
+            report[dataset][key] = {
+                "fp32": float(value),
+                "int8": float(int8_value),
+                "delta": float(int8_value) - float(value),
+            }
+    return report
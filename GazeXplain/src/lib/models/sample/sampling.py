@@ -13,72 +13,84 @@ class Sampling():
         self.height = args.height
         self.x_granularity = float(self.width / self.map_width)
         self.y_granularity = float(self.height / self.map_height)
+        self.sample_seed = args.sample_seed
+        self.generators = {}
 
-    def random_sample(self, model_prediction):
+    def sample_generator(self, device, sample_idx):
+        # one generator per sample and device, seeded with sample_seed + sample index, so that a seeded run
+        # draws the same stream for its r-th sample whatever the number of samples
+        key = (str(device), sample_idx)
+        if key not in self.generators:
+            self.generators[key] = torch.Generator(device=device)
+            self.generators[key].manual_seed(self.sample_seed + sample_idx)
+        return self.generators[key]
+
+    def random_sample(self, model_prediction, sample_num=1):
         log_normal_mu = model_prediction["log_normal_mu"]
         log_normal_sigma2 = model_prediction["log_normal_sigma2"]
         all_actions_prob = model_prediction["all_actions_prob"]
 
-        # sampling stage
-        batch = all_actions_prob.shape[0]
+        # sampling stage, all the samples are drawn at once
+        batch, time_scale, action = all_actions_prob.shape
         probs = all_actions_prob.data.clone()
         probs[:, :self.min_length, 0] = 0
-        dist = torch.distributions.categorical.Categorical(probs=probs)
-        selected_specific_actions = dist.sample()
-        selected_actions_probs = \
-            torch.gather(all_actions_prob, dim=2, index=selected_specific_actions.unsqueeze(-1)).squeeze(-1)
+        probs = probs.view(-1, action)
+        if self.sample_seed is None:
+            # [N * T, R]
+            selected_specific_actions = torch.multinomial(probs, sample_num, replacement=True)
+            random_rand = torch.randn((batch, sample_num, time_scale), dtype=log_normal_mu.dtype,
+                                      device=log_normal_mu.device)
+        else:
+            selected_specific_actions = torch.cat([
+                torch.multinomial(probs, 1, replacement=True, generator=self.sample_generator(probs.device, idx))
+                for idx in range(sample_num)], dim=1)
+            random_rand = torch.stack([
+                torch.randn((batch, time_scale), dtype=log_normal_mu.dtype, device=log_normal_mu.device,
+                            generator=self.sample_generator(log_normal_mu.device, idx))
+                for idx in range(sample_num)], dim=1)
+        selected_specific_actions = selected_specific_actions.view(batch, time_scale, sample_num).permute(0, 2, 1)
+        selected_actions_probs = torch.gather(
+            all_actions_prob.unsqueeze(1).expand(-1, sample_num, -1, -1), dim=3,
+            index=selected_specific_actions.unsqueeze(-1)).squeeze(-1)
 
-        random_rand = torch.randn(log_normal_mu.shape).to(log_normal_mu.get_device())
-        duration_samples = torch.exp(random_rand * log_normal_sigma2 + log_normal_mu)
+        duration_samples = torch.exp(random_rand * log_normal_sigma2.unsqueeze(1) + log_normal_mu.unsqueeze(1))
 
-        scanpath_length = all_actions_prob.new_zeros(batch)
-        for index in range(self.max_length):
-            scanpath_length[torch.logical_and(
-                scanpath_length == 0, selected_specific_actions[:, index] == 0)] = index
-        scanpath_length[scanpath_length == 0] = self.max_length
-        scanpath_length = scanpath_length.unsqueeze(-1)
+        # the length is the first termination after the first step, the maximal length if there is none
+        termination = selected_specific_actions[:, :, 1:] == 0
+        scanpath_length = torch.where(termination.any(dim=-1), termination.int().argmax(dim=-1) + 1,
+                                      torch.full_like(termination[:, :, 0], self.max_length, dtype=torch.long))
+        scanpath_length = scanpath_length.to(all_actions_prob.dtype).unsqueeze(-1)
 
         prediction = {}
-        # [N, 1]
+        # [N, R, 1]
         prediction["scanpath_length"] = scanpath_length
-        # [N, T]
+        # [N, R, T]
         prediction["durations"] = duration_samples
-        # [N, T]
+        # [N, R, T]
         prediction["selected_actions_probs"] = selected_actions_probs
-        # [N, T]
+        # [N, R, T]
         prediction["selected_actions"] = selected_specific_actions
 
         return prediction
 
     def generate_scanpath(self, images, sampling_prediction):
-        prob_sample_actions = sampling_prediction["selected_actions_probs"]
         durations = sampling_prediction["durations"]
-        sample_actions  = sampling_prediction["selected_actions"]
-        # computer the logprob for action and duration
-        action_masks = images.new_zeros(prob_sample_actions.shape)
-        duration_masks = images.new_zeros(prob_sample_actions.shape)
-        scanpath_predictions = images.new_zeros((images.shape[0], self.max_length, 3)) - 1
-        t = durations.data.clone()
-        N = images.shape[0]
-        for index in range(N):
-            sample_action = sample_actions[index].cpu().numpy()
-            drts = t[index].cpu().numpy()
-            for order in range(sample_action.shape[0]):
-                if sample_action[order] == 0:
-                    action_masks[index, order] = 1
-                    break
-                else:
-                    image_index = sample_action[order] - 1
-                    map_pos_x = image_index % self.map_width
-                    map_pos_y = image_index // self.map_width
-                    pos_x = map_pos_x * self.x_granularity + self.x_granularity / 2
-                    pos_y = map_pos_y * self.y_granularity + self.y_granularity / 2
-                    drt = drts[order] * 1000
-                    action_masks[index, order] = 1
-                    duration_masks[index, order] = 1
-                    scanpath_predictions[index, order, 0] = pos_x
-                    scanpath_predictions[index, order, 1] = pos_y
-                    scanpath_predictions[index, order, 2] = drt
+        sample_actions = sampling_prediction["selected_actions"]
+        # the scanpath stops at the first termination action, which still counts as an action
+        termination = (sample_actions == 0).long()
+        terminated = torch.cumsum(termination, dim=-1)
+        action_masks = (terminated - termination == 0).to(images.dtype)
+        duration_masks = (terminated == 0).to(images.dtype)
 
+        # coordinates of the center of the selected cell and duration in ms, computed in double precision
+        image_index = (sample_actions - 1).clamp(min=0)
+        map_pos_x = (image_index % self.map_width).double()
+        map_pos_y = torch.div(image_index, self.map_width, rounding_mode="floor").double()
+        pos_x = map_pos_x * self.x_granularity + self.x_granularity / 2
+        pos_y = map_pos_y * self.y_granularity + self.y_granularity / 2
+        drt = durations.data.double() * 1000
+        scanpath_predictions = torch.stack([pos_x, pos_y, drt], dim=-1).to(images.dtype)
+        scanpath_predictions = torch.where(duration_masks.unsqueeze(-1) == 1, scanpath_predictions,
+                                           scanpath_predictions.new_full((), -1))
 
         return scanpath_predictions, action_masks, duration_masks
@@ -0,0 +1,97 @@
+import json
+import os
+from os.path import join
+
+import torch
+from torch import nn
+
+from lib.models.gazeformer_explanation_alignment import gazeformer
+from lib.runtime.scanpath_runtime import EXPORT_META_FILE, TOKENIZER_FILE, TASK_TOKENS_FILE, GRAPH_FILES
+
+
+class ScanpathPredictor(nn.Module):
+    """
+    Scanpath part of a :class:`gazeformer`: RoBERTa task encoder, transformer encoder/decoder, attention map
+    predictor, token predictor and duration heads.
+
+    Maps the image features and the task token ids to the action probabilities and the log-normal duration
+    parameters that :class:`Sampling` draws the scanpaths from, without any of the explanation modules, so that
+    it can be traced or exported on its own by :func:`export_scanpath_predictor`.
+    """
+
+    # the very same computation as the inference of the model the predictor is built from
+    scanpath_distribution = gazeformer.scanpath_distribution
+
+    def __init__(self, model):
+        super(ScanpathPredictor, self).__init__()
+        self.max_len = model.max_len
+        self.hidden_dim = model.hidden_dim
+        self.roberta = model.roberta
+        self.transformer = model.transformer
+        self.querypos_embed = model.querypos_embed
+        self.patchpos_embed = model.patchpos_embed
+        self.dropout = model.dropout
+        self.generator_t_mu = model.generator_t_mu
+        self.generator_t_logvar = model.generator_t_logvar
+        self.attention_map_predictor = model.attention_map_predictor
+        self.token_predictor = model.token_predictor
+
+    def forward(self, image_feature, input_ids, attention_mask):
+        task = self.roberta(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[1]
+        _, _, all_actions_prob, t_log_normal_mu, t_log_normal_sigma2 = self.scanpath_distribution(image_feature, task)
+        # [N, T, A], [N, T], [N, T]
+        return all_actions_prob, t_log_normal_mu.permute(1, 0, 2).squeeze(-1), \
+            t_log_normal_sigma2.permute(1, 0, 2).squeeze(-1)
+
+
+def export_scanpath_predictor(model, opt, tokenizer, export_dir, export_format="torchscript", task_texts=()):
+    """
+    Write a :class:`ScanpathPredictor` of ``model`` to ``export_dir`` for :class:`lib.runtime.scanpath_runtime.ScanpathRuntime`.
+
+    The graph is traced (TorchScript) or exported (ONNX) with dynamic batch size and token length. Next to it
+    go the sampling options, the RoBERTa tokenizer as a ``tokenizers`` file and the token ids of ``task_texts``,
+    so that the runtime needs neither ``transformers`` nor the checkpoint.
+    """
+    if export_format not in GRAPH_FILES:
+        raise ValueError("unknown export format {}, expected one of {}".format(export_format, list(GRAPH_FILES)))
+    if not os.path.exists(export_dir):
+        os.makedirs(export_dir)
+
+    predictor = ScanpathPredictor(model).eval()
+    task_input = tokenizer(["Question: Is there a cup in the image? Answer: yes."] * 2, return_tensors="pt",
+                           padding=True)
+    image_feature = torch.zeros((2, opt.im_h * opt.im_w, opt.img_hidden_dim), dtype=torch.float32)
+    example = (image_feature, task_input["input_ids"], task_input["attention_mask"])
+
+    graph_path = join(export_dir, GRAPH_FILES[export_format])
+    with torch.no_grad():
+        if export_format == "torchscript":
+            torch.jit.save(torch.jit.trace(predictor, example, check_trace=False), graph_path)
+        else:
+            torch.onnx.export(predictor, example, graph_path,
+                              input_names=["image_feature", "input_ids", "attention_mask"],
+                              output_names=["all_actions_prob", "log_normal_mu", "log_normal_sigma2"],
+                              dynamic_axes={"image_feature": {0: "batch"},
+                                            "input_ids": {0: "batch", 1: "tokens"},
+                                            "attention_mask": {0: "batch", 1: "tokens"},
+                                            "all_actions_prob": {0: "batch"},
+                                            "log_normal_mu": {0: "batch"},
+                                            "log_normal_sigma2": {0: "batch"}},
+                              opset_version=14)
+
+    tokenizer.backend_tokenizer.save(join(export_dir, TOKENIZER_FILE))
+    task_texts = sorted(set(task_texts))
+    task_tokens = tokenizer(task_texts)["input_ids"] if len(task_texts) > 0 else []
+    with open(join(export_dir, TASK_TOKENS_FILE), "w") as f:
+        json.dump(dict(zip(task_texts, task_tokens)), f)
+
+    meta = {
+        "format": export_format,
+        "graph": GRAPH_FILES[export_format],
+        "pad_token_id": tokenizer.pad_token_id,
+        "img_hidden_dim": opt.img_hidden_dim,
+        "sampling": {k: getattr(opt, k) for k in ["max_length", "min_length", "im_h", "im_w", "width", "height"]},
+    }
+    with open(join(export_dir, EXPORT_META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return graph_path
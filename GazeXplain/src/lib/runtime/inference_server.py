@@ -0,0 +1,308 @@
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+from transformers import BertTokenizerFast, RobertaTokenizerFast
+
+from lib.dataset.feature_store import PackedFeatureStore
+from lib.dataset.token_cache import TokenCache
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyStats(object):
+    """
+    Queue wait, compute and total latency of the last ``window`` requests served by a :class:`DynamicBatcher`.
+    """
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.queue_wait = deque(maxlen=window)
+        self.compute = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+
+    def record(self, queue_waits, compute_time):
+        with self.lock:
+            for queue_wait in queue_waits:
+                self.queue_wait.append(queue_wait)
+                self.compute.append(compute_time)
+                self.total.append(queue_wait + compute_time)
+            self.batch_sizes.append(len(queue_waits))
+            self.requests += len(queue_waits)
+
+    def summary(self):
+        with self.lock:
+            summary = {
+                "requests": self.requests,
+                "mean_batch_size": float(np.mean(self.batch_sizes)) if len(self.batch_sizes) > 0 else 0.,
+            }
+            for name, values in [("queue_wait_ms", self.queue_wait), ("compute_ms", self.compute),
+                                 ("total_ms", self.total)]:
+                values = np.array(values) * 1000
+                summary[name] = {"p{}".format(p): float(np.percentile(values, p)) if len(values) > 0 else 0.
+                                 for p in PERCENTILES}
+        return summary
+
+
+class DynamicBatcher(object):
+    """
+    Coalesces the requests submitted from many threads into batches for ``process_batch``.
+
+    A batch is closed when it holds ``max_batch_size`` requests or ``max_wait_ms`` after its first request
+    arrived, whichever comes first, and is processed by a single worker thread, so the model only ever sees one
+    batch at a time. ``process_batch`` maps a list of requests to the list of their results.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=10.):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self.queue = queue.Queue()
+        self.stats = LatencyStats()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        future = Future()
+        self.queue.put((time.perf_counter(), request, future))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def next_batch(self):
+        first = self.queue.get()
+        if first is None:
+            return None, True
+        pending = [first]
+        deadline = first[0] + self.max_wait
+        while len(pending) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return pending, True
+            pending.append(item)
+        return pending, False
+
+    def run(self):
+        closed = False
+        while not closed:
+            pending, closed = self.next_batch()
+            if pending is None:
+                break
+            start = time.perf_counter()
+            try:
+                results = self.process_batch([request for _, request, _ in pending])
+            except Exception as e:
+                for _, _, future in pending:
+                    future.set_exception(e)
+                continue
+            compute_time = time.perf_counter() - start
+            self.stats.record([start - enqueued for enqueued, _, _ in pending], compute_time)
+            for (_, _, future), result in zip(pending, results):
+                future.set_result(result)
+
+
+class ExplanationService(object):
+    """
+    Scanpaths and explanations of a trained :class:`gazeformer` for batches of ``{"task", "image_path"}`` or
+    ``{"task", "image_feature"}`` requests.
+
+    The requests are collated like ``UnifiedScanpath.collate_func`` does for the inputs of the inference and
+    predicted with ``gazeformer.inference`` in ``"explanation"`` mode. Image paths point to the precomputed
+    ``.pth`` features below ``feature_root`` (or to the packed store next to them with ``feature_store``) and
+    also key the encoder cache of the model.
+    """
+
+    def __init__(self, model, opt, device, sample_num=1, feature_root=None, task_texts=()):
+        self.model = model
+        self.opt = opt
+        self.device = device
+        self.sample_num = sample_num
+        self.feature_root = os.path.realpath(feature_root) if feature_root is not None else None
+        self.feature_shape = (opt.im_h * opt.im_w, opt.img_hidden_dim)
+        self.feature_stores = {}
+        self.task_token_cache = TokenCache(RobertaTokenizerFast.from_pretrained("roberta-base"), task_texts)
+        self.blip_tokenizer = BertTokenizerFast.from_pretrained("Salesforce/blip-image-captioning-base")
+
+    def load_image_feature(self, img_path):
+        if self.feature_root is None:
+            raise ValueError("image paths are not served, pass the image feature")
+        img_path = os.path.realpath(os.path.join(self.feature_root, img_path))
+        if os.path.commonpath([img_path, self.feature_root]) != self.feature_root:
+            raise ValueError("image path outside of the feature folder")
+        try:
+            if not self.opt.feature_store:
+                image_feature = torch.load(img_path)
+            else:
+                feature_dir, img_file = os.path.split(img_path)
+                store_dir = feature_dir + "_packed"
+                if store_dir not in self.feature_stores:
+                    self.feature_stores[store_dir] = PackedFeatureStore(store_dir)
+                image_feature = self.feature_stores[store_dir][img_file]
+        except Exception as e:
+            # missing, corrupt or unreadable features are a bad request, not a server error
+            raise ValueError("cannot load the image feature {}: {}".format(img_path, e))
+        if not isinstance(image_feature, torch.Tensor):
+            raise ValueError("the image feature {} is not a tensor".format(img_path))
+        return image_feature
+
+    def parse_request(self, request):
+        # turn a decoded JSON request into a sample, invalid requests are rejected before they are batched
+        if not isinstance(request, dict):
+            raise ValueError("the request needs to be a JSON object")
+        if not isinstance(request.get("task"), str):
+            raise ValueError("the request needs a task string")
+        if "image_path" in request:
+            if not isinstance(request["image_path"], str):
+                raise ValueError("the image path needs to be a string")
+            image_feature = self.load_image_feature(request["image_path"])
+            image_key = os.path.realpath(os.path.join(self.feature_root, request["image_path"]))
+        elif "image_feature" in request:
+            try:
+                image_feature = torch.as_tensor(request["image_feature"], dtype=torch.float32)
+            except TypeError as e:
+                raise ValueError("invalid image feature: {}".format(e))
+            image_key = None
+        else:
+            raise ValueError("the request needs an image_path or an image_feature")
+        image_feature = image_feature.float()
+        if tuple(image_feature.shape) != self.feature_shape:
+            raise ValueError("image feature of shape {}, expected {}".format(tuple(image_feature.shape),
+                                                                            self.feature_shape))
+        return {"image_feature": image_feature, "image_key": image_key, "task": request["task"]}
+
+    def collate(self, samples):
+        task_batch = [_["task"] for _ in samples]
+        data = dict()
+        data["image_feature"] = torch.stack([_["image_feature"] for _ in samples]).to(self.device)
+        if all([_["image_key"] is not None for _ in samples]):
+            # identifies the image of every scanpath for the encoder memory cache
+            data["image_key"] = [_["image_key"] for _ in samples]
+        data["task"] = task_batch
+        data["task_input"] = self.task_token_cache(task_batch).to(self.device)
+        return data
+
+    def __call__(self, samples):
+        batch = self.collate(samples)
+        with torch.no_grad():
+            _, scanpath_prediction, generated_ids, _, _, _ = self.model(batch, self.sample_num, mode="explanation")
+
+        # [N, R, T, 3] and [N, T, R, L]
+        scanpath_prediction = scanpath_prediction.cpu().numpy()
+        generated_ids = generated_ids.cpu()
+        results = []
+        for idx in range(len(samples)):
+            scanpaths = []
+            for sample_idx in range(self.sample_num):
+                scanpath = scanpath_prediction[idx, sample_idx]
+                fixation_length = int((scanpath[:, 0] != -1).sum())
+                scanpaths.append({
+                    "X": scanpath[:fixation_length, 0].tolist(),
+                    "Y": scanpath[:fixation_length, 1].tolist(),
+                    "T": scanpath[:fixation_length, 2].tolist(),
+                    "explanation": self.blip_tokenizer.batch_decode(generated_ids[idx, :fixation_length, sample_idx],
+                                                                    skip_special_tokens=True),
+                })
+            results.append({"task": samples[idx]["task"], "scanpaths": scanpaths})
+        return results
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    ``POST /predict`` with a JSON request returns its scanpaths and explanations, ``GET /stats`` the latency
+    percentiles. The handler threads block on the batcher, which runs the model.
+    """
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_json(404, {"error": "unknown path {}".format(self.path)})
+            return
+        self.send_json(200, self.server.batcher.stats.summary())
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_json(404, {"error": "unknown path {}".format(self.path)})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            sample = self.server.service.parse_request(request)
+        except (ValueError, KeyError, OSError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+        try:
+            result = self.server.batcher.submit(sample).result()
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        # one line per request would drown the latency report
+        pass
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, address=("127.0.0.1", 8000), max_batch_size=16, max_wait_ms=10.):
+        super(InferenceServer, self).__init__(address, InferenceRequestHandler)
+        self.service = service
+        self.batcher = DynamicBatcher(service, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def server_close(self):
+        super(InferenceServer, self).server_close()
+        self.batcher.close()
+
+
+class InferenceClient(object):
+    """
+    Client of an :class:`InferenceServer`, e.g. ``InferenceClient("http://127.0.0.1:8000").predict(task, image_path)``.
+    """
+
+    def __init__(self, url, timeout=60.):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, path, content=None):
+        data = json.dumps(content).encode("utf-8") if content is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def predict(self, task, image_path=None, image_feature=None):
+        content = {"task": task}
+        if image_path is not None:
+            content["image_path"] = image_path
+        else:
+            content["image_feature"] = torch.as_tensor(image_feature).tolist()
+        return self.request("/predict", content)
+
+    def stats(self):
+        return self.request("/stats")
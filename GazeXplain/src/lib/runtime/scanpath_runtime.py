@@ -0,0 +1,103 @@
+import json
+from os.path import join, exists
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from lib.models.sample.sampling import Sampling
+
+EXPORT_META_FILE = "meta.json"
+TOKENIZER_FILE = "tokenizer.json"
+TASK_TOKENS_FILE = "task_tokens.json"
+GRAPH_FILES = {"torchscript": "scanpath_predictor.pt", "onnx": "scanpath_predictor.onnx"}
+
+
+class ScanpathRuntime(object):
+    """
+    Scanpath prediction from a directory written by :func:`lib.models.scanpath_predictor.export_scanpath_predictor`.
+
+    Runs the exported graph with TorchScript or ONNX Runtime and draws the scanpaths with the :class:`Sampling`
+    of the model, so that only ``torch`` (and ``onnxruntime`` for ONNX graphs) is needed to serve the model.
+    Tasks are looked up in the exported token table and otherwise tokenized with the ``tokenizers`` package.
+    """
+
+    def __init__(self, export_dir, sample_seed=None, device="cpu"):
+        with open(join(export_dir, EXPORT_META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self.device = torch.device(device)
+        self.pad_token_id = self.meta["pad_token_id"]
+
+        graph_path = join(export_dir, self.meta["graph"])
+        if self.meta["format"] == "torchscript":
+            self.graph = torch.jit.load(graph_path, map_location=self.device).eval()
+            self.session = None
+        else:
+            try:
+                import onnxruntime
+            except ImportError:
+                raise ImportError("running an ONNX scanpath predictor requires onnxruntime")
+            self.graph = None
+            self.session = onnxruntime.InferenceSession(graph_path, providers=["CPUExecutionProvider"])
+
+        with open(join(export_dir, TASK_TOKENS_FILE), "r") as f:
+            self.task_tokens = json.load(f)
+        self.tokenizer_path = join(export_dir, TOKENIZER_FILE)
+        self.tokenizer = None
+
+        self.sampling = Sampling(SimpleNamespace(sample_seed=sample_seed, **self.meta["sampling"]))
+
+    def tokenize(self, tasks):
+        token_ids = []
+        for task in tasks:
+            if task not in self.task_tokens:
+                if self.tokenizer is None:
+                    if not exists(self.tokenizer_path):
+                        raise KeyError("task {} was not exported and there is no tokenizer".format(task))
+                    from tokenizers import Tokenizer
+                    self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+                self.task_tokens[task] = self.tokenizer.encode(task).ids
+            token_ids.append(self.task_tokens[task])
+
+        # right padding, like the RoBERTa tokenizer of the model
+        max_len = max([len(_) for _ in token_ids])
+        input_ids = np.full((len(token_ids), max_len), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(token_ids), max_len), dtype=np.int64)
+        for idx, ids in enumerate(token_ids):
+            input_ids[idx, :len(ids)] = ids
+            attention_mask[idx, :len(ids)] = 1
+        return input_ids, attention_mask
+
+    def scanpath_distribution(self, image_feature, tasks):
+        """
+        Action probabilities ``[N, T, A]`` and log-normal duration parameters ``[N, T]`` of ``N`` images.
+        """
+        input_ids, attention_mask = self.tokenize(tasks)
+        if self.session is not None:
+            outputs = self.session.run(None, {
+                "image_feature": image_feature.detach().cpu().float().numpy(),
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+            })
+            return [torch.from_numpy(_).to(self.device) for _ in outputs]
+        with torch.no_grad():
+            return self.graph(image_feature.to(self.device), torch.from_numpy(input_ids).to(self.device),
+                              torch.from_numpy(attention_mask).to(self.device))
+
+    def predict(self, image_feature, tasks, sample_num=1):
+        """
+        Sample ``sample_num`` scanpaths for every image feature ``[N, H * W, C]`` and task of ``tasks``.
+
+        Returns the ``[N, R, T, 3]`` scanpaths (x, y, duration in ms, -1 after the end), the action and duration
+        masks and the sampling prediction of :meth:`Sampling.random_sample`.
+        """
+        all_actions_prob, log_normal_mu, log_normal_sigma2 = self.scanpath_distribution(image_feature, tasks)
+        prediction = {
+            "all_actions_prob": all_actions_prob,
+            "log_normal_mu": log_normal_mu,
+            "log_normal_sigma2": log_normal_sigma2,
+        }
+        sampling_prediction = self.sampling.random_sample(prediction, sample_num)
+        scanpath_prediction, action_masks, duration_masks = self.sampling.generate_scanpath(
+            all_actions_prob, sampling_prediction)
+        return scanpath_prediction, action_masks, duration_masks, sampling_prediction
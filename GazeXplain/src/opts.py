@@ -7,14 +7,39 @@ def parse_opt():
     parser.add_argument('--dataset_dir', default="dataset/", help='feature folder')
     parser.add_argument('--datasets', default=["COCO-TP"], nargs='+', help='used dataset')
     parser.add_argument('--tiny', default=False, action="store_true", help='use the tiny dataset in debug')
+    parser.add_argument('--feature_store', default=False, action="store_true",
+                        help='load image features from the packed memory-mapped store')
+    parser.add_argument('--fixation_table', default=False, action="store_true",
+                        help='load the scanpaths from the columnar table written by ingest_fixations.py')
+    parser.add_argument('--compiled_targets', default=False, action="store_true",
+                        help='load the training targets precomputed by compile_targets.py')
+    parser.add_argument('--sparse_target', default=False, action="store_true",
+                        help='ship the target scanpath as action indices instead of dense one-hot maps')
 
     parser.add_argument("--batch", type=int, default=8, help="Batch size")
+
+    # input pipeline
+    parser.add_argument("--num_workers", type=int, default=0, help="Number of DataLoader worker processes")
+    parser.add_argument("--pin_memory", action="store_true", help="Collate the batches into pinned memory")
+    parser.add_argument("--persistent_workers", action="store_true",
+                        help="Keep the DataLoader workers alive between epochs")
+    parser.add_argument("--prefetch_factor", type=int, default=2, help="Number of batches prefetched by each worker")
+    parser.add_argument("--non_blocking", action="store_true",
+                        help="Copy the batches to the device asynchronously, use together with --pin_memory")
+    parser.add_argument("--sharing_strategy", type=str, default="file_descriptor",
+                        choices=["file_descriptor", "file_system"],
+                        help="How DataLoader workers share tensors with the main process")
+    parser.add_argument("--eval_workers", type=int, default=0,
+                        help="Number of worker processes scoring the predicted scanpaths, 0 scores them in the "
+                             "main process")
     parser.add_argument("--test_batch", type=int, default=16, help="Batch size")
     parser.add_argument("--epochs", type=int, default=12, help="Number of epochs")
     parser.add_argument("--pct_start", type=float, default=0.05, help="The percentage of the cycle "
                                                                      "(in number of steps) spent"
                                                                      "increasing the learning rate.")
     parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--sample_seed", type=int, default=None,
+                        help="If passed, the r-th scanpath sample is drawn from a generator seeded with sample_seed + r")
     parser.add_argument("--lr", type=float, default=1e-4, help="Learning rate")
     parser.add_argument("--weight_decay", type=float, default=5e-5, help="Weight decay")
     parser.add_argument("--resume_dir", type=str, default="", help="Resume from a specific directory")
@@ -51,6 +76,13 @@ def parse_opt():
                         help="Normalize before in transformer")
     parser.add_argument("--return_intermediate_dec", action="store_true",
                         help="Return the intermediate data from decoder")
+    parser.add_argument("--attention_backend", default="multihead", type=str, choices=["multihead", "sdpa"],
+                        help="Attention of the scanpath transformer, nn.MultiheadAttention or the fused "
+                             "F.scaled_dot_product_attention with the same parameters")
+    parser.add_argument("--quantize_int8", action="store_true",
+                        help="Evaluate on the CPU with dynamically quantized int8 Linear layers")
+    parser.add_argument("--quantization_report", action="store_true",
+                        help="With --quantize_int8, also evaluate the float model and report the metrics of both")
 
     # accelerate settings
     parser.add_argument(
@@ -89,6 +121,15 @@ def parse_opt():
     parser.add_argument("--explanation", action="store_true", help="Use explanation module")
     parser.add_argument("--max_generation_length",  type=int, default=20, help="Max length when generate the explanation")
     parser.add_argument("--num_explanation_beams", type=int, default=3, help="Number of beam in explanation")
+    parser.add_argument("--compact_explanations", action="store_true",
+                        help="Only run the explanation slots of real fixations through BLIP, the language-model "
+                             "loss is then averaged over the real explanations only")
+    parser.add_argument("--encoder_cache_mb", type=int, default=0,
+                        help="Size in MB of the inference cache of encoded images, 0 disables the cache")
+    parser.add_argument("--group_by_image", action="store_true",
+                        help="Evaluate the scanpaths image by image so that they share the encoded images")
+    parser.add_argument("--task_embedding_cache", action="store_true",
+                        help="Look up the RoBERTa embeddings of the task descriptions during inference")
 
 
 
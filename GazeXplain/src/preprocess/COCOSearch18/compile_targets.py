@@ -0,0 +1,19 @@
+import sys
+from os.path import join, dirname, abspath
+
+sys.path.append(join(dirname(abspath(__file__)), "..", ".."))
+
+from opts import parse_opt
+from lib.dataset.dataset import UnifiedScanpath
+from lib.dataset.compiled_targets import compile_targets
+
+
+if __name__ == "__main__":
+    # accepts the same options as the training script, e.g. --dataset_dir, --max_length and --blur_sigma
+    opt = parse_opt()
+    opt.compiled_targets = False
+    for split in ["train", "validation", "test"]:
+        dataset = UnifiedScanpath(split=split, opt=opt)
+        save_path = dataset.compiled_targets_path()
+        compile_targets(dataset.fixations, opt, save_path)
+        print("Compiled the targets of {} {} scanpaths into {}".format(len(dataset), split, save_path))
@@ -0,0 +1,24 @@
+import sys
+from os.path import join, dirname, abspath
+
+sys.path.append(join(dirname(abspath(__file__)), "..", ".."))
+
+from opts import parse_opt
+from lib.dataset.dataset import UnifiedScanpath
+from lib.dataset.fixation_table import write_fixation_table
+
+
+if __name__ == "__main__":
+    # accepts the same options as the training script, e.g. --dataset_dir and --max_explanation_length
+    opt = parse_opt()
+    opt.fixation_table = False
+    opt.tiny = False
+    meta = {
+        "max_explanation_length": opt.max_explanation_length,
+        "min_explanation_length": opt.min_explanation_length,
+    }
+    for split in ["train", "validation", "test"]:
+        dataset = UnifiedScanpath(split=split, opt=opt)
+        table_dir = dataset.fixation_table_path()
+        write_fixation_table(dataset.fixations, table_dir, meta, dataset.explanation_gts)
+        print("Ingested {} {} scanpaths into {}".format(len(dataset), split, table_dir))
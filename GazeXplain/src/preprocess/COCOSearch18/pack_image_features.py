@@ -0,0 +1,20 @@
+import os
+import sys
+import argparse
+from os.path import join, dirname, abspath
+
+sys.path.append(join(dirname(abspath(__file__)), "..", ".."))
+
+from lib.dataset.feature_store import pack_image_features
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser('Pack the extracted image features into a memory-mapped store', add_help=False)
+    parser.add_argument('--feature_dir', default='dataset/COCO/image_features', type=str)
+    parser.add_argument('--store_dir', default=None, type=str,
+                        help='defaults to <feature_dir>_packed, which is where UnifiedScanpath looks for it')
+    args = parser.parse_args()
+    feature_dir = args.feature_dir.rstrip(os.sep)
+    store_dir = args.store_dir if args.store_dir is not None else feature_dir + "_packed"
+    num_images = pack_image_features(feature_dir, store_dir)
+    print("Packed {} image features into {}".format(num_images, store_dir))
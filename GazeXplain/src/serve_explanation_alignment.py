@@ -0,0 +1,98 @@
+import torch
+
+import numpy as np
+
+import os
+import argparse
+import json
+import copy
+
+from accelerate import Accelerator
+
+from lib.models.models import Transformer
+from lib.models.gazeformer_explanation_alignment import gazeformer
+from lib.models.quantization import quantize_dynamic_int8
+from lib.runtime.inference_server import ExplanationService, InferenceServer
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+parser = argparse.ArgumentParser(description="Scanpath and explanation inference server")
+parser.add_argument('--model_dir', default='./runs/ALL_runX_baseline',
+                    help='run folder with the hparams.json and the checkpoints/ckpt_best of the model')
+parser.add_argument('--host', default="127.0.0.1", help='address the server listens on')
+parser.add_argument("--port", type=int, default=8000, help="Port the server listens on")
+parser.add_argument("--max_batch_size", type=int, default=16, help="Maximal number of requests in a batch")
+parser.add_argument("--max_wait_ms", type=float, default=10.,
+                    help="Maximal time a request waits for more requests to share its batch")
+parser.add_argument("--sample_num", type=int, default=1, help="Number of scanpaths sampled per request")
+parser.add_argument('--dataset_dir', default="/home/", help='feature folder, the image paths of the requests are relative to it')
+parser.add_argument('--feature_store', action="store_true", help='load image features from the packed memory-mapped store')
+parser.add_argument("--seed", type=int, default=0, help="Random seed")
+parser.add_argument("--sample_seed", type=int, default=None,
+                    help="If passed, the r-th scanpath sample is drawn from a generator seeded with sample_seed + r")
+parser.add_argument("--compact_explanations", action="store_true",
+                    help="Only generate explanations for the fixations of the sampled scanpaths")
+parser.add_argument("--encoder_cache_mb", type=int, default=0,
+                    help="Size in MB of the inference cache of encoded images, 0 disables the cache")
+parser.add_argument("--task_embedding_cache", action="store_true",
+                    help="Look up the RoBERTa embeddings of the task descriptions during inference")
+parser.add_argument("--attention_backend", default="multihead", type=str, choices=["multihead", "sdpa"],
+                    help="Attention of the scanpath transformer, nn.MultiheadAttention or the fused "
+                         "F.scaled_dot_product_attention with the same parameters")
+parser.add_argument("--quantize_int8", action="store_true",
+                    help="Serve on the CPU with dynamically quantized int8 Linear layers")
+parser.add_argument("--cpu", action="store_true", help="If passed, will serve on the CPU.")
+args = parser.parse_args()
+
+np.random.seed(args.seed)
+torch.manual_seed(args.seed)
+
+
+def main():
+    accelerator = Accelerator(cpu=args.cpu or args.quantize_int8)
+
+    # update the argument
+    opt = copy.deepcopy(args)
+    hparams_file = os.path.join(args.model_dir, "hparams.json")
+    # read hparams
+    with open(hparams_file, "r") as f:
+        hparams = json.load(f)
+    for k, v in hparams.items():
+        if not hasattr(opt, k):
+            accelerator.print('Warning: key %s not in args' % k)
+        setattr(opt, k, v)
+
+    opt.dataset_dir = args.dataset_dir
+    opt.feature_store = args.feature_store
+    opt.sample_seed = args.sample_seed
+    opt.compact_explanations = args.compact_explanations
+    opt.encoder_cache_mb = args.encoder_cache_mb
+    opt.task_embedding_cache = args.task_embedding_cache
+    opt.attention_backend = args.attention_backend
+
+    transformer = Transformer(args=opt)
+    model = gazeformer(transformer=transformer, args=opt)
+    model = accelerator.prepare(model)
+
+    model_path = os.path.join(args.model_dir, "checkpoints/ckpt_best")
+    accelerator.print(f"Load from best checkpoint: {model_path}")
+    accelerator.load_state(model_path, strict=False)
+    model = accelerator.unwrap_model(model).eval()
+    if args.quantize_int8:
+        quantize_dynamic_int8(model)
+
+    service = ExplanationService(model, opt, accelerator.device, sample_num=args.sample_num,
+                                 feature_root=args.dataset_dir)
+    server = InferenceServer(service, (args.host, args.port), max_batch_size=args.max_batch_size,
+                             max_wait_ms=args.max_wait_ms)
+    accelerator.print("Serving on http://{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        accelerator.print(json.dumps(server.batcher.stats.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
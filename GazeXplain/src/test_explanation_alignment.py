@@ -24,7 +24,36 @@ parser.add_argument('--dataset_dir', default="/home/", help='feature folder')
 parser.add_argument('--datasets', default=["AiR-D", "OSIE", "COCO-TP", "COCO-TA"], nargs='+', help='used dataset')
 parser.add_argument("--eval_repeat_num", type=int, default=1, help="Repeat number for evaluation")
 parser.add_argument('--tiny', action="store_true", help='use the tiny dataset in debug')
+parser.add_argument('--feature_store', action="store_true", help='load image features from the packed memory-mapped store')
+parser.add_argument('--fixation_table', action="store_true", help='load the scanpaths from the columnar table written by ingest_fixations.py')
+parser.add_argument('--compiled_targets', action="store_true", help='load the training targets precomputed by compile_targets.py')
+parser.add_argument('--sparse_target', action="store_true", help='ship the target scanpath as action indices instead of dense one-hot maps')
+parser.add_argument("--num_workers", type=int, default=4, help="Number of DataLoader worker processes")
+parser.add_argument("--pin_memory", action="store_true", help="Collate the batches into pinned memory")
+parser.add_argument("--eval_workers", type=int, default=0,
+                    help="Number of worker processes scoring the predicted scanpaths, 0 scores them in the main process")
+parser.add_argument("--persistent_workers", action="store_true", help="Keep the DataLoader workers alive between epochs")
+parser.add_argument("--prefetch_factor", type=int, default=2, help="Number of batches prefetched by each worker")
+parser.add_argument("--sharing_strategy", type=str, default="file_descriptor", choices=["file_descriptor", "file_system"],
+                    help="How DataLoader workers share tensors with the main process")
 parser.add_argument("--seed", type=int, default=0, help="Random seed")
+parser.add_argument("--sample_seed", type=int, default=None,
+                    help="If passed, the r-th scanpath sample is drawn from a generator seeded with sample_seed + r")
+parser.add_argument("--compact_explanations", action="store_true",
+                    help="Only generate explanations for the fixations of the sampled scanpaths")
+parser.add_argument("--encoder_cache_mb", type=int, default=0,
+                    help="Size in MB of the inference cache of encoded images, 0 disables the cache")
+parser.add_argument("--group_by_image", action="store_true",
+                    help="Evaluate the scanpaths image by image so that they share the encoded images")
+parser.add_argument("--task_embedding_cache", action="store_true",
+                    help="Look up the RoBERTa embeddings of the task descriptions during inference")
+parser.add_argument("--attention_backend", default="multihead", type=str, choices=["multihead", "sdpa"],
+                    help="Attention of the scanpath transformer, nn.MultiheadAttention or the fused "
+                         "F.scaled_dot_product_attention with the same parameters")
+parser.add_argument("--quantize_int8", action="store_true",
+                    help="Evaluate on the CPU with dynamically quantized int8 Linear layers")
+parser.add_argument("--quantization_report", action="store_true",
+                    help="With --quantize_int8, also evaluate the float model and report the metrics of both")
 parser.add_argument("--fp16", action="store_true", help="If passed, will use FP16 training.")
 parser.add_argument(
     "--mixed_precision", type=str, default=None, choices=["no", "fp16", "bf16", "fp8"],
@@ -71,6 +100,24 @@ def main():
         opt.eval_repeat_num = args.eval_repeat_num
         opt.tiny = args.tiny
         opt.dataset_dir = args.dataset_dir
+        opt.feature_store = args.feature_store
+        opt.fixation_table = args.fixation_table
+        opt.sample_seed = args.sample_seed
+        opt.compact_explanations = args.compact_explanations
+        opt.encoder_cache_mb = args.encoder_cache_mb
+        opt.group_by_image = args.group_by_image
+        opt.task_embedding_cache = args.task_embedding_cache
+        opt.attention_backend = args.attention_backend
+        opt.quantize_int8 = args.quantize_int8
+        opt.quantization_report = args.quantization_report
+        opt.compiled_targets = args.compiled_targets
+        opt.sparse_target = args.sparse_target
+        opt.num_workers = args.num_workers
+        opt.pin_memory = args.pin_memory
+        opt.eval_workers = args.eval_workers
+        opt.persistent_workers = args.persistent_workers
+        opt.prefetch_factor = args.prefetch_factor
+        opt.sharing_strategy = args.sharing_strategy
 
 
         model_path = os.path.join(base, "checkpoints/ckpt_best")
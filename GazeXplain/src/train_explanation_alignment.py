@@ -3,7 +3,6 @@ import multiprocessing
 
 import torch
 from torch.optim.lr_scheduler import OneCycleLR
-from torch.utils.data import DataLoader
 
 import os
 import json
@@ -19,8 +18,9 @@ from accelerate import DistributedDataParallelKwargs
 from transformers import AutoTokenizer, BertTokenizerFast
 
 from lib.dataset.dataset import UnifiedScanpath
+from lib.dataset.dataloader import build_dataloader, move_to_device, StepTimer
 from lib.evaluation.pycocoevalcap.tokenizer.ptbtokenizer import PTBTokenizer
-from lib.models.loss import CrossEntropyLoss, MLPLogNormalDistribution, LogAction, LogDuration, AlignmentLoss
+from lib.models.loss import CrossEntropyLoss, CrossEntropyIndexLoss, MLPLogNormalDistribution, LogAction, LogDuration, AlignmentLoss
 from lib.scst.cider.cider import Cider
 from lib.scst.ciderR.ciderR import CiderR
 from lib.scst.tokenizer import tokenizer
@@ -132,25 +132,9 @@ def main():
     eval_dataset = UnifiedScanpath(split="validation", opt=args)
 
     # Instantiate dataloaders.
-    train_all_dataloader = DataLoader(
-        dataset=train_dataset,
-        batch_size=args.batch,
-        shuffle=True,
-        collate_fn=train_dataset.collate_func
-    )
-    train_rl_dataloader = DataLoader(
-        dataset=train_dataset,
-        batch_size=args.batch // 2,
-        shuffle=True,
-        collate_fn=train_dataset.collate_func
-    )
-    eval_dataloader = DataLoader(
-        dataset=eval_dataset,
-        batch_size=args.test_batch,
-        shuffle=False,
-        collate_fn=eval_dataset.collate_func,
-        drop_last=False
-    )
+    train_all_dataloader = build_dataloader(train_dataset, args, batch_size=args.batch, shuffle=True)
+    train_rl_dataloader = build_dataloader(train_dataset, args, batch_size=args.batch // 2, shuffle=True)
+    eval_dataloader = build_dataloader(eval_dataset, args, batch_size=args.test_batch, shuffle=False, drop_last=False)
 
 
     # Instantiate the model (we build the model here so that the seed also control new weights initialization)
@@ -213,11 +197,19 @@ def main():
     # Prepare everything
     # There is no specific order to remember, we just need to unpack the objects in the same order we gave them to the
     # prepare method.
+    # with non-blocking transfer the batches are moved by move_to_device instead of the prepared dataloaders
+    device_placement = [True, True, not args.non_blocking, not args.non_blocking, not args.non_blocking, True]
     model, optimizer, train_all_dataloader, train_rl_dataloader, eval_dataloader, lr_scheduler = accelerator.prepare(
-        model, optimizer, train_all_dataloader, train_rl_dataloader, eval_dataloader, lr_scheduler
+        model, optimizer, train_all_dataloader, train_rl_dataloader, eval_dataloader, lr_scheduler,
+        device_placement=device_placement
     )
 
 
+    # the blurred targets of the sparse target mode are looked up on the device
+    blur_table = None
+    if args.sparse_target and train_dataset.blur_table is not None:
+        blur_table = torch.from_numpy(train_dataset.blur_table).to(accelerator.device)
+
     # Initialize the Evaluator
     evaluator = Evaluator(args)
 
@@ -250,16 +242,22 @@ def main():
         # traditional training stage
         train_dataloader = train_all_dataloader
 
+        step_timer = StepTimer()
         if epoch < args.start_rl_epoch:
             model.train()
             with tqdm(total=len(train_dataloader)) as pbar:
                 for i_batch, batch in enumerate(train_dataloader):
-                    batch = {k: v.to(accelerator.device) if not isinstance(v, list) else v for k, v in batch.items()}
+                    batch = move_to_device(batch, accelerator.device, args.non_blocking)
+                    step_timer.data_ready()
 
                     prediction = model(batch)
 
 
-                    loss_actions = CrossEntropyLoss(prediction["actions"], batch["target_scanpath"], batch["action_mask"])
+                    if args.sparse_target:
+                        loss_actions = CrossEntropyIndexLoss(prediction["actions"], batch["target_action"],
+                                                             batch["action_mask"], blur_table)
+                    else:
+                        loss_actions = CrossEntropyLoss(prediction["actions"], batch["target_scanpath"], batch["action_mask"])
                     loss_duration = MLPLogNormalDistribution(prediction["log_normal_mu"], prediction["log_normal_sigma2"],
                                                              batch["duration"], batch["duration_mask"])
                     loss_lm = prediction["dec_outputs"].loss
@@ -276,6 +274,7 @@ def main():
                     lr_scheduler.step()
                     optimizer.zero_grad()
                     iteration += 1
+                    step_timer.step_done()
 
                     # Log loss and learning rate to tensorboard.
                     if args.with_tracking:
@@ -289,7 +288,9 @@ def main():
                                 "language_alignment_loss": language_alignment_loss.detach().float(),
                                 "multimodal_alignment_loss": multimodal_alignment_loss.detach().float(),
                                 "alignment_loss": alignment_loss.detach().float(),
-                                "learning_rate": optimizer.param_groups[0]["lr"]
+                                "learning_rate": optimizer.param_groups[0]["lr"],
+                                "data_time": step_timer.summary()["data_time"],
+                                "compute_time": step_timer.summary()["compute_time"]
                             },
                             step=iteration,
                         )
@@ -303,7 +304,8 @@ def main():
             with tqdm(total=len(train_rl_dataloader)) as pbar:
                 for i_batch, batch in enumerate(train_rl_dataloader):
                     # batch = {k: v.to(accelerator.device) if torch.is_tensor(v) else v for k, v in batch.items()}
-                    batch = {k: v.to(accelerator.device) if not isinstance(v, list) else v for k, v in batch.items()}
+                    batch = move_to_device(batch, accelerator.device, args.non_blocking)
+                    step_timer.data_ready()
 
                     metrics_reward_batch = []
                     neg_log_actions_batch = []
@@ -378,6 +380,7 @@ def main():
                     lr_scheduler.step()
                     optimizer.zero_grad()
                     iteration += 1
+                    step_timer.step_done()
 
                     # Log loss and learning rate to tensorboard.
                     if args.with_tracking:
@@ -391,13 +394,18 @@ def main():
                                 "language_alignment_loss": language_alignment_loss.detach().float(),
                                 "multimodal_alignment_loss": multimodal_alignment_loss.detach().float(),
                                 "alignment_loss": alignment_loss.detach().float(),
-                                "learning_rate": optimizer.param_groups[0]["lr"]
+                                "learning_rate": optimizer.param_groups[0]["lr"],
+                                "data_time": step_timer.summary()["data_time"],
+                                "compute_time": step_timer.summary()["compute_time"]
                             },
                             step=iteration,
                         )
 
                     pbar.update()
 
+        timing = step_timer.summary()
+        accelerator.print("Epoch {}: {:.4f}s data wait and {:.4f}s compute per step ({:.1%} waiting for data)".format(
+            epoch, timing["data_time"], timing["compute_time"], timing["data_wait_ratio"]))
 
         return iteration, loss.detach().item()
 
@@ -412,11 +420,11 @@ def main():
         all_generated_ids = []
         with tqdm(total=len(eval_dataloader)) as pbar:
             for i_batch, batch in enumerate(eval_dataloader):
-                batch = {k: v.to(accelerator.device) if not isinstance(v, list) else v for k, v in batch.items()}
+                batch = move_to_device(batch, accelerator.device, args.non_blocking)
 
                 with torch.no_grad():
                     prediction, scanpath_prediction, generated_ids, \
-                        sampling_prediction, action_masks, duration_masks = model(batch)
+                        sampling_prediction, action_masks, duration_masks = model(batch, mode="explanation")
 
                 # by default we repeat once for inference
                 scanpath_prediction = scanpath_prediction[:, 0]
@@ -766,47 +774,51 @@ def main():
         else:
             return None
     history = {'Train': [], 'Val': []}
-    for epoch in range(start_epoch + 1, args.epochs):
-        accelerator.print("-" * 50)
-        accelerator.print("Running the {epoch:2d}-th epoch...".format(epoch=epoch))
-
-        iteration, loss = train(iteration, epoch)
-        history['Train'].append(loss)
-        if (epoch < args.start_rl_epoch and (epoch + 1) % args.checkpoint_every == 0) or \
-                (epoch >= args.start_rl_epoch and (epoch + 1) % args.checkpoint_every_rl == 0):
-            accelerator.print("Evaluating the {epoch:2d}-th epoch...".format(epoch=epoch))
-
-            cur_metrics, loss_val = validation(iteration)
-            history['Val'].append(loss_val)
-            # save
-            if accelerator.is_main_process:
-                cur_metric = scipy.stats.hmean([cur_metrics["metrics/SM without Dur"], cur_metrics["metrics/SM with Dur"]])
-                checkpoint_manager.step(accelerator, float(cur_metric))
-                best_metric = checkpoint_manager.get_best_metric()
-                record_manager.save(epoch, iteration, best_metric)
-
-                # Log loss and learning rate to tensorboard.
-                if args.with_tracking:
-                    accelerator.log(
-                        {
-                            "metrics/cur_metric": cur_metric,
-                            "epoch": epoch
-                        },
-                        step=iteration,
-                    )
+    try:
+        for epoch in range(start_epoch + 1, args.epochs):
+            accelerator.print("-" * 50)
+            accelerator.print("Running the {epoch:2d}-th epoch...".format(epoch=epoch))
+
+            iteration, loss = train(iteration, epoch)
+            history['Train'].append(loss)
+            if (epoch < args.start_rl_epoch and (epoch + 1) % args.checkpoint_every == 0) or \
+                    (epoch >= args.start_rl_epoch and (epoch + 1) % args.checkpoint_every_rl == 0):
+                accelerator.print("Evaluating the {epoch:2d}-th epoch...".format(epoch=epoch))
+
+                cur_metrics, loss_val = validation(iteration)
+                history['Val'].append(loss_val)
+                # save
+                if accelerator.is_main_process:
+                    cur_metric = scipy.stats.hmean([cur_metrics["metrics/SM without Dur"], cur_metrics["metrics/SM with Dur"]])
+                    checkpoint_manager.step(accelerator, float(cur_metric))
+                    best_metric = checkpoint_manager.get_best_metric()
+                    record_manager.save(epoch, iteration, best_metric)
 
-        else:
-            # save current epoch
-            if accelerator.is_main_process:
-                checkpoint_manager.step(accelerator, float(np.nan))
-                best_metric = checkpoint_manager.get_best_metric()
-                record_manager.save(epoch, iteration, best_metric)
-
-        # check  whether to save the final supervised training file
-        if args.supervised_save and epoch == args.start_rl_epoch - 1:
-            # Serialize best performing checkpoint observed so far.
-            output_dir = os.path.join(checkpoints_dir, f"ckpt_supervised_end")
-            accelerator.save_state(output_dir)
+                    # Log loss and learning rate to tensorboard.
+                    if args.with_tracking:
+                        accelerator.log(
+                            {
+                                "metrics/cur_metric": cur_metric,
+                                "epoch": epoch
+                            },
+                            step=iteration,
+                        )
+
+            else:
+                # save current epoch
+                if accelerator.is_main_process:
+                    checkpoint_manager.step(accelerator, float(np.nan))
+                    best_metric = checkpoint_manager.get_best_metric()
+                    record_manager.save(epoch, iteration, best_metric)
+
+            # check  whether to save the final supervised training file
+            if args.supervised_save and epoch == args.start_rl_epoch - 1:
+                # Serialize best performing checkpoint observed so far.
+                output_dir = os.path.join(checkpoints_dir, f"ckpt_supervised_end")
+                accelerator.save_state(output_dir)
+    finally:
+        # stop the scoring workers of the validation
+        evaluator.close()
 
     if args.with_tracking:
         accelerator.end_training()